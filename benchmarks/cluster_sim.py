@@ -0,0 +1,278 @@
+'''Multi-process test of cluster mode against the fake Discord gateway and
+REST API (benchmarks.fake_discord). --clusters processes run the shards of
+ta_bot.cluster, like CLUSTERS does, and share one store; by default a new
+SQLite file, which every process migrates at the same time. In each of
+--guilds guilds, a TA sets up a mentor channel, two students join its queue,
+the TA invites the first one, who joins, and the other one leaves, all
+through interactions.
+
+The test fails unless every shard was identified once by the process it
+belongs to, every guild was sent to exactly one process, every interaction
+was answered once and by the process of its guild, and the store and the
+channel permissions hold the expected queues. Exits with status 1 on
+failures. Run from the project root:
+
+    python -m benchmarks.cluster_sim [--clusters N] [--shards N] [--guilds N]
+'''
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import discord
+import discord_slash.http
+
+from ta_bot.cluster import cluster_shard_ids, run_cluster
+from ta_bot.utils.storage import open_store
+
+from .fake_discord import FakeDiscord, shard_for_guild
+
+
+# seconds to wait for each answer of the bot
+ANSWER_TIMEOUT = 10
+# seconds the TA takes to type a channel description
+TYPING_DELAY = 1
+TA_ID = 3 * 10 ** 17
+STUDENT_IDS = (10 ** 17, 10 ** 17 + 1)
+
+
+def run_fake_cluster(url: str, cluster_id: int, clusters: int, shards: int):
+    '''Runs one cluster against the fake, in a new process.'''
+    logging.disable(logging.INFO)
+    discord.http.Route.BASE = f'{url}/api/v7'
+    discord_slash.http.CustomRoute.BASE = f'{url}/api/v8'
+    run_cluster(cluster_id, clusters, shards, f'cluster-{cluster_id}', '!',
+                sync_commands=False)
+
+
+def wait_for_message(fake: FakeDiscord, check):
+    '''Returns a future of the next message created or edited that passes
+    `check`.'''
+    future = asyncio.get_running_loop().create_future()
+
+    def listener(message: dict):
+        if not future.done() and check(message):
+            future.set_result(message)
+            fake.listeners.remove(listener)
+    fake.listeners.append(listener)
+    return future
+
+
+async def answer(send, *args, what: str):
+    '''Sends an interaction and returns the first message of its answer.'''
+    future = asyncio.get_running_loop().create_future()
+    send(*args, on_response=lambda message: future.done() or
+         future.set_result(message))
+    try:
+        return await asyncio.wait_for(future, ANSWER_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise AssertionError(f'no answer to {what}') from None
+
+
+def custom_ids(message: dict):
+    return [component.get('custom_id', '')
+            for row in message['components']
+            for component in row['components']]
+
+
+async def guild_scenario(fake: FakeDiscord, guild_id: int):
+    general_id = fake.general_ids[guild_id]
+    channel_id = fake.mentor_channels[guild_id][0]
+    first, second = STUDENT_IDS
+
+    menu = await answer(fake.slash, TA_ID, channel_id, 'setup',
+                        what='/mentor setup')
+    await answer(fake.click, TA_ID, menu, 'setup-update',
+                 what='the setup button')
+    updated = wait_for_message(
+        fake,
+        lambda message: (message['channel_id'] == str(channel_id) and
+                         any('is now a TA mentor channel' in
+                             embed.get('description', '')
+                             for embed in message['embeds']))
+    )
+    # the bot only waits for the description once its prompt was sent
+    await asyncio.sleep(TYPING_DELAY)
+    fake.say(TA_ID, channel_id, f'Guild {guild_id}')
+    try:
+        await asyncio.wait_for(updated, ANSWER_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise AssertionError('the channel was not set up') from None
+
+    for student_id in STUDENT_IDS:
+        menu = await answer(fake.slash, student_id, general_id, 'join',
+                            what='/mentor join')
+        await answer(fake.click, student_id, menu, 'join-select',
+                     [f'join-{channel_id}'], what='the join menu')
+
+    invite = await answer(fake.slash, TA_ID, channel_id, 'next',
+                          [{'name': 'count', 'type': 4, 'value': 1}],
+                          what='/mentor next')
+    button = f'next-join:{first}:{TA_ID}'
+    if button not in custom_ids(invite):
+        raise AssertionError(f'the first student was not invited: '
+                             f'{custom_ids(invite)}')
+    await answer(fake.click, first, invite, button, what='the invite')
+    await answer(fake.slash, second, general_id, 'leave',
+                 what='/mentor leave')
+
+
+async def settle(fake: FakeDiscord, timeout: float):
+    '''Waits until no REST call was made for a second.'''
+    deadline = time.perf_counter() + timeout
+    while (time.perf_counter() < deadline and
+           (fake.in_flight or time.perf_counter() - fake.last_call < 1)):
+        await asyncio.sleep(0.1)
+
+
+def check_gateway(fake: FakeDiscord, owners: dict):
+    '''Returns the failures of shard and guild assignment.'''
+    failures = []
+    identified = sorted((shard, token) for token, shard in fake.identifies)
+    expected = sorted(((shard, fake.shards), f'cluster-{cluster}')
+                      for shard, cluster in owners.items())
+    if identified != expected:
+        failures.append(f'shards identified as {identified}, expected '
+                        f'{expected}')
+    for guild_id in fake.guild_ids:
+        cluster = owners[shard_for_guild(guild_id, fake.shards)]
+        if fake.guild_sessions[guild_id] != [f'cluster-{cluster}']:
+            failures.append(f'guild {guild_id} was sent to '
+                            f'{fake.guild_sessions[guild_id]}, expected '
+                            f'cluster-{cluster}')
+    return failures
+
+
+def check_interactions(fake: FakeDiscord, owners: dict):
+    failures = []
+    for interaction in fake.interactions.values():
+        guild_id = int(fake.channels[interaction.channel_id]['guild_id'])
+        cluster = owners[shard_for_guild(guild_id, fake.shards)]
+        if interaction.missed:
+            failures.append(f'{interaction.label} in guild {guild_id} '
+                            'missed its deadline')
+        elif interaction.acked_by != f'Bot cluster-{cluster}':
+            failures.append(f'{interaction.label} in guild {guild_id} was '
+                            f'answered by {interaction.acked_by}, expected '
+                            f'cluster-{cluster}')
+    if fake.double_acks:
+        failures.append(f'{fake.double_acks} interactions were answered '
+                        'twice')
+    return failures
+
+
+def check_queues(fake: FakeDiscord, store_url: str):
+    failures = []
+    store = open_store(store_url)
+    try:
+        for guild_id in fake.guild_ids:
+            channel_id = fake.mentor_channels[guild_id][0]
+            channels = [channel for channel, _
+                        in store.get_mentor_channels(guild_id)]
+            users = store.get_users(guild_id, channel_id)
+            overwrites = [int(overwrite['id']) for overwrite
+                          in fake.channels[channel_id]
+                                          ['permission_overwrites']]
+            if channels != [channel_id]:
+                failures.append(f'guild {guild_id} has the mentor channels '
+                                f'{channels}')
+            if [list(ids) for ids in users] != [[STUDENT_IDS[0]], []]:
+                failures.append(f'guild {guild_id} has the active and '
+                                f'queued users {users}')
+            if overwrites != [STUDENT_IDS[0]]:
+                failures.append(f'guild {guild_id} has overwrites for '
+                                f'{overwrites}')
+    finally:
+        store.close()
+    return failures
+
+
+async def simulate(args, store_url: str):
+    shards = max(args.shards, args.clusters)
+    fake = await FakeDiscord.start(1, args.rest_latency,
+                                   guilds=args.guilds, shards=shards)
+    fake.add_member(TA_ID, 'ta', ta=True)
+    for n, student_id in enumerate(STUDENT_IDS):
+        fake.add_member(student_id, f'student{n}')
+    owners = {shard: cluster
+              for cluster in range(args.clusters)
+              for shard in cluster_shard_ids(cluster, args.clusters, shards)}
+
+    os.environ.update(MENTOR_STORE=store_url, METRICS_PORT='0')
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_fake_cluster,
+                        args=(fake.url, cluster, args.clusters, shards),
+                        name=f'cluster-{cluster}')
+        for cluster in range(args.clusters)
+    ]
+    for process in processes:
+        process.start()
+
+    failures = []
+    try:
+        print(f'Starting {args.clusters} clusters for {shards} shards and '
+              f'{args.guilds} guilds...')
+        # discord.py waits 5 seconds between the shards of a process
+        deadline = time.perf_counter() + 30 + 5 * shards
+        while (len(fake.identifies) < shards or
+               len(fake.guild_sessions) < len(fake.guild_ids)):
+            if time.perf_counter() > deadline:
+                break
+            await asyncio.sleep(0.1)
+        failures += check_gateway(fake, owners)
+        # the last guilds are only ready once no more of them arrive
+        await asyncio.sleep(3)
+
+        print('Running the queue scenario in every guild...')
+        results = await asyncio.gather(
+            *(guild_scenario(fake, guild_id)
+              for guild_id in fake.guild_ids),
+            return_exceptions=True
+        )
+        for guild_id, result in zip(fake.guild_ids, results):
+            if isinstance(result, Exception):
+                failures.append(f'guild {guild_id}: {result}')
+        await settle(fake, ANSWER_TIMEOUT)
+        failures += check_interactions(fake, owners)
+        failures += check_queues(fake, store_url)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(10)
+            if process.is_alive():
+                process.kill()
+        await fake.stop()
+
+    for failure in failures:
+        print(f'FAIL {failure}')
+    print(f'{len(fake.interactions)} interactions in {args.guilds} guilds, '
+          f'{len(failures)} failures')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clusters', type=int, default=2)
+    parser.add_argument('--shards', type=int, default=4)
+    parser.add_argument('--guilds', type=int, default=8)
+    parser.add_argument('--store',
+                        help='store shared by the clusters (default: a new '
+                             'SQLite file)')
+    parser.add_argument('--rest-latency', type=float, default=0.05,
+                        help='round trip of REST calls in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store_url = args.store or os.path.join(tmp, 'mentors.sqlite3')
+        failures = asyncio.run(simulate(args, store_url))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+'''Microbenchmarks for the MentorDbConn queue operations across queue sizes
+and guild counts. Every configuration runs against a fresh temporary SQLite
+file, and the results are printed (or written) as JSON with p50/p99
+latencies in microseconds, so runs can be compared for regressions.
+
+Run from the project root:
+
+    python -m benchmarks.db_operations [--sizes 10,1000] [--guilds 1,10]
+                                       [--samples N] [--output FILE]
+'''
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import tempfile
+import time
+
+from ta_bot.utils.database import MentorDbConn
+
+
+CHANNEL_ID = 1
+
+
+def percentile(samples: list[float], fraction: float):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def populate(db: MentorDbConn, guilds: int, size: int):
+    with db.transaction():
+        db.conn.executemany('''
+            INSERT INTO mentor_channels (guild_id, channel_id, description)
+            VALUES (?, ?, '');
+        ''', [(guild_id, CHANNEL_ID) for guild_id in range(guilds)])
+        db.conn.executemany('''
+            INSERT INTO mentor_users
+                (guild_id, user_id, channel_id, queued_time, is_active)
+            VALUES (?, ?, ?, ?, ?);
+        ''', [(guild_id, user_id, CHANNEL_ID, user_id, int(user_id < 2))
+              for guild_id in range(guilds)
+              for user_id in range(size)])
+    db.conn.execute('ANALYZE;')
+
+
+def measure(call, args_list: list[tuple]):
+    timings = []
+    for args in args_list:
+        start = time.perf_counter()
+        call(*args)
+        timings.append((time.perf_counter() - start) * 1e6)
+    return timings
+
+
+def bench_config(path: str, guilds: int, size: int, samples: int):
+    db = MentorDbConn(path)
+    populate(db, guilds, size)
+
+    def random_user():
+        return random.randrange(guilds), random.randrange(2, size)
+
+    users = [random_user() for _ in range(samples)]
+    new_users = [(random.randrange(guilds), size + i, CHANNEL_ID)
+                 for i in range(samples)]
+    channels = [(random.randrange(guilds), CHANNEL_ID)
+                for _ in range(samples)]
+
+    results = {
+        'add_user': measure(db.add_user, new_users),
+        'get_user_info': measure(db.get_user_info,
+                                 [(*user, True) for user in users]),
+        'get_next_user': measure(db.get_next_user, channels),
+        'skip_user': measure(db.skip_user, users),
+        'get_users': measure(db.get_users, channels),
+        # destructive, so each guild's channel is deleted once
+        'delete_mentor_channel': measure(
+            db.delete_mentor_channel,
+            [(guild_id, CHANNEL_ID) for guild_id in range(guilds)]
+        ),
+    }
+    db.conn.close()
+
+    return [{
+        'op': op,
+        'guilds': guilds,
+        'queue_size': size,
+        'samples': len(timings),
+        'p50_us': round(percentile(timings, 0.50), 2),
+        'p99_us': round(percentile(timings, 0.99), 2),
+        'mean_us': round(sum(timings) / len(timings), 2),
+    } for op, timings in results.items()]
+
+
+def main(sizes: list[int], guild_counts: list[int], samples: int,
+         seed: int):
+    random.seed(seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for guilds in guild_counts:
+            for size in sizes:
+                path = os.path.join(tmpdir, f'{guilds}-{size}.sqlite3')
+                results += bench_config(path, guilds, size, samples)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'samples': samples,
+            'seed': seed,
+            'timestamp': int(time.time()),
+        },
+        'results': results,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000',
+                        help='comma-separated queue sizes per channel')
+    parser.add_argument('--guilds', default='1,10',
+                        help='comma-separated guild counts')
+    parser.add_argument('--samples', type=int, default=200,
+                        help='measurements per operation')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write JSON here instead of stdout')
+    args = parser.parse_args()
+
+    report = main([int(size) for size in args.sizes.split(',')],
+                  [int(count) for count in args.guilds.split(',')],
+                  args.samples,
+                  args.seed)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,80 @@
+'''Measures how long the event loop is stalled while the mentor database is
+being written to, using MentorDbConn directly on the loop versus through
+AsyncMentorDbConn.
+
+Run from the project root:
+
+    python -m benchmarks.event_loop_stall [--ops N]
+'''
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from ta_bot.utils.database import AsyncMentorDbConn, MentorDbConn
+
+
+TICK = 0.001
+
+
+async def measure_lag(stop: asyncio.Event, samples: list[float]):
+    '''Sleeps for TICK seconds in a loop, recording how late each wakeup is.'''
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(TICK)
+        samples.append(max(0.0, loop.time() - start - TICK))
+
+
+async def workload_sync(db: MentorDbConn, ops: int):
+    for user_id in range(ops):
+        db.add_user(1, user_id, 1)
+        db.get_user_info(1, user_id, True)
+        db.delete_user(1, user_id)
+        await asyncio.sleep(0)
+
+
+async def workload_async(db: AsyncMentorDbConn, ops: int):
+    for user_id in range(ops):
+        await db.add_user(1, user_id, 1)
+        await db.get_user_info(1, user_id, True)
+        await db.delete_user(1, user_id)
+
+
+async def run(name: str, workload, db, ops: int):
+    stop, samples = asyncio.Event(), []
+    ticker = asyncio.create_task(measure_lag(stop, samples))
+    start = time.perf_counter()
+    await workload(db, ops)
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await ticker
+
+    samples.sort()
+    p99 = samples[int(len(samples) * 0.99)] if samples else 0.0
+    print(f'{name:<8} wall {elapsed * 1000:9.1f} ms  '
+          f'stall max {max(samples, default=0) * 1000:7.2f} ms  '
+          f'p99 {p99 * 1000:7.2f} ms  '
+          f'mean {statistics.fmean(samples or [0]) * 1000:7.3f} ms  '
+          f'ticks {len(samples)}')
+
+
+async def main(ops: int):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sync_db = MentorDbConn(os.path.join(tmpdir, 'sync.sqlite3'))
+        await run('sync', workload_sync, sync_db, ops)
+        sync_db.conn.close()
+
+        async_db = AsyncMentorDbConn(os.path.join(tmpdir, 'async.sqlite3'))
+        await run('async', workload_async, async_db, ops)
+        async_db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=500,
+                        help='number of join/query/leave cycles')
+    args = parser.parse_args()
+    asyncio.run(main(args.ops))
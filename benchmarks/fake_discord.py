@@ -0,0 +1,741 @@
+'''A local stand-in for the parts of the Discord gateway and REST API that
+discord.py and discord_slash use, for load tests of the bot.
+
+The fake serves one or more guilds, each with one general channel and some
+mentor channels, to any number of gateway connections. Like on Discord, a
+connection only receives the events of the guilds of the shard it
+identified as. Interactions are dispatched over the gateway like Discord
+does, and every REST call is counted, delayed by a simulated round trip
+and, like the real API, rate limited. It is used by benchmarks.load_sim and
+benchmarks.cluster_sim; the bot is pointed at it by setting the base URL of
+discord.py's and discord_slash's routes to `api_url`.
+'''
+import asyncio
+import collections
+import datetime
+import itertools
+import json
+import re
+import secrets
+import socket
+import time
+
+from aiohttp import web
+
+
+DISCORD_EPOCH = 1420070400000
+# interactions that are not acknowledged in time fail on the client
+ACK_DEADLINE = 3.0
+EPHEMERAL = 64
+# approximations of the per-route limits of the real API, as (requests,
+# seconds) per channel or guild; interaction responses are not limited
+RATE_LIMITS = {
+    ('POST', '/channels/{channel_id}/messages'): (5, 5.0),
+    ('PATCH', '/channels/{channel_id}/messages/{message_id}'): (5, 5.0),
+    ('PATCH', '/channels/{channel_id}'): (10, 10.0),
+    ('PUT', '/channels/{channel_id}/permissions/{target_id}'): (10, 10.0),
+    ('DELETE', '/channels/{channel_id}/permissions/{target_id}'): (10, 10.0),
+    ('GET', '/guilds/{guild_id}/members/{user_id}'): (10, 10.0),
+}
+VIEW_AND_SEND = 0x400 | 0x800
+MANAGE_CHANNELS = 0x10
+
+
+_snowflakes = itertools.count()
+
+
+def snowflake(ms: int=None):
+    if ms is None:
+        ms = int(time.time() * 1000) - DISCORD_EPOCH
+    return (ms << 22) | (next(_snowflakes) & 0x3fffff)
+
+
+def shard_for_guild(guild_id: int, shard_count: int):
+    return (guild_id >> 22) % shard_count
+
+
+def iso_now():
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+def json_response(data, status: int=200):
+    # discord.py only decodes the exact content type, without a charset
+    return web.Response(body=json.dumps(data).encode(),
+                        status=status,
+                        content_type='application/json')
+
+
+def overwrite_json(overwrite: dict):
+    '''Converts an overwrite as sent by discord.py to the gateway format.'''
+    allow, deny = int(overwrite.get('allow', 0)), int(overwrite.get('deny', 0))
+    return {
+        'id': str(overwrite['id']),
+        'type': 'role' if overwrite.get('type') in ('role', 0) else 'member',
+        'allow': allow,
+        'deny': deny,
+        'allow_new': str(allow),
+        'deny_new': str(deny)
+    }
+
+
+class Interaction:
+    '''An interaction dispatched to the bot, and when it was answered. Times
+    are time.perf_counter() values.'''
+
+    def __init__(self, label: str, user_id: int, channel_id: int,
+                 message_id: int=None, on_response=None):
+        self.id = snowflake()
+        self.token = secrets.token_urlsafe(24)
+        self.label = label
+        self.user_id = user_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.on_response = on_response
+        self.sent = time.perf_counter()
+        self.ack = None
+        self.ack_type = None
+        self.acked_by = None
+        self.responded = None
+        self.original = None
+
+    @property
+    def missed(self):
+        return self.ack is None or self.ack - self.sent > ACK_DEADLINE
+
+
+class Session:
+    '''A gateway connection, and the shard it identified as.'''
+
+    def __init__(self, ws: web.WebSocketResponse):
+        self.ws = ws
+        self.token = None
+        self.shard = (0, 1)
+        self.outbox = asyncio.Queue()
+        self.sequence = 0
+
+    def receives(self, guild_id: int):
+        shard_id, shard_count = self.shard
+        return shard_for_guild(guild_id, shard_count) == shard_id
+
+
+class RateLimiter:
+    '''Fixed-window rate limits per route and major parameter, reported
+    with the same headers as the real API.'''
+
+    def __init__(self, limits: dict):
+        self.limits = limits
+        # (method, route, major) -> [window end, remaining]
+        self.windows = {}
+
+    def acquire(self, method: str, route: str, major: str):
+        '''Returns (allowed, headers) for a request.'''
+        if not (limit := self.limits.get((method, route))):
+            return True, {}
+        count, per = limit
+        now = time.time()
+        window = self.windows.get((method, route, major))
+        if not window or window[0] <= now:
+            window = self.windows[method, route, major] = [now + per, count]
+        allowed = window[1] > 0
+        if allowed:
+            window[1] -= 1
+        reset_after = window[0] - now
+        headers = {
+            'X-RateLimit-Limit': str(count),
+            'X-RateLimit-Remaining': str(window[1]),
+            'X-RateLimit-Reset': f'{window[0]:.3f}',
+            'X-RateLimit-Reset-After': f'{reset_after:.3f}',
+            'X-RateLimit-Bucket': f'{method}:{route}',
+        }
+        if not allowed:
+            # discord.py treats 429s without Via as Cloudflare bans
+            headers.update({'Retry-After': str(max(1, round(reset_after))),
+                            'Via': '1.1 google'})
+        return allowed, headers
+
+
+class FakeDiscord:
+    '''The fake gateway and REST API. Create it with `start` on the loop it
+    should run on; every method must be called on that loop.'''
+
+    def __init__(self,
+                 mentor_channels: int,
+                 rest_latency: float=0.05,
+                 rate_limits: bool=True,
+                 guilds: int=1,
+                 shards: int=1):
+        self.rest_latency = rest_latency
+        self.limiter = RateLimiter(RATE_LIMITS if rate_limits else {})
+        self.shards = shards
+        # guild n is received by shard n % shards
+        ms = (snowflake() >> 22) // shards * shards
+        self.guild_ids = [snowflake(ms + n) for n in range(guilds)]
+        self.owner_id = snowflake()
+        self.ta_role_id = snowflake()
+        self.command_id = snowflake()
+        self.bot_user = self.user_json(snowflake(), 'ta-bot', bot=True)
+        self.bot_id = int(self.bot_user['id'])
+        self.general_ids = {guild_id: snowflake()
+                            for guild_id in self.guild_ids}
+        self.mentor_channels = {
+            guild_id: [snowflake() for _ in range(mentor_channels)]
+            for guild_id in self.guild_ids
+        }
+        # the first guild, which single-guild tests use
+        self.guild_id = self.guild_ids[0]
+        self.general_id = self.general_ids[self.guild_id]
+        self.mentor_channel_ids = self.mentor_channels[self.guild_id]
+        self.channels = {
+            channel_id: {
+                'id': str(channel_id),
+                'type': 0,
+                'guild_id': str(guild_id),
+                'name': 'general' if index == 0 else f'mentor-{index}',
+                'position': index,
+                'topic': None,
+                'nsfw': False,
+                'parent_id': None,
+                'last_message_id': None,
+                'rate_limit_per_user': 0,
+                'permission_overwrites': []
+            }
+            for guild_id in self.guild_ids
+            for index, channel_id in enumerate([
+                self.general_ids[guild_id],
+                *self.mentor_channels[guild_id]
+            ])
+        }
+        # user ID -> member payload
+        self.members = {}
+        self.messages = {}
+        # interaction ID -> Interaction
+        self.interactions = {}
+        self.tokens = {}
+        # called with every message that is created or edited
+        self.listeners = []
+        self.rest_calls = collections.Counter()
+        self.rate_limited = collections.Counter()
+        self.dispatched = collections.Counter()
+        # interaction responses rejected for missing the deadline, or for
+        # answering twice
+        self.late_acks = 0
+        self.double_acks = 0
+        self.in_flight = 0
+        self.last_call = time.perf_counter()
+        self.sessions = set()
+        # (token, shard) of every IDENTIFY, and the tokens of the sessions
+        # each guild was sent to
+        self.identifies = []
+        self.guild_sessions = collections.defaultdict(list)
+        self.identified = asyncio.Event()
+        self.runner = None
+        self.url = None
+
+    def api_url(self, version: int):
+        return f'{self.url}/api/v{version}'
+
+    @classmethod
+    async def start(cls, *args, **kwargs):
+        fake = cls(*args, **kwargs)
+        app = web.Application(middlewares=[fake.middleware])
+        routes = [
+            ('GET', '/gateway', fake.get_gateway),
+            ('GET', '/gateway/bot', fake.get_gateway),
+            ('GET', '/users/@me', fake.get_me),
+            ('POST', '/interactions/{interaction_id}/{token}/callback',
+             fake.interaction_callback),
+            ('POST', '/webhooks/{application_id}/{token}',
+             fake.post_followup),
+            ('GET', '/webhooks/{application_id}/{token}/messages/'
+                    '{message_id}',
+             fake.get_webhook_message),
+            ('PATCH', '/webhooks/{application_id}/{token}/messages/'
+                      '{message_id}',
+             fake.edit_webhook_message),
+            ('DELETE', '/webhooks/{application_id}/{token}/messages/'
+                       '{message_id}',
+             fake.no_content),
+            ('GET', '/channels/{channel_id}', fake.get_channel),
+            ('PATCH', '/channels/{channel_id}', fake.edit_channel),
+            ('PUT', '/channels/{channel_id}/permissions/{target_id}',
+             fake.edit_overwrite),
+            ('DELETE', '/channels/{channel_id}/permissions/{target_id}',
+             fake.edit_overwrite),
+            ('POST', '/channels/{channel_id}/messages', fake.post_message),
+            ('PATCH', '/channels/{channel_id}/messages/{message_id}',
+             fake.edit_message),
+            ('DELETE', '/channels/{channel_id}/messages/{message_id}',
+             fake.no_content),
+            ('PUT', '/channels/{channel_id}/pins/{message_id}',
+             fake.no_content),
+            ('GET', '/guilds/{guild_id}/members/{user_id}', fake.get_member),
+        ]
+        # discord.py uses v7 and discord_slash v8
+        app.add_routes([web.get('/gateway', fake.gateway),
+                        *(web.route(method, api + path, handler)
+                          for api in ('/api/v7', '/api/v8')
+                          for method, path, handler in routes),
+                        web.route('*', '/{tail:.*}', fake.unknown_route)])
+        fake.runner = web.AppRunner(app)
+        await fake.runner.setup()
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        await web.SockSite(fake.runner, sock).start()
+        fake.url = 'http://127.0.0.1:%d' % sock.getsockname()[1]
+        return fake
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    # guild contents
+
+    def user_json(self, user_id: int, name: str, bot: bool=False):
+        return {
+            'id': str(user_id),
+            'username': name,
+            'discriminator': f'{user_id % 10000:04d}',
+            'avatar': None,
+            'bot': bot
+        }
+
+    def add_member(self, user_id: int, name: str, ta: bool=False):
+        self.members[user_id] = {
+            'user': self.user_json(user_id, name),
+            'roles': [str(self.ta_role_id)] if ta else [],
+            'joined_at': iso_now(),
+            'premium_since': None,
+            'nick': None,
+            'deaf': False,
+            'mute': False,
+            'pending': False
+        }
+
+    def guild_json(self, guild_id: int):
+        everyone = VIEW_AND_SEND
+        return {
+            'id': str(guild_id),
+            'name': 'Load test',
+            'unavailable': False,
+            'owner_id': str(self.owner_id),
+            'region': 'us-east',
+            'afk_timeout': 300,
+            'verification_level': 0,
+            'default_message_notifications': 0,
+            'explicit_content_filter': 0,
+            'mfa_level': 0,
+            'premium_tier': 0,
+            'preferred_locale': 'en-US',
+            'system_channel_flags': 0,
+            'icon': None,
+            'splash': None,
+            'banner': None,
+            'description': None,
+            'features': [],
+            'emojis': [],
+            'roles': [
+                {'id': str(guild_id), 'name': '@everyone',
+                 'permissions': str(everyone),
+                 'permissions_new': str(everyone),
+                 'position': 0, 'color': 0, 'hoist': False,
+                 'managed': False, 'mentionable': False},
+                {'id': str(self.ta_role_id), 'name': 'TA',
+                 'permissions': str(everyone | MANAGE_CHANNELS),
+                 'permissions_new': str(everyone | MANAGE_CHANNELS),
+                 'position': 1, 'color': 0, 'hoist': False,
+                 'managed': False, 'mentionable': False},
+            ],
+            'channels': [channel for channel in self.channels.values()
+                         if channel['guild_id'] == str(guild_id)],
+            # without the members intent, only the bot itself is sent
+            'members': [{'user': self.bot_user,
+                         'roles': [],
+                         'joined_at': iso_now(),
+                         'deaf': False,
+                         'mute': False}],
+            'member_count': len(self.members) + 1,
+            'large': len(self.members) >= 250,
+            'voice_states': [],
+            'presences': [],
+        }
+
+    # gateway
+
+    def dispatch(self, event: str, data: dict, session: Session=None):
+        '''Sends an event to `session`, or to the sessions that receive its
+        guild.'''
+        self.dispatched[event] += 1
+        receivers = ([session] if session else
+                     [receiver for receiver in self.sessions
+                      if receiver.receives(int(data['guild_id']))])
+        # serialized now, as the payloads are changed later on
+        data = json.dumps(data)
+        for receiver in receivers:
+            receiver.outbox.put_nowait((event, data))
+
+    async def gateway(self, request: web.Request):
+        ws = web.WebSocketResponse(max_msg_size=0)
+        await ws.prepare(request)
+        await ws.send_json({'op': 10, 's': None, 't': None,
+                            'd': {'heartbeat_interval': 41250}})
+        session = Session(ws)
+        sender = asyncio.create_task(self.send_dispatches(session))
+        try:
+            async for message in ws:
+                payload = json.loads(message.data)
+                if payload['op'] == 1:
+                    asyncio.create_task(self.heartbeat_ack(ws))
+                elif payload['op'] == 2:
+                    self.identify(session, payload['d'])
+                elif payload['op'] == 6:
+                    # sessions are never resumed
+                    await ws.send_json({'op': 9, 's': None, 't': None,
+                                        'd': False})
+        finally:
+            self.sessions.discard(session)
+            sender.cancel()
+        return ws
+
+    async def heartbeat_ack(self, ws: web.WebSocketResponse):
+        # discord.py measures a whole heartbeat interval of latency when the
+        # ACK arrives before its keep-alive thread has noted the heartbeat
+        await asyncio.sleep(self.rest_latency)
+        await ws.send_json({'op': 11, 's': None, 't': None, 'd': None})
+
+    async def send_dispatches(self, session: Session):
+        while True:
+            event, data = await session.outbox.get()
+            session.sequence += 1
+            await session.ws.send_str(f'{{"op": 0, "t": "{event}", '
+                                      f'"s": {session.sequence}, '
+                                      f'"d": {data}}}')
+
+    def identify(self, session: Session, data: dict):
+        session.token = data['token']
+        session.shard = tuple(data.get('shard') or (0, 1))
+        self.identifies.append((session.token, session.shard))
+        guild_ids = [guild_id for guild_id in self.guild_ids
+                     if session.receives(guild_id)]
+        self.dispatch('READY', {
+            'v': 7,
+            'user': self.bot_user,
+            'guilds': [{'id': str(guild_id), 'unavailable': True}
+                       for guild_id in guild_ids],
+            'session_id': secrets.token_hex(16),
+            'shard': list(session.shard),
+            'application': {'id': str(self.bot_id), 'flags': 0},
+            'private_channels': [],
+            'relationships': []
+        }, session)
+        for guild_id in guild_ids:
+            self.dispatch('GUILD_CREATE', self.guild_json(guild_id), session)
+            self.guild_sessions[guild_id].append(session.token)
+        self.sessions.add(session)
+        self.identified.set()
+
+    # interactions
+
+    def interact(self, interaction: Interaction, kind: int, data: dict,
+                 message: dict=None):
+        self.interactions[interaction.id] = interaction
+        self.tokens[interaction.token] = interaction
+        member = dict(self.members[interaction.user_id])
+        member['permissions'] = str(
+            VIEW_AND_SEND | (MANAGE_CHANNELS if member['roles'] else 0)
+        )
+        payload = {
+            'id': str(interaction.id),
+            'application_id': str(self.bot_id),
+            'type': kind,
+            'token': interaction.token,
+            'version': 1,
+            'guild_id': self.channels[interaction.channel_id]['guild_id'],
+            'channel_id': str(interaction.channel_id),
+            'member': member,
+            'data': data
+        }
+        if message:
+            payload['message'] = message
+        self.dispatch('INTERACTION_CREATE', payload)
+        return interaction
+
+    def slash(self, user_id: int, channel_id: int, name: str,
+              options: list[dict]=(), on_response=None):
+        '''Runs `/mentor <name>` as a user.'''
+        data = {
+            'id': str(self.command_id),
+            'name': 'mentor',
+            'options': [{'name': name, 'type': 1, 'options': list(options)}]
+        }
+        return self.interact(
+            Interaction(f'/mentor {name}', user_id, channel_id,
+                        on_response=on_response),
+            2, data
+        )
+
+    def click(self, user_id: int, message: dict, custom_id: str,
+              values: list[str]=None, on_response=None):
+        '''Uses a button, or a select menu with `values`, of a message.'''
+        data = {'custom_id': custom_id,
+                'component_type': 2 if values is None else 3}
+        if values is not None:
+            data['values'] = values
+        return self.interact(
+            Interaction(custom_id.split(':')[0], user_id,
+                        int(message['channel_id']), int(message['id']),
+                        on_response),
+            3, data, message
+        )
+
+    def responded(self, interaction: Interaction, message: dict):
+        if interaction.responded is None:
+            interaction.responded = time.perf_counter()
+            if interaction.on_response:
+                interaction.on_response(message)
+
+    # messages
+
+    def say(self, user_id: int, channel_id: int, content: str):
+        '''Posts a message as a user.'''
+        return self.new_message(channel_id, {'content': content},
+                                member=self.members[user_id])
+
+    def new_message(self, channel_id: int, data: dict, flags: int=0,
+                    member: dict=None):
+        '''Creates a message of the bot, or of a guild member.'''
+        message = {
+            'id': str(snowflake()),
+            'channel_id': str(channel_id),
+            'guild_id': self.channels[channel_id]['guild_id'],
+            'author': member['user'] if member else self.bot_user,
+            'content': '',
+            'embeds': [],
+            'attachments': [],
+            'mentions': [],
+            'mention_roles': [],
+            'mention_everyone': False,
+            'tts': False,
+            'pinned': False,
+            'type': 0,
+            'flags': flags,
+            'timestamp': iso_now(),
+            'edited_timestamp': None,
+            'components': []
+        }
+        if member:
+            message['member'] = {key: value for key, value in member.items()
+                                 if key != 'user'}
+        self.messages[int(message['id'])] = message
+        self.update_message(message, data, created=True)
+        return message
+
+    def update_message(self, message: dict, data: dict,
+                       created: bool=False):
+        if 'content' in data:
+            message['content'] = data['content'] or ''
+        if 'embeds' in data or 'embed' in data:
+            message['embeds'] = (data.get('embeds') or
+                                 ([data['embed']] if data.get('embed')
+                                  else []))
+        if 'components' in data:
+            message['components'] = data['components'] or []
+        if not created:
+            message['edited_timestamp'] = iso_now()
+        if not message['flags'] & EPHEMERAL:
+            self.dispatch('MESSAGE_CREATE' if created else 'MESSAGE_UPDATE',
+                          message)
+        for listener in self.listeners:
+            listener(message)
+
+    def interaction_for(self, request: web.Request):
+        return self.tokens.get(request.match_info['token'])
+
+    def original_message(self, interaction: Interaction, message_id: str):
+        if message_id == '@original':
+            return self.messages.get(interaction.original)
+        return self.messages.get(int(message_id))
+
+    # REST API
+
+    @web.middleware
+    async def middleware(self, request: web.Request, handler):
+        resource = request.match_info.route.resource
+        route = re.sub(r'^/api/v\d+', '', resource.canonical)
+        if route == '/{tail:.*}':
+            route = re.sub(r'/\d+', '/{id}',
+                           re.sub(r'^/api/v\d+', '', request.path))
+        if route == '/gateway':
+            return await handler(request)
+        self.rest_calls[request.method, route] += 1
+        self.in_flight += 1
+        try:
+            return await self.handle(request, handler, route)
+        finally:
+            self.in_flight -= 1
+            self.last_call = time.perf_counter()
+
+    async def handle(self, request: web.Request, handler, route: str):
+        # half of the round trip on the way in, half on the way out
+        await asyncio.sleep(self.rest_latency / 2)
+        major = next(iter(request.match_info.values()), '')
+        allowed, headers = self.limiter.acquire(request.method, route, major)
+        if allowed:
+            response = await handler(request)
+        else:
+            self.rate_limited[request.method, route] += 1
+            # v7 gives the retry delay in milliseconds
+            reset_after = float(headers['X-RateLimit-Reset-After'])
+            response = json_response({
+                'message': 'You are being rate limited.',
+                'retry_after': round(reset_after * 1000),
+                'global': False
+            }, status=429)
+        if not response.prepared:
+            response.headers.update(headers)
+        await asyncio.sleep(self.rest_latency / 2)
+        return response
+
+    def error(self, status: int, code: int, message: str):
+        return json_response({'code': code, 'message': message},
+                                 status=status)
+
+    async def no_content(self, request: web.Request):
+        return web.Response(status=204)
+
+    async def unknown_route(self, request: web.Request):
+        return self.error(404, 0, 'Not simulated')
+
+    async def get_gateway(self, request: web.Request):
+        return json_response({
+            'url': self.url.replace('http', 'ws', 1) + '/gateway',
+            'shards': self.shards,
+            'session_start_limit': {'total': 1000, 'remaining': 1000,
+                                    'reset_after': 0,
+                                    'max_concurrency': 1}
+        })
+
+    async def get_me(self, request: web.Request):
+        return json_response(self.bot_user)
+
+    async def interaction_callback(self, request: web.Request):
+        now = time.perf_counter()
+        interaction = self.interactions.get(
+            int(request.match_info['interaction_id'])
+        )
+        if (not interaction or
+            interaction.token != request.match_info['token']):
+            return self.error(404, 10062, 'Unknown interaction')
+        if now - interaction.sent > ACK_DEADLINE:
+            self.late_acks += 1
+            return self.error(404, 10062, 'Unknown interaction')
+        if interaction.ack is not None:
+            self.double_acks += 1
+            return self.error(400, 40060, 'Interaction has already been '
+                                          'acknowledged.')
+        body = await request.json()
+        data = body.get('data') or {}
+        interaction.ack = now
+        interaction.acked_by = request.headers.get('Authorization')
+        interaction.ack_type = body['type']
+        if body['type'] in (4, 5):
+            # a deferred response shows a placeholder until it is edited
+            message = self.new_message(interaction.channel_id,
+                                       data if body['type'] == 4 else {},
+                                       data.get('flags', 0))
+            interaction.original = int(message['id'])
+            if body['type'] == 4:
+                self.responded(interaction, message)
+        elif body['type'] in (6, 7):
+            interaction.original = interaction.message_id
+            if body['type'] == 7:
+                message = self.messages[interaction.message_id]
+                self.update_message(message, data)
+                self.responded(interaction, message)
+        return web.Response(status=204)
+
+    async def post_followup(self, request: web.Request):
+        if not (interaction := self.interaction_for(request)):
+            return self.error(404, 10015, 'Unknown Webhook')
+        data = await request.json()
+        message = self.new_message(interaction.channel_id, data,
+                                   data.get('flags', 0))
+        self.responded(interaction, message)
+        return json_response(message)
+
+    async def get_webhook_message(self, request: web.Request):
+        if (not (interaction := self.interaction_for(request)) or
+            not (message := self.original_message(
+                interaction, request.match_info['message_id']))):
+            return self.error(404, 10008, 'Unknown Message')
+        return json_response(message)
+
+    async def edit_webhook_message(self, request: web.Request):
+        if (not (interaction := self.interaction_for(request)) or
+            not (message := self.original_message(
+                interaction, request.match_info['message_id']))):
+            return self.error(404, 10008, 'Unknown Message')
+        data = await request.json()
+        self.update_message(message, data)
+        self.responded(interaction, message)
+        return json_response(message)
+
+    async def get_channel(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        if not (channel := self.channels.get(channel_id)):
+            return self.error(404, 10003, 'Unknown Channel')
+        return json_response(channel)
+
+    async def edit_channel(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        if not (channel := self.channels.get(channel_id)):
+            return self.error(404, 10003, 'Unknown Channel')
+        data = await request.json()
+        if 'permission_overwrites' in data:
+            channel['permission_overwrites'] = [
+                overwrite_json(overwrite)
+                for overwrite in data.pop('permission_overwrites')
+            ]
+        channel.update((key, value) for key, value in data.items()
+                       if key in ('name', 'topic', 'position', 'nsfw'))
+        self.dispatch('CHANNEL_UPDATE', channel)
+        return json_response(channel)
+
+    async def edit_overwrite(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        if not (channel := self.channels.get(channel_id)):
+            return self.error(404, 10003, 'Unknown Channel')
+        target_id = request.match_info['target_id']
+        overwrites = [overwrite
+                      for overwrite in channel['permission_overwrites']
+                      if overwrite['id'] != target_id]
+        if request.method == 'PUT':
+            overwrites.append(overwrite_json({'id': target_id,
+                                              **await request.json()}))
+        channel['permission_overwrites'] = overwrites
+        self.dispatch('CHANNEL_UPDATE', channel)
+        return web.Response(status=204)
+
+    async def post_message(self, request: web.Request):
+        channel_id = int(request.match_info['channel_id'])
+        if channel_id not in self.channels:
+            return self.error(404, 10003, 'Unknown Channel')
+        message = self.new_message(channel_id, await request.json())
+        return json_response(message)
+
+    async def edit_message(self, request: web.Request):
+        if not (message := self.messages.get(
+                int(request.match_info['message_id']))):
+            return self.error(404, 10008, 'Unknown Message')
+        self.update_message(message, await request.json())
+        return json_response(message)
+
+    async def get_member(self, request: web.Request):
+        user_id = int(request.match_info['user_id'])
+        if user_id == self.bot_id:
+            return json_response({'user': self.bot_user,
+                                      'roles': [],
+                                      'joined_at': iso_now(),
+                                      'deaf': False,
+                                      'mute': False})
+        if not (member := self.members.get(user_id)):
+            return self.error(404, 10007, 'Unknown Member')
+        return json_response(member)
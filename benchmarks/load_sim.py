@@ -0,0 +1,405 @@
+'''End-to-end load test of the bot against a fake Discord gateway and REST
+API (benchmarks.fake_discord), replaying a trace of user actions.
+
+By default the trace is a scripted burst: --students students join the
+queues within --window seconds, while --tas TAs each finish their session
+and run `/mentor next` every --interval seconds in their own channel.
+Invited students press Join after a random reaction time, unless they don't
+show up at all. The report gives the latency until each interaction was
+acknowledged and answered, the interactions that missed Discord's
+3-second acknowledgement deadline, and the REST calls the bot made.
+
+A trace is a JSON lines file of {"at": seconds, "action": ..., "user": n}
+objects, where the action is join, leave or query for student n, or next or
+finish for TA n; join, next and finish also give a "channel" index, and
+next a "count". --record saves the scripted trace, --trace replays one, and
+--from-events converts the mentor_events history of a database, so that
+real traffic can be replayed. Run from the project root:
+
+    python -m benchmarks.load_sim [--students N] [--tas N] [--window S]
+    python -m benchmarks.load_sim --from-events database/mentors.sqlite3
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+
+import discord
+import discord_slash.http
+
+from ta_bot import setup_bot
+from ta_bot.utils.database import MentorDbConn
+from ta_bot.utils.logs import setup_logging
+
+from .fake_discord import ACK_DEADLINE, EPHEMERAL, FakeDiscord
+
+
+STUDENT_ACTIONS = {'join', 'leave', 'query'}
+TA_ACTIONS = {'next', 'finish'}
+INVITE_BUTTON = re.compile(r'next-join:(\d+):(\d+)')
+# seconds a student takes to pick a channel from the join menu
+MENU_DELAY = (0.5, 2.0)
+
+
+def burst_trace(rng: random.Random,
+                students: int,
+                tas: int,
+                channels: int,
+                window: float,
+                interval: float,
+                count: int,
+                duration: float):
+    trace = [{'at': rng.uniform(0, window),
+              'action': 'join',
+              'user': student,
+              'channel': rng.randrange(channels)}
+             for student in range(students)]
+    for ta in range(tas):
+        at = rng.uniform(0, interval)
+        while at < duration:
+            trace.append({'at': at, 'action': 'finish', 'user': ta,
+                          'channel': ta % channels})
+            trace.append({'at': at + 1, 'action': 'next', 'user': ta,
+                          'channel': ta % channels, 'count': count})
+            at += interval
+    trace.sort(key=lambda event: event['at'])
+    return trace
+
+
+def events_trace(dbfile: str, speed: float):
+    '''Converts the mentor_events history of a database to a trace. Users,
+    TAs and channels are numbered in order of appearance, and the invites
+    of one `/mentor next` become a single next action.'''
+    conn = sqlite3.connect(dbfile)
+    rows = conn.execute('''
+        SELECT channel_id, user_id, ta_id, event, time FROM mentor_events
+        WHERE event IN ('join', 'leave', 'invite', 'finish')
+        ORDER BY time, event_id;
+    ''').fetchall()
+    conn.close()
+    students, tas, channels = {}, {}, {}
+    trace = []
+    start = rows[0][4] if rows else 0
+    for channel_id, user_id, ta_id, event, timestamp in rows:
+        at = (timestamp - start) / 1000 / speed
+        channel = channels.setdefault(channel_id, len(channels))
+        if event in STUDENT_ACTIONS:
+            trace.append({'at': at,
+                          'action': event,
+                          'user': students.setdefault(user_id, len(students)),
+                          'channel': channel})
+            continue
+        action = 'next' if event == 'invite' else 'finish'
+        ta = tas.setdefault(ta_id, len(tas))
+        last = trace[-1] if trace else {}
+        # events of one command share their timestamp
+        if (last.get('action'), last.get('user'), last.get('at')) == (
+            action, ta, at
+        ):
+            if action == 'next':
+                last['count'] += 1
+            continue
+        trace.append({'at': at, 'action': action, 'user': ta,
+                      'channel': channel,
+                      **({'count': 1} if action == 'next' else {})})
+    return trace
+
+
+def trace_size(trace: list[dict]):
+    '''Returns the numbers of students, TAs and channels a trace needs.'''
+    def highest(key, actions):
+        return max((event[key] for event in trace
+                    if event['action'] in actions and key in event),
+                   default=-1) + 1
+    return (highest('user', STUDENT_ACTIONS),
+            highest('user', TA_ACTIONS),
+            max(1, highest('channel', STUDENT_ACTIONS | TA_ACTIONS)))
+
+
+class LoadGenerator:
+    '''Plays a trace against the fake, answering invites like students
+    would. Runs on the fake's loop.'''
+
+    def __init__(self,
+                 fake: FakeDiscord,
+                 rng: random.Random,
+                 students: int,
+                 tas: int,
+                 reaction: tuple[float, float],
+                 no_show: float):
+        self.fake = fake
+        self.rng = rng
+        self.students = [10 ** 17 + n for n in range(students)]
+        self.tas = [2 * 10 ** 17 + n for n in range(tas)]
+        for n, user_id in enumerate(self.students):
+            fake.add_member(user_id, f'student{n}')
+        for n, user_id in enumerate(self.tas):
+            fake.add_member(user_id, f'ta{n}', ta=True)
+        self.reaction = reaction
+        self.no_show = no_show
+        # (message ID, user ID) of invites that were already seen
+        self.invites = set()
+        self.no_shows = 0
+        self.lag = 0.0
+        self.tasks = set()
+        fake.listeners.append(self.on_message)
+
+    def later(self, delay: float, callback, *args):
+        async def run():
+            await asyncio.sleep(delay)
+            callback(*args)
+        task = asyncio.ensure_future(run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def perform(self, event: dict):
+        fake = self.fake
+        channels = fake.mentor_channel_ids
+        action = event['action']
+        if action == 'join':
+            channel_id = channels[event['channel'] % len(channels)]
+            fake.slash(self.students[event['user']], fake.general_id, 'join',
+                       on_response=lambda message: self.later(
+                           self.rng.uniform(*MENU_DELAY),
+                           self.select_channel,
+                           self.students[event['user']],
+                           message,
+                           channel_id
+                       ))
+        elif action in STUDENT_ACTIONS:
+            fake.slash(self.students[event['user']], fake.general_id, action)
+        else:
+            options = ([{'name': 'count', 'type': 4,
+                         'value': event.get('count', 1)}]
+                       if action == 'next' else [])
+            fake.slash(self.tas[event['user']],
+                       channels[event['channel'] % len(channels)],
+                       action,
+                       options)
+
+    def select_channel(self, user_id: int, menu: dict, channel_id: int):
+        if any(component.get('custom_id') == 'join-select'
+               for row in menu['components']
+               for component in row['components']):
+            self.fake.click(user_id, menu, 'join-select',
+                            [f'join-{channel_id}'])
+
+    def on_message(self, message: dict):
+        if message['flags'] & EPHEMERAL:
+            return
+        for row in message['components']:
+            for component in row['components']:
+                match = INVITE_BUTTON.fullmatch(component.get('custom_id', ''))
+                key = (message['id'], int(match[1])) if match else None
+                if not key or component.get('disabled') or (
+                    key in self.invites
+                ):
+                    continue
+                self.invites.add(key)
+                if self.rng.random() < self.no_show:
+                    self.no_shows += 1
+                    continue
+                self.later(self.rng.uniform(*self.reaction),
+                           self.accept, key[1], int(message['id']),
+                           component['custom_id'])
+
+    def accept(self, user_id: int, message_id: int, custom_id: str):
+        self.fake.click(user_id, self.fake.messages[message_id], custom_id)
+
+    async def run(self, trace: list[dict], drain: float):
+        '''Plays the trace, then waits up to `drain` seconds for delayed
+        answers and for the bot to respond.'''
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        for event in trace:
+            if (delay := start + event['at'] - loop.time()) > 0:
+                await asyncio.sleep(delay)
+            self.lag = max(self.lag, loop.time() - start - event['at'])
+            self.perform(event)
+        deadline = loop.time() + drain
+        while loop.time() < deadline and not self.settled():
+            await asyncio.sleep(0.1)
+        return loop.time() - start
+
+    def settled(self):
+        '''Returns whether nothing happened for a second, and nothing is
+        left to happen.'''
+        now = time.perf_counter()
+        return (not self.tasks and
+                not self.fake.in_flight and
+                now - self.fake.last_call > 1 and
+                all(interaction.ack is not None or
+                    now - interaction.sent > ACK_DEADLINE
+                    for interaction in self.fake.interactions.values()))
+
+
+def quantiles(values: list[float]):
+    '''Formats p50/p90/p99/max of seconds in milliseconds.'''
+    if not values:
+        return f'{"-":>8} {"-":>8} {"-":>8} {"-":>8}'
+    values = sorted(values)
+    picks = [values[min(len(values) - 1, int(len(values) * q))]
+             for q in (.5, .9, .99, 1)]
+    return ' '.join(f'{value * 1000:8.0f}' for value in picks)
+
+
+def report(fake: FakeDiscord, generator: LoadGenerator, elapsed: float):
+    interactions = list(fake.interactions.values())
+    labels = sorted({interaction.label for interaction in interactions})
+    header = (f'{"interaction":<16} {"count":>6} {"missed":>6}   '
+              f'{"ack p50":>8} {"p90":>8} {"p99":>8} {"max":>8}   '
+              f'{"resp p50":>8} {"p90":>8} {"p99":>8} {"max":>8}')
+    print(header)
+    print('-' * len(header))
+    for label in labels + [None]:
+        group = [interaction for interaction in interactions
+                 if label is None or interaction.label == label]
+        acks = [interaction.ack - interaction.sent for interaction in group
+                if interaction.ack is not None]
+        responses = [interaction.responded - interaction.sent
+                     for interaction in group
+                     if interaction.responded is not None]
+        missed = sum(interaction.missed for interaction in group)
+        print(f'{label or "all":<16} {len(group):6} {missed:6}   '
+              f'{quantiles(acks)}   {quantiles(responses)}')
+
+    print(f'\n{sum(interaction.missed for interaction in interactions)} of '
+          f'{len(interactions)} interactions missed the '
+          f'{ACK_DEADLINE:.0f} s deadline; {fake.late_acks} late responses '
+          f'were rejected. {generator.no_shows} invites were left '
+          'unanswered on purpose.')
+    print(f'Trace playback lagged by up to {generator.lag * 1000:.0f} ms.')
+
+    total = sum(fake.rest_calls.values())
+    print(f'\n{total} REST calls in {elapsed:.1f} s '
+          f'({total / elapsed:.1f}/s), '
+          f'{sum(fake.rate_limited.values())} rate limited:')
+    for (method, route), count in fake.rest_calls.most_common():
+        limited = fake.rate_limited[method, route]
+        print(f'{count:8}  {method:<6} {route}' +
+              (f'  ({limited} rate limited)' if limited else ''))
+    print('\nGateway events: ' +
+          ', '.join(f'{count} {event}'
+                    for event, count in fake.dispatched.most_common()))
+
+
+async def simulate(args, trace: list[dict], dbfile: str):
+    students, tas, channels = trace_size(trace)
+    fake_loop = asyncio.new_event_loop()
+    # the fake runs on its own thread, so the bot's event loop stalls
+    # delay the bot's answers but not the trace
+    threading.Thread(target=fake_loop.run_forever, daemon=True).start()
+
+    def call(coroutine):
+        return asyncio.wrap_future(
+            asyncio.run_coroutine_threadsafe(coroutine, fake_loop)
+        )
+
+    async def create():
+        fake = await FakeDiscord.start(channels,
+                                       args.rest_latency,
+                                       not args.no_rate_limits)
+        return fake, LoadGenerator(fake,
+                                   random.Random(args.seed),
+                                   students,
+                                   tas,
+                                   args.reaction,
+                                   args.no_show)
+
+    fake, generator = await call(create())
+
+    db = MentorDbConn(dbfile)
+    for index, channel_id in enumerate(fake.mentor_channel_ids):
+        db.update_mentor_channel(fake.guild_id, channel_id,
+                                 f'Mentor channel {index}')
+    db.close()
+    os.environ.update(MENTOR_STORE=dbfile,
+                      METRICS_PORT='0',
+                      INVITE_TIMEOUT=str(args.invite_timeout))
+    discord.http.Route.BASE = fake.api_url(7)
+    discord_slash.http.CustomRoute.BASE = fake.api_url(8)
+    bot = setup_bot('!', sync_commands=False)
+    bot_task = asyncio.create_task(bot.start('load-test-token'))
+    await bot.wait_until_ready()
+
+    print(f'Replaying {len(trace)} actions of {students} students and '
+          f'{tas} TAs in {channels} channels...')
+    elapsed = await call(generator.run(trace, args.drain))
+    await bot.close()
+    await bot_task
+
+    async def finish():
+        report(fake, generator, elapsed)
+        await fake.stop()
+    await call(finish())
+    fake_loop.call_soon_threadsafe(fake_loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--tas', type=int, default=10)
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--window', type=float, default=60,
+                        help='seconds over which the students join')
+    parser.add_argument('--interval', type=float, default=20,
+                        help='seconds between a TA\'s /mentor next')
+    parser.add_argument('--count', type=int, default=1,
+                        help='users invited by each /mentor next')
+    parser.add_argument('--duration', type=float,
+                        help='seconds the TAs keep inviting, by default '
+                             'the join window and another minute')
+    parser.add_argument('--trace', help='replay this trace file')
+    parser.add_argument('--from-events', metavar='DATABASE',
+                        help='replay the mentor_events of this database')
+    parser.add_argument('--speed', type=float, default=1,
+                        help='speed-up of --from-events traces')
+    parser.add_argument('--record', help='save the trace to this file')
+    parser.add_argument('--reaction', type=float, nargs=2,
+                        default=(1, 10), metavar=('MIN', 'MAX'),
+                        help='seconds until invited students press Join')
+    parser.add_argument('--no-show', type=float, default=0.1,
+                        help='fraction of invites left unanswered')
+    parser.add_argument('--invite-timeout', type=int, default=30)
+    parser.add_argument('--rest-latency', type=float, default=0.05,
+                        help='round trip of REST calls in seconds')
+    parser.add_argument('--no-rate-limits', action='store_true')
+    parser.add_argument('--drain', type=float, default=30,
+                        help='seconds to wait for answers after the trace')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.trace:
+        with open(args.trace) as file:
+            trace = [json.loads(line) for line in file if line.strip()]
+    elif args.from_events:
+        trace = events_trace(args.from_events, args.speed)
+    else:
+        trace = burst_trace(random.Random(args.seed),
+                            args.students,
+                            args.tas,
+                            args.channels,
+                            args.window,
+                            args.interval,
+                            args.count,
+                            args.duration or args.window + 60)
+    if args.record:
+        with open(args.record, 'w') as file:
+            file.writelines(json.dumps(event) + '\n' for event in trace)
+
+    setup_logging(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp:
+        asyncio.run(simulate(args,
+                             trace,
+                             os.path.join(tmp, 'mentors.sqlite3')))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+'''Stress test for interaction locking: many component interactions spread
+over several TA channels of one guild, while one TA sits in the `/mentor
+setup` description prompt. Compares the old single per-guild lock with the
+per-channel/per-user KeyedLocks used by MentorCog.
+
+Run from the project root:
+
+    python -m benchmarks.lock_contention [--channels N] [--interactions N]
+'''
+import argparse
+import asyncio
+import random
+import time
+
+from ta_bot.utils.locks import KeyedLocks
+
+
+REST_LATENCY = 0.02
+PROMPT_WAIT = 1.0
+
+
+async def guild_lock_handler(locks: dict, guild_id, channel_id, user_id,
+                             prompt: bool):
+    lock = locks.setdefault(guild_id, asyncio.Lock())
+    async with lock:
+        await asyncio.sleep(PROMPT_WAIT if prompt else REST_LATENCY)
+
+
+async def keyed_lock_handler(locks: KeyedLocks, guild_id, channel_id,
+                             user_id, prompt: bool):
+    if prompt:
+        # the description prompt is awaited without holding any lock
+        await asyncio.sleep(PROMPT_WAIT)
+        async with locks(('channel', guild_id, channel_id)):
+            return
+    async with locks(('channel', guild_id, channel_id),
+                     ('user', guild_id, user_id)):
+        await asyncio.sleep(REST_LATENCY)
+
+
+async def run(name: str, handler, locks, channels: int, interactions: int):
+    latencies = []
+
+    async def interaction(channel_id, user_id, prompt=False):
+        start = time.perf_counter()
+        await handler(locks, 1, channel_id, user_id, prompt)
+        if not prompt:
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tasks = [asyncio.create_task(interaction(0, 0, prompt=True))]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(interaction(random.randrange(channels),
+                                              random.randrange(1, 10000)))
+              for _ in range(interactions)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99)]
+    print(f'{name:<12} total {elapsed:7.2f} s  '
+          f'p50 {p50 * 1000:8.1f} ms  p99 {p99 * 1000:8.1f} ms')
+    return latencies
+
+
+async def main(channels: int, interactions: int):
+    random.seed(0)
+    await run('guild lock', guild_lock_handler, {}, channels, interactions)
+    random.seed(0)
+    locks = KeyedLocks()
+    keyed = await run('keyed locks', keyed_lock_handler, locks,
+                      channels, interactions)
+    assert len(locks) == 0, 'locks were not released'
+    # with one REST call per interaction, no channel should wait on others:
+    # the worst case is its own channel's backlog
+    assert max(keyed) < PROMPT_WAIT, 'interactions waited on the prompt'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--channels', type=int, default=10)
+    parser.add_argument('--interactions', type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.channels, args.interactions))
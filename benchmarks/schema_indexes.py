@@ -0,0 +1,84 @@
+'''Compares queue query latency on a database without the mentor_users
+indexes (as created before schema versioning) against a fully migrated one,
+for queue sizes from 10 to 100k rows.
+
+Run from the project root:
+
+    python -m benchmarks.schema_indexes [--sizes 10,100,...] [--repeat N]
+'''
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from ta_bot.utils.database import MentorDbConn
+
+
+GUILD_ID, CHANNEL_ID = 1, 1
+
+
+def populate(db: MentorDbConn, size: int):
+    # spread rows over a few other channels so the filters matter
+    rows = [(GUILD_ID, user_id, CHANNEL_ID if user_id % 4 == 0 else
+             user_id % 4 + 1, user_id, int(user_id < 3))
+            for user_id in range(size * 4)]
+    with db.conn:
+        db.conn.executemany('''
+            INSERT INTO mentor_users
+                (guild_id, user_id, channel_id, queued_time, is_active)
+            VALUES (?, ?, ?, ?, ?);
+        ''', rows)
+        db.conn.execute('ANALYZE;')
+
+
+def time_queries(db: MentorDbConn, size: int, repeat: int):
+    user_ids = [random.randrange(size) * 4 for _ in range(repeat)]
+    queries = {
+        'get_user_info': lambda i: db.get_user_info(GUILD_ID,
+                                                    user_ids[i],
+                                                    True),
+        'get_next_user': lambda i: db.get_next_user(GUILD_ID, CHANNEL_ID),
+        'get_active_users': lambda i: db.get_active_users(GUILD_ID,
+                                                          CHANNEL_ID),
+        'get_users': lambda i: db.get_users(GUILD_ID, CHANNEL_ID),
+    }
+    result = {}
+    for name, query in queries.items():
+        start = time.perf_counter()
+        for i in range(repeat):
+            query(i)
+        result[name] = (time.perf_counter() - start) / repeat * 1e6
+    return result
+
+
+def main(sizes: list[int], repeat: int):
+    print(f'{"rows":>8} {"query":<18} {"no index (us)":>14} '
+          f'{"migrated (us)":>14} {"speedup":>8}')
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            timings = []
+            for indexed in (False, True):
+                path = os.path.join(tmpdir, f'{size}-{indexed}.sqlite3')
+                db = MentorDbConn(path)
+                if not indexed:
+                    db.conn.execute('DROP INDEX mentor_users_by_time;')
+                    db.conn.execute('DROP INDEX mentor_users_by_state;')
+                populate(db, size)
+                timings.append(time_queries(db, size, repeat))
+                db.conn.close()
+
+            for name in timings[0]:
+                before, after = timings[0][name], timings[1][name]
+                print(f'{size:>8} {name:<18} {before:>14.1f} '
+                      f'{after:>14.1f} {before / after:>7.1f}x')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10,100,1000,10000,100000',
+                        help='comma-separated queue sizes per channel')
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='queries per measurement')
+    args = parser.parse_args()
+    main([int(size) for size in args.sizes.split(',')], args.repeat)
@@ -0,0 +1,254 @@
+'''Conformance test of the storage backends: runs the same scenarios against
+a temporary SQLite file (the reference) and a Redis-protocol server, and
+reports every call whose result differs. Keys are written under a fresh
+prefix, which is deleted afterwards. Exits with status 1 on differences.
+
+Run from the project root, against a server that may be written to:
+
+    python -m benchmarks.store_conformance [--redis URL] [--verbose]
+'''
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+
+from ta_bot.utils.redis_store import RedisMentorStore
+from ta_bot.utils.storage import open_store
+
+
+# snowflake-sized IDs, beyond the integers a Lua number holds exactly
+GUILD_ID = 2 ** 62 + 1
+OTHER_GUILD_ID = 2 ** 62 + 3
+CHANNEL_ID, OTHER_CHANNEL_ID = 2 ** 61 + 7, 2 ** 61 + 9
+# results whose order is not part of the contract are compared sorted
+UNORDERED = {'get_mentor_channels', 'get_all_channels',
+             'iter_mentor_channels', 'get_dashboards',
+             'get_all_users', 'iter_users', 'get_invites', 'get_grants',
+             'get_active_sessions', 'get_last_visits', 'get_stats'}
+
+
+class Recorder:
+    '''Wraps a store, recording the result of every call. Errors only need
+    to happen on both stores, as their types differ.'''
+
+    def __init__(self, store):
+        self.store = store
+        self.results = []
+
+    def __getattr__(self, method: str):
+        def call(*args):
+            try:
+                result = getattr(self.store, method)(*args)
+                if method.startswith('iter_'):
+                    result = list(result)
+                if method in UNORDERED:
+                    result = sorted(result)
+            except Exception:
+                result = 'error'
+            self.results.append((f'{method}{args}', result))
+            return result
+        return call
+
+
+def channels_scenario(db: Recorder):
+    db.update_mentor_channel(GUILD_ID, CHANNEL_ID, 'Homework: 1')
+    db.update_mentor_channel(GUILD_ID, OTHER_CHANNEL_ID, None)
+    db.update_mentor_channel(OTHER_GUILD_ID, CHANNEL_ID, '')
+    db.get_mentor_channels(GUILD_ID)
+    db.get_mentor_channels(OTHER_GUILD_ID)
+    db.get_all_channels()
+    db.is_mentor_channel(GUILD_ID, CHANNEL_ID)
+    db.is_mentor_channel(GUILD_ID, 1)
+    db.import_channels([(GUILD_ID, CHANNEL_ID, 'replaced'),
+                        (GUILD_ID, 3, '=starts with equals'),
+                        (OTHER_GUILD_ID, 4, None)])
+    db.iter_mentor_channels()
+    db.iter_mentor_channels(GUILD_ID)
+    db.set_dashboard(GUILD_ID, CHANNEL_ID, 2 ** 60 + 5)
+    db.set_dashboard(GUILD_ID, 3, 11)
+    db.get_dashboards()
+    db.delete_dashboard(GUILD_ID, 3)
+    db.delete_mentor_channel(GUILD_ID, CHANNEL_ID)
+    db.get_dashboards()
+    db.get_mentor_channels(GUILD_ID)
+
+
+def queue_scenario(db: Recorder):
+    db.update_mentor_channel(GUILD_ID, CHANNEL_ID, 'queue')
+    # equal sort keys must be ordered by user ID as numbers
+    for user_id in (10, 8, 39, 1, 12):
+        db.add_user(GUILD_ID, user_id, CHANNEL_ID, 1000)
+    db.add_user(GUILD_ID, 2 ** 62 + 11, CHANNEL_ID, 999)
+    db.add_user(GUILD_ID, 5, CHANNEL_ID, 1300, 400)
+    db.add_user(GUILD_ID, 6, OTHER_CHANNEL_ID, 1500)
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.get_next_user(GUILD_ID, CHANNEL_ID)
+    db.get_user_info(GUILD_ID, 12, True)
+    db.get_user_info(GUILD_ID, 12, False)
+    db.get_user_info(GUILD_ID, 404, True)
+    db.get_user_info(GUILD_ID, 404, False)
+    db.make_active(GUILD_ID, 8)
+    db.make_active(GUILD_ID, 2 ** 62 + 11)
+    db.make_active(GUILD_ID, 404)
+    db.get_active_users(GUILD_ID, CHANNEL_ID)
+    db.get_user_info(GUILD_ID, 10, True)
+    db.set_priority(GUILD_ID, 39, 100)
+    db.set_priority(GUILD_ID, 404, 100)
+    db.skip_user(GUILD_ID, 1, 5000)
+    db.skip_user(GUILD_ID, 8, 5000)
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.delete_user(GUILD_ID, 10)
+    db.delete_user(GUILD_ID, 10)
+    db.delete_users(GUILD_ID, [12, 404])
+    db.get_all_users()
+    db.make_active(GUILD_ID, 8, False)
+    db.clear_active_users(GUILD_ID, CHANNEL_ID)
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.import_users([(GUILD_ID, 39, CHANNEL_ID, 1, 0, 0),
+                     (GUILD_ID, 20, CHANNEL_ID, 1000, True, 0),
+                     (GUILD_ID, 9, CHANNEL_ID, 1000, 0, 0),
+                     (OTHER_GUILD_ID, 9, CHANNEL_ID, 7, 0, 0)])
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.iter_users()
+    db.iter_users(OTHER_GUILD_ID)
+    db.run_batch([('add_user', (GUILD_ID, 30, CHANNEL_ID, 1000), {}),
+                  ('get_user_info', (GUILD_ID, 30, True), {}),
+                  ('make_active', (GUILD_ID, 30), {}),
+                  ('import_users', ([(GUILD_ID, 31, CHANNEL_ID, 3, 0, 0)], ),
+                   {})])
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.clear_users(GUILD_ID, CHANNEL_ID)
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.get_next_user(GUILD_ID, CHANNEL_ID)
+    db.get_all_users()
+    # last, as some test servers drop the connection after a script error
+    db.add_user(GUILD_ID, 6, OTHER_CHANNEL_ID, 2000)
+
+
+def history_scenario(db: Recorder):
+    db.add_user(GUILD_ID, 2, CHANNEL_ID, 100)
+    db.make_active(GUILD_ID, 2)
+    db.add_user(GUILD_ID, 4, CHANNEL_ID, 100)
+    db.add_invite(GUILD_ID, 4, CHANNEL_ID, 9, 450)
+    db.add_invite(GUILD_ID, 5, CHANNEL_ID, 9, 460)
+    db.get_invites()
+    db.delete_invite(GUILD_ID, 5)
+    db.delete_invite(GUILD_ID, 5)
+    db.get_invites()
+    db.add_event(GUILD_ID, CHANNEL_ID, 2, 'activate', 9, 500)
+    db.add_event(GUILD_ID, CHANNEL_ID, 4, 'activate', None, 600)
+    db.add_event(GUILD_ID, CHANNEL_ID, 2, 'activate', 8, 700)
+    db.add_event(GUILD_ID, CHANNEL_ID, 4, 'leave', None, 800)
+    db.get_active_sessions()
+    db.get_last_visits(0)
+    db.get_last_visits(650)
+    db.add_stat_sample(GUILD_ID, 'ta', 9, 'wait', 5)
+    db.add_stat_sample(GUILD_ID, 'ta', 9, 'wait', 5)
+    db.add_stat_sample(GUILD_ID, 'channel', CHANNEL_ID, 'session', 0)
+    db.get_stats()
+    db.add_grants(GUILD_ID, CHANNEL_ID, [2, 4])
+    db.add_grants(GUILD_ID, OTHER_CHANNEL_ID, [2])
+    db.delete_grants(GUILD_ID, CHANNEL_ID, [4, 404])
+    db.get_grants()
+    db.update_mentor_channel(GUILD_ID, CHANNEL_ID, 'history')
+    db.set_dashboard(GUILD_ID, CHANNEL_ID, 3)
+    db.delete_guild(GUILD_ID)
+    db.get_all_users()
+    db.get_invites()
+    db.get_grants()
+    db.get_dashboards()
+
+
+def legacy_scenario(db: Recorder):
+    '''Queues and descriptions written by older versions of the Redis
+    store, which it upgrades when opened. On SQLite, the same rows are
+    written through the store.'''
+    store = db.store
+    users = [(10, 1000), (8, 1000), (9, 990)]
+    if isinstance(store, RedisMentorStore):
+        g = f'{store.prefix}:{GUILD_ID}'
+        execute = store.client.execute
+        execute('SADD', f'{store.prefix}:guilds', GUILD_ID)
+        execute('HSET', f'{g}:channels', CHANNEL_ID, 'old description')
+        execute('HSET', f'{g}:channels', OTHER_CHANNEL_ID, '')
+        for user_id, queued_time in users:
+            execute('HSET', f'{g}:users', user_id,
+                    f'{CHANNEL_ID}:{queued_time}:0')
+            execute('ZADD', f'{g}:queued:{CHANNEL_ID}', queued_time, user_id)
+        execute('DEL', f'{store.prefix}:version')
+        db.store = RedisMentorStore(store.client, store.prefix)
+    else:
+        store.update_mentor_channel(GUILD_ID, CHANNEL_ID, 'old description')
+        store.update_mentor_channel(GUILD_ID, OTHER_CHANNEL_ID, None)
+        for user_id, queued_time in users:
+            store.add_user(GUILD_ID, user_id, CHANNEL_ID, queued_time)
+    db.get_mentor_channels(GUILD_ID)
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.make_active(GUILD_ID, 10)
+    db.delete_user(GUILD_ID, 9)
+    db.get_users(GUILD_ID, CHANNEL_ID)
+    db.clear_users(GUILD_ID, CHANNEL_ID)
+    db.get_all_users()
+
+
+SCENARIOS = [channels_scenario, queue_scenario, history_scenario,
+             legacy_scenario]
+
+
+def delete_prefix(store: RedisMentorStore):
+    cursor = '0'
+    while True:
+        cursor, keys = store.client.execute('SCAN', cursor,
+                                            'MATCH', f'{store.prefix}:*',
+                                            'COUNT', 1000)
+        if keys:
+            store.client.execute('DEL', *keys)
+        if cursor == '0':
+            return
+
+
+def main(redis_url: str, verbose: bool):
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for scenario in SCENARIOS:
+            name = scenario.__name__
+            prefix = f'conformance-{uuid.uuid4().hex}'
+            separator = '&' if '?' in redis_url else '?'
+            sqlite = Recorder(open_store(os.path.join(tmpdir,
+                                                      f'{name}.sqlite3')))
+            redis = Recorder(open_store(f'{redis_url}{separator}'
+                                        f'prefix={prefix}'))
+            try:
+                scenario(sqlite)
+                scenario(redis)
+            finally:
+                # start over on a fresh connection, see queue_scenario
+                redis.store.client.close()
+                delete_prefix(redis.store)
+                redis.store.close()
+                sqlite.store.close()
+
+            diffs = 0
+            for (call, expected), (_, actual) in zip(sqlite.results,
+                                                     redis.results):
+                if expected != actual:
+                    diffs += 1
+                    print(f'DIFF {name}: {call}\n'
+                          f'     sqlite: {expected!r}\n'
+                          f'     redis:  {actual!r}')
+                elif verbose:
+                    print(f'ok   {name}: {call} -> {expected!r}')
+            print(f'{name}: {len(sqlite.results)} calls, {diffs} differ')
+            failures += diffs
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--redis', default='redis://localhost:6379/15',
+                        help='server to test (default: %(default)s)')
+    parser.add_argument('--verbose', action='store_true',
+                        help='also print the calls that agree')
+    args = parser.parse_args()
+    sys.exit(1 if main(args.redis, args.verbose) else 0)
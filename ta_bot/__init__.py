@@ -4,14 +4,50 @@ import discord
 from discord.ext import commands
 from discord_slash import SlashCommand
 
+from .utils.rest_scheduler import RestScheduler
+from .utils.startup import StartupTimer, sync_commands_if_changed
 
-def setup_bot(prefix, intents=discord.Intents.default()):
-    bot = commands.Bot(command_prefix=commands.when_mentioned_or(prefix),
-                       intents=intents)
-    SlashCommand(bot, sync_commands=True)
 
-    cogs = [file.stem for file in pathlib.Path('ta_bot/cogs/').glob('*.py')]
-    for cog in cogs:
-        bot.load_extension(f'ta_bot.cogs.{cog}')
+COMMAND_HASH_FILE = 'database/slash_commands.sha256'
+
+
+def setup_bot(prefix,
+              intents=discord.Intents.default(),
+              shard_count: int=None,
+              shard_ids: list[int]=None,
+              sharded: bool=False,
+              sync_commands: bool=True):
+    '''Creates the bot and loads every cog. With `sharded`, or when shards
+    are given, an AutoShardedBot is used; `shard_ids` restricts the process
+    to some of the shards, as in cluster mode.'''
+    startup = StartupTimer()
+    if sharded or shard_count or shard_ids:
+        bot = commands.AutoShardedBot(
+            command_prefix=commands.when_mentioned_or(prefix),
+            intents=intents,
+            shard_count=shard_count,
+            shard_ids=shard_ids
+        )
+    else:
+        bot = commands.Bot(command_prefix=commands.when_mentioned_or(prefix),
+                           intents=intents)
+    bot.startup = startup
+    # commands are only synced when their definitions change, see below
+    slash = SlashCommand(bot, sync_commands=False)
+    # outbound API calls shared by every cog
+    bot.rest = RestScheduler()
+
+    with startup.phase('cog import'):
+        cogs = [file.stem
+                for file in pathlib.Path('ta_bot/cogs/').glob('*.py')]
+        for cog in cogs:
+            bot.load_extension(f'ta_bot.cogs.{cog}')
+
+    if sync_commands:
+        bot.loop.create_task(sync_commands_if_changed(bot,
+                                                      slash,
+                                                      COMMAND_HASH_FILE))
+    else:
+        startup.report()
 
     return bot
@@ -1,11 +1,31 @@
 import os
 
 from . import setup_bot
+from .cluster import run_clusters
+from .utils.logs import setup_logging
 
 
+setup_logging(fmt=os.environ.get('LOG_FORMAT') or 'text')
+
 bot_token = os.environ.get('DISCORD_BOT_TOKEN')
 bot_prefix = os.environ.get('COMMAND_PREFIX')
+# SHARD_COUNT may be a number or 'auto'; CLUSTERS > 1 splits the shards over
+# that many processes
+shard_count = os.environ.get('SHARD_COUNT')
+clusters = int(os.environ.get('CLUSTERS') or 1)
 
-bot = setup_bot(bot_prefix)
+if clusters > 1:
+    run_clusters(bot_token,
+                 bot_prefix,
+                 clusters,
+                 int(shard_count) if shard_count not in (None, '', 'auto')
+                 else None)
+else:
+    if shard_count == 'auto':
+        bot = setup_bot(bot_prefix, sharded=True)
+    elif shard_count:
+        bot = setup_bot(bot_prefix, shard_count=int(shard_count))
+    else:
+        bot = setup_bot(bot_prefix)
 
-bot.run(bot_token)
+    bot.run(bot_token)
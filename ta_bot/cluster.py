@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import signal
+
+import discord
+
+from . import setup_bot
+from .utils.logs import setup_logging
+
+
+def cluster_shard_ids(cluster_id: int, clusters: int, shard_count: int):
+    return list(range(cluster_id, shard_count, clusters))
+
+
+def recommended_shard_count(token: str):
+    '''Asks Discord how many shards the bot should use.'''
+    async def fetch():
+        http = discord.http.HTTPClient()
+        await http.static_login(token.strip(), bot=True)
+        try:
+            shards, _ = await http.get_bot_gateway()
+            return shards
+        finally:
+            await http.close()
+
+    return asyncio.get_event_loop().run_until_complete(fetch())
+
+
+def run_cluster(cluster_id: int,
+                clusters: int,
+                shard_count: int,
+                token: str,
+                prefix: str,
+                sync_commands: bool=True):
+    '''Runs the shards of one cluster in the current process.'''
+    setup_logging(fmt=os.environ.get('LOG_FORMAT') or 'text',
+                  cluster=cluster_id)
+    # every cluster serves its own metrics endpoint; port 0 lets each one
+    # pick a free port
+    base_port = int(os.environ.get('METRICS_PORT') or 9100)
+    if base_port:
+        os.environ['METRICS_PORT'] = str(base_port + cluster_id)
+
+    shard_ids = cluster_shard_ids(cluster_id, clusters, shard_count)
+    bot = setup_bot(prefix,
+                    shard_count=shard_count,
+                    shard_ids=shard_ids,
+                    # slash commands are global, so one cluster syncs them
+                    sync_commands=sync_commands and cluster_id == 0)
+    bot.run(token)
+
+
+def run_clusters(token: str, prefix: str, clusters: int, shard_count=None):
+    '''Splits the bot's shards over `clusters` processes and runs them until
+    interrupted. Shards are assigned round-robin, and since every guild
+    belongs to exactly one shard, each guild is handled by one process.'''
+    logger = logging.getLogger(__name__)
+    if not shard_count:
+        shard_count = recommended_shard_count(token)
+    shard_count = max(shard_count, clusters)
+    logger.info('Starting %d clusters for %d shards', clusters, shard_count)
+
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=run_cluster,
+                        args=(cluster_id, clusters, shard_count,
+                              token, prefix),
+                        name=f'cluster-{cluster_id}')
+        for cluster_id in range(clusters)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(*_):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    signal.signal(signal.SIGTERM, stop)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop()
+        for process in processes:
+            process.join()
@@ -1,11 +1,20 @@
+import asyncio
 import logging
-import traceback
 
 from discord.ext import commands
 from discord_slash.context import InteractionContext
 from discord_slash.error import SlashCommandError
 
-from ..utils import discord_embeds
+from ..utils import discord_embeds, metrics
+from ..utils.logs import ErrorAggregator
+
+
+def command_name(ctx):
+    name = str(getattr(ctx, 'command', None) or
+               getattr(ctx, 'custom_id', None))
+    if (subcommand := getattr(ctx, 'subcommand_name', None)):
+        name += f' {subcommand}'
+    return name
 
 
 class ErrorHandlerCog(commands.Cog):
@@ -15,6 +24,18 @@ class ErrorHandlerCog(commands.Cog):
         self.logger = logging.getLogger(__name__)
         self.bot.add_listener(self.on_error, name='on_command_error')
         self.bot.add_listener(self.on_error, name='on_slash_command_error')
+        # repeated errors are summarized at most once per interval
+        self.errors = ErrorAggregator(self.logger, interval=60)
+        self.flush_task = bot.loop.create_task(self.flush_errors())
+
+    def cog_unload(self):
+        self.flush_task.cancel()
+        self.errors.flush(force=True)
+
+    async def flush_errors(self):
+        while True:
+            await asyncio.sleep(self.errors.interval)
+            self.errors.flush()
 
     async def on_error(self, ctx, exception: Exception):
 
@@ -44,13 +65,15 @@ class ErrorHandlerCog(commands.Cog):
             await send_error('Command failed',
                              'An unexpected error happened.')
 
-        try:
-            raise exception
-        except Exception as ex:
-            self.logger.error('Caught exception in command {}: {}\n{}'.format(
-                              ctx.command,
-                              ex.with_traceback(ex.__traceback__),
-                              traceback.format_exc()))
+        # log what the command raised rather than discord.py's wrapper
+        original = getattr(exception, 'original', exception)
+        command = command_name(ctx)
+        metrics.command_errors.inc(command=command,
+                                   error=type(original).__name__)
+        self.errors.report(command,
+                           original,
+                           guild_id=ctx.guild and ctx.guild.id,
+                           user_id=ctx.author.id)
 
 
 def setup(bot):
@@ -1,4 +1,7 @@
 import asyncio
+import io
+import os
+import tempfile
 from datetime import datetime
 
 import discord
@@ -7,15 +10,36 @@ from discord_slash import cog_ext
 from discord_slash.context import ComponentContext, SlashContext
 from discord_slash.utils.manage_components import (create_button,
                                                    create_actionrow,
-                                                   create_select_option,
                                                    create_select)
 from discord_slash.model import (ButtonStyle,
                                  SlashCommandOptionType,
                                  ComponentType)
-from discord_slash.utils.manage_commands import create_option
+from discord_slash.utils.manage_commands import create_choice, create_option
 
-from ..utils.database import MentorDbConn
+from ..utils import metrics
+from ..utils.channel_registry import MentorChannelRegistry
+from ..utils.dashboard import DashboardUpdater
+from ..utils.database import AsyncMentorDbConn, current_timestamp
 from ..utils.discord_embeds import *
+from ..utils.locks import KeyedLocks
+from ..utils.members import MemberResolver
+from ..utils.mentor_queue import (FIRST_VISIT_WINDOW,
+                                  PRIORITY_CLASSES,
+                                  MentorQueues,
+                                  priority_class)
+from ..utils.permissions import ACTIVE_OVERWRITE, INVITE_OVERWRITE
+from ..utils.reconcile import OverwriteReconciler
+from ..utils.rest_scheduler import Priority
+from ..utils.snapshot import SnapshotError, read_snapshot, write_snapshot
+from ..utils.stats import StatsTracker, format_duration
+from ..utils.sharding import owns_guild
+from ..utils.sweeper import StaleRowSweeper
+from ..utils.timers import TimerHeap
+
+
+MENU_PAGE_SIZE = 25
+# one action row per invited user, and a message holds at most five
+MAX_INVITES = 5
 
 
 class MentorCog(commands.Cog, name='Mentor'):
@@ -23,41 +47,138 @@ class MentorCog(commands.Cog, name='Mentor'):
 
     def __init__(self, bot):
         self.bot = bot
-        self.db = MentorDbConn('database/mentors.sqlite3')
-        self.locks = {}
+        with bot.startup.phase('database open'):
+            # queue writes are written behind, so a short group-commit window
+            # costs nothing visible and merges bursts into one fsync
+            self.db = AsyncMentorDbConn(os.environ.get('MENTOR_STORE') or
+                                        'database/mentors.sqlite3',
+                                        group_commit_window=0.005)
+            self.queues = MentorQueues(self.db)
+            # in cluster mode, other processes own the other guilds' queues
+            self.queues.load(row for row in
+                             self.db.submit('get_all_users').result()
+                             if owns_guild(bot, row[0]))
+            self.queues.load_invites(row for row in
+                                     self.db.submit('get_invites').result()
+                                     if owns_guild(bot, row[0]))
+            self.stats = StatsTracker(self.db, self.queues)
+            visits = self.db.submit('get_last_visits',
+                                    current_timestamp() - FIRST_VISIT_WINDOW)
+            self.stats.load(
+                (row for row in self.db.submit('get_stats').result()
+                 if owns_guild(bot, row[0])),
+                (row for row in self.db.submit('get_active_sessions').result()
+                 if owns_guild(bot, row[0])),
+                (row for row in visits.result() if owns_guild(bot, row[0]))
+            )
+        self.channels = MentorChannelRegistry(self.db)
+        self.rest = bot.rest
+        self.members = MemberResolver(self.rest)
+        self.locks = KeyedLocks()
+        self.dashboards = DashboardUpdater(bot,
+                                           self.queues,
+                                           self.db,
+                                           self.rest)
+        self.dashboards.load(row for row in
+                             self.db.submit('get_dashboards').result()
+                             if owns_guild(bot, row[0]))
+        self.dashboards.start()
+        self.reconciler = OverwriteReconciler(self.db,
+                                              self.queues,
+                                              self.channels,
+                                              self.rest)
+        self.reconciler.load(row for row in
+                             self.db.submit('get_grants').result()
+                             if owns_guild(bot, row[0]))
+        self.reconcile_task = bot.loop.create_task(self.reconcile_on_startup())
+        self.sweeper = StaleRowSweeper(bot,
+                                       self.db,
+                                       self.queues,
+                                       self.channels,
+                                       self.dashboards,
+                                       self.stats)
+        self.sweeper.start()
+        # unanswered invites expire after this many seconds
+        self.invite_timeout = int(os.environ.get('INVITE_TIMEOUT') or 300)
+        self.invite_timers = TimerHeap(self.expire_invite)
+        for guild_id, user_id in self.queues.invites:
+            self.schedule_invite_expiry(guild_id, user_id)
+        # overdue invites can only be expired once the guilds are cached
+        self.invite_timers.start(bot.loop, bot.wait_until_ready)
+        metrics.queue_length.add_collector(self.collect_queue_lengths)
+        metrics.member_lookups.add_collector(self.collect_member_lookups)
+
+    def cog_unload(self):
+        metrics.queue_length.remove_collector(self.collect_queue_lengths)
+        metrics.member_lookups.remove_collector(self.collect_member_lookups)
+        self.dashboards.stop()
+        self.reconcile_task.cancel()
+        self.sweeper.stop()
+        self.invite_timers.stop()
+        self.db.close()
+
+    async def reconcile_on_startup(self):
+        await self.bot.wait_until_ready()
+        await self.reconciler.reconcile_all(self.bot.guilds)
+
+    def collect_queue_lengths(self):
+        return {key: len(queue.queued)
+                for key, queue in list(self.queues.channels.items())}
+
+    def collect_member_lookups(self):
+        return {(outcome, ): count
+                for outcome, count in self.members.stats.items()}
 
-    def disabled_components(self, components: list[dict]):
+    def disabled_components(self,
+                            components: list[dict],
+                            user_id: int=None):
+        '''Disables every component, or only the buttons of one user in an
+        invite message.'''
         result = []
         for action_row in components:
             new_comps = []
             for component in action_row['components']:
                 disabled_comp = component
-                disabled_comp['disabled'] = True
+                if (user_id is None or
+                    f':{user_id}:' in component.get('custom_id', '')):
+                    disabled_comp['disabled'] = True
                 new_comps.append(disabled_comp)
             result.append(create_actionrow(*new_comps))
         return result
 
-    async def disable_all_components(self, ctx: ComponentContext):
-        components = self.disabled_components(ctx.origin_message.components)
-        await ctx.edit_origin(content=ctx.origin_message.content,
-                              components=components)
+    async def disable_all_components(self,
+                                     ctx: ComponentContext,
+                                     user_id: int=None):
+        components = self.disabled_components(ctx.origin_message.components,
+                                               user_id)
+        await self.rest.respond(ctx.edit_origin,
+                                content=ctx.origin_message.content,
+                                components=components)
 
-    def check_and_get_channel(self, ctx: commands.Context, channel_id: int):
+    async def check_and_get_channel(self,
+                                    ctx: commands.Context,
+                                    channel_id: int,
+                                    user_id: int=None):
         if channel_id:
             channel = ctx.guild.get_channel(channel_id)
             # check if it's a valid TA channel
             if (not channel or
-                not self.db.is_mentor_channel(ctx.guild.id, channel_id)):
-                self.db.delete_user(ctx.guild.id, ctx.author.id)
+                not await self.channels.is_mentor_channel(ctx.guild.id,
+                                                          channel_id)):
+                user_id = user_id or ctx.author.id
+                if self.queues.delete_user(ctx.guild.id, user_id):
+                    self.stats.record('remove', ctx.guild.id, channel_id,
+                                      user_id)
                 channel = None
         else:
             channel = None
         return channel
 
     async def setup_update(self, ctx: ComponentContext):
-        query = await ctx.send('Type the description for this channel, or '
-                               '`^C` to cancel:',
-                               hidden=True)
+        query = await self.rest.respond(ctx.send,
+                                        'Type the description for this '
+                                        'channel, or `^C` to cancel:',
+                                        hidden=True)
         try:
             def check_reply(msg):
                 return msg.author == ctx.author and msg.channel == ctx.channel
@@ -67,14 +188,20 @@ class MentorCog(commands.Cog, name='Mentor'):
                                             timeout=60)
             await reply.delete()
             if reply.content.strip().upper() == '^C':
-                await ctx.send('Operation cancelled.', hidden=True)
+                await self.rest.respond(ctx.send,
+                                        'Operation cancelled.',
+                                        hidden=True)
             else:
                 description = discord.utils.escape_markdown(
                     discord.utils.escape_mentions(reply.content)
                 )
-                self.db.update_mentor_channel(ctx.guild.id,
-                                              ctx.channel.id,
-                                              description)
+                # the lock is only taken after the reply arrives, so waiting
+                # for it never blocks other interactions
+                async with self.locks(('channel', ctx.guild.id,
+                                       ctx.channel.id)):
+                    await self.channels.update(ctx.guild.id,
+                                               ctx.channel.id,
+                                               description)
                 embed = embed_success(
                     'This channel has been updated',
                     f'{ctx.channel.mention} is now a TA mentor channel '
@@ -84,40 +211,88 @@ class MentorCog(commands.Cog, name='Mentor'):
                     text='Make sure you have set the correct '
                          'channel permissions!'
                 )
-                await ctx.send(embed=embed)
+                await self.rest.respond(ctx.send, embed=embed)
 
         except asyncio.TimeoutError:
-            await ctx.send('Operation cancelled.', hidden=True)
+            await self.rest.respond(ctx.send,
+                                    'Operation cancelled.',
+                                    hidden=True)
 
     async def setup_delete(self, ctx: ComponentContext):
-        self.db.delete_mentor_channel(ctx.guild.id, ctx.channel.id)
-        await ctx.send(embed=embed_success(
+        await self.dashboards.remove(ctx.guild.id, ctx.channel.id)
+        await self.channels.delete(ctx.guild.id, ctx.channel.id)
+        for user_id in self.queues.drop_channel(ctx.guild.id, ctx.channel.id):
+            self.stats.record('remove', ctx.guild.id, ctx.channel.id,
+                              user_id, ctx.author.id)
+        await self.rest.respond(ctx.send, embed=embed_success(
             'This channel has been updated',
             f'{ctx.channel.mention} is no longer a TA mentor channel.'
         ))
 
     async def setup_cancel(self, ctx: ComponentContext):
-        await ctx.edit_origin(content='Operation cancelled.',
-                              components=[])
+        await self.rest.respond(ctx.edit_origin,
+                                content='Operation cancelled.',
+                                components=[])
+
+    def join_menu(self, channel_list: list[dict], page: int):
+        '''Builds one page of the join menu. Select menus hold at most 25
+        options, so longer channel lists get previous/next buttons.'''
+        pages = (len(channel_list) - 1) // MENU_PAGE_SIZE + 1
+        page = max(0, min(page, pages - 1))
+        channel_menu = create_select(
+            options=channel_list[page * MENU_PAGE_SIZE:
+                                 (page + 1) * MENU_PAGE_SIZE],
+            min_values=1,
+            max_values=1,
+            custom_id='join-select'
+        )
+        components = [create_actionrow(channel_menu)]
+        text = 'Select a TA channel to join:'
+        if pages > 1:
+            text += f' (page {page + 1}/{pages})'
+            prev_btn = create_button(label='Previous',
+                                     style=ButtonStyle.secondary,
+                                     custom_id=f'join-page:{page - 1}',
+                                     disabled=page == 0)
+            next_btn = create_button(label='Next',
+                                     style=ButtonStyle.secondary,
+                                     custom_id=f'join-page:{page + 1}',
+                                     disabled=page == pages - 1)
+            components.append(create_actionrow(prev_btn, next_btn))
+        return text, components
 
-    async def join_queue(self, ctx: ComponentContext):
-        channel_id = int(ctx.selected_options[0].removeprefix('join-'))
+    async def join_page(self, ctx: ComponentContext, page: int):
+        channel_list = await self.channels.select_options(ctx.guild)
+        if not channel_list:
+            await self.rest.respond(ctx.edit_origin,
+                                    content='There are no TA channels for '
+                                            'you to join.',
+                                    components=[])
+            return
+        text, components = self.join_menu(channel_list, page)
+        await self.rest.respond(ctx.edit_origin,
+                                content=text,
+                                components=components)
+
+    async def join_queue(self, ctx: ComponentContext, channel_id: int):
         channel = ctx.guild.get_channel(channel_id)
         if (not channel or
-            not self.db.is_mentor_channel(ctx.guild.id, channel_id)):
-            await ctx.send(embed=embed_error(
+            not await self.channels.is_mentor_channel(ctx.guild.id,
+                                                      channel_id)):
+            await self.rest.respond(ctx.send, embed=embed_error(
                 'Invalid channel',
                 'The option you selected is no longer a valid TA channel.'
             ))
             return
 
-        qu_channel_id, is_active = self.db.get_user_info(ctx.guild.id,
-                                                         ctx.author.id,
-                                                         False)
-        qu_channel = self.check_and_get_channel(ctx, qu_channel_id)
+        qu_channel_id, is_active = self.queues.get_user_info(ctx.guild.id,
+                                                             ctx.author.id,
+                                                             False)
+        qu_channel = await self.check_and_get_channel(ctx, qu_channel_id)
 
         if qu_channel:
-            await ctx.send(
+            await self.rest.respond(
+                ctx.send,
                 embed=embed_error(
                     'Error',
                     f'You are already in the queue of {qu_channel.mention} or '
@@ -127,7 +302,17 @@ class MentorCog(commands.Cog, name='Mentor'):
             )
             return
 
-        self.db.add_user(ctx.guild.id, ctx.author_id, channel_id);
+        # users who were not helped recently get ahead of the others
+        first_visit = not self.stats.visited_since(
+            ctx.guild.id, ctx.author_id,
+            current_timestamp() - FIRST_VISIT_WINDOW
+        )
+        self.queues.add_user(ctx.guild.id,
+                             ctx.author_id,
+                             channel_id,
+                             PRIORITY_CLASSES['first visit'] if first_visit
+                             else PRIORITY_CLASSES['normal'])
+        self.stats.record('join', ctx.guild.id, channel_id, ctx.author_id)
         embed = embed_success(
             'Successfully joined',
             f'You have joined the queue for {channel.mention}.'
@@ -135,67 +320,129 @@ class MentorCog(commands.Cog, name='Mentor'):
         embed.set_footer(
             text='Hint: Use `/mentor query` to view your status.'
         )
-        await ctx.send(embed=embed, hidden=True)
+        await self.rest.respond(ctx.send, embed=embed, hidden=True)
+
+    async def invite_expired(self, ctx: ComponentContext, user_id: int):
+        await self.disable_all_components(ctx, user_id)
+        await self.rest.respond(ctx.send,
+                                'This invite is no longer valid.',
+                                hidden=True)
 
     async def next_join(self, ctx: ComponentContext, user_id: int, ta_id: int):
-        if ctx.author.id == user_id:
-            user = await ctx.guild.fetch_member(user_id)
-            self.db.make_active(ctx.guild.id, user_id)
-            await ctx.channel.set_permissions(user, send_messages=True)
-            await self.disable_all_components(ctx)
-            await ctx.send(embed=embed_success(
+        if (ctx.guild.id, user_id) not in self.queues.invites:
+            await self.invite_expired(ctx, user_id)
+        elif ctx.author.id == user_id:
+            if self.queues.make_active(ctx.guild.id, user_id):
+                self.stats.record('activate', ctx.guild.id, ctx.channel.id,
+                                  user_id, ta_id)
+            # answer before the rate-limited permission edit, so the
+            # interaction never misses its deadline
+            await self.disable_all_components(ctx, user_id)
+            await self.rest.respond(ctx.send, embed=embed_success(
                 'Active user',
-                f'{user.mention} has joined the channel.'
+                f'<@{user_id}> has joined the channel.'
             ))
+            await self.reconciler.edit_overwrites(ctx.channel,
+                                                  {user_id: ACTIVE_OVERWRITE})
         else:
             # ACK the interaction and silently ignore
-            await ctx.defer(edit_origin=True)
+            await self.rest.respond(ctx.defer, edit_origin=True)
 
     async def next_skip(self, ctx: ComponentContext, user_id: int, ta_id: int):
-        if ctx.author.id == user_id or ctx.author.id == ta_id:
-            user = await ctx.guild.fetch_member(user_id)
-            self.db.skip_user(ctx.guild.id, user_id)
-            await ctx.channel.set_permissions(user, overwrite=None)
-            await self.disable_all_components(ctx)
-            await ctx.send(embed=embed_success(
+        if (ctx.guild.id, user_id) not in self.queues.invites:
+            await self.invite_expired(ctx, user_id)
+        elif ctx.author.id == user_id or ctx.author.id == ta_id:
+            self.queues.skip_user(ctx.guild.id, user_id)
+            self.stats.record('skip', ctx.guild.id, ctx.channel.id,
+                              user_id, ta_id)
+            await self.disable_all_components(ctx, user_id)
+            await self.rest.respond(ctx.send, embed=embed_success(
                 'User skipped',
-                f'{user.mention} has been moved to the end of the queue.'
+                f'<@{user_id}> has been moved to the end of the queue.'
             ))
+            await self.reconciler.edit_overwrites(ctx.channel, {user_id: None})
         else:
             # ACK the interaction and silently ignore
-            await ctx.defer(edit_origin=True)
+            await self.rest.respond(ctx.defer, edit_origin=True)
 
     async def next_cancel(self,
                           ctx: ComponentContext,
                           user_id: int,
                           ta_id: int):
         if ctx.author.id == ta_id:
-            user = await ctx.guild.fetch_member(user_id)
-            await ctx.channel.set_permissions(user, overwrite=None)
-            await ctx.edit_origin(content='Operation cancelled.',
-                                  components=[])
+            self.queues.cancel_invite(ctx.guild.id, user_id)
+            self.stats.record('cancel', ctx.guild.id, ctx.channel.id,
+                              user_id, ta_id)
+            components = self.disabled_components(
+                ctx.origin_message.components, user_id
+            )
+            if any(not component.get('disabled')
+                   for action_row in components
+                   for component in action_row['components']):
+                # other users of a batch invite can still answer
+                await self.rest.respond(ctx.edit_origin,
+                                        content=ctx.origin_message.content,
+                                        components=components)
+            else:
+                await self.rest.respond(ctx.edit_origin,
+                                        content='Operation cancelled.',
+                                        components=[])
+            await self.reconciler.edit_overwrites(ctx.channel, {user_id: None})
         else:
             # ACK the interaction and silently ignore
-            await ctx.defer(edit_origin=True)
+            await self.rest.respond(ctx.defer, edit_origin=True)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after: discord.Member):
+        self.members.update(after)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.members.invalidate(member.guild.id, member.id)
+        self.sweeper.member_removed(member.guild.id, member.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self.members.invalidate(guild.id)
+        self.sweeper.guild_removed(guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        self.channels.invalidate(channel.guild.id)
+        self.sweeper.channel_deleted(channel.guild.id, channel.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(self, before, after):
+        if before.name != after.name or before.position != after.position:
+            self.channels.invalidate(after.guild.id)
 
     @commands.Cog.listener()
     async def on_component(self, ctx: ComponentContext):
-        lock = self.locks.get(ctx.guild.id)
-        if not lock:
-            lock = self.locks[ctx.guild.id] = asyncio.Lock()
-
-        async with lock:
-            if ctx.component_type == ComponentType.button:
-                if ctx.component_id == 'setup-update':
-                    await self.setup_update(ctx)
-                elif ctx.component_id == 'setup-delete':
+        async with metrics.track(ctx.component_id.split(':')[0]):
+            await self.handle_component(ctx)
+
+    async def handle_component(self, ctx: ComponentContext):
+        # Interactions only serialize with others on the same channel or
+        # user, and no lock is held while waiting for user input.
+        channel_key = ('channel', ctx.guild.id, ctx.channel.id)
+        if ctx.component_type == ComponentType.button:
+            if ctx.component_id == 'setup-update':
+                await self.setup_update(ctx)
+            elif ctx.component_id == 'setup-delete':
+                async with self.locks(channel_key):
                     await self.setup_delete(ctx)
-                elif ctx.component_id == 'setup-cancel':
-                    await self.setup_cancel(ctx)
+            elif ctx.component_id == 'setup-cancel':
+                await self.setup_cancel(ctx)
+
+            if ctx.component_id.startswith('join-page:'):
+                page = int(ctx.component_id.split(':')[1])
+                await self.join_page(ctx, page)
 
-                if ctx.component_id.startswith('next'):
-                    button_id, user_id, ta_id = ctx.component_id.split(':')
-                    user_id , ta_id = int(user_id), int(ta_id)
+            if ctx.component_id.startswith('next'):
+                button_id, user_id, ta_id = ctx.component_id.split(':')
+                user_id , ta_id = int(user_id), int(ta_id)
+                user_key = ('user', ctx.guild.id, user_id)
+                async with self.locks(channel_key, user_key):
                     if button_id == 'next-join':
                         await self.next_join(ctx, user_id, ta_id)
                     elif button_id == 'next-skip':
@@ -203,9 +450,16 @@ class MentorCog(commands.Cog, name='Mentor'):
                     elif button_id == 'next-cancel':
                         await self.next_cancel(ctx, user_id, ta_id)
 
-            elif ctx.component_type == ComponentType.select:
-                if ctx.component_id == 'join-select':
-                    await self.join_queue(ctx)
+        elif ctx.component_type == ComponentType.select:
+            if ctx.component_id == 'join-select':
+                channel_id = int(
+                    ctx.selected_options[0].removeprefix('join-')
+                )
+                # the channel lock keeps setup-delete from removing the
+                # channel between the check and the join
+                async with self.locks(('channel', ctx.guild.id, channel_id),
+                                      ('user', ctx.guild.id, ctx.author.id)):
+                    await self.join_queue(ctx, channel_id)
 
     @cog_ext.cog_slash(name='mentor',
                        description='Access TA mentoring')
@@ -216,15 +470,12 @@ class MentorCog(commands.Cog, name='Mentor'):
                             name='join',
                             description='Select a TA mentor channel and '
                                         'join the queue')
+    @metrics.timed('mentor join')
     async def mentor_join(self, ctx: SlashContext):
-        channel_list = [
-            create_select_option(label=f'#{ctx.guild.get_channel(cid).name}',
-                                 value=f'join-{cid}',
-                                 description=desc)
-            for cid, desc in self.db.get_mentor_channels(ctx.guild.id)
-        ]
+        channel_list = await self.channels.select_options(ctx.guild)
         if not channel_list:
-            await ctx.send(
+            await self.rest.respond(
+                ctx.send,
                 embed=embed_warning(
                     'No channels',
                     'There are no TA channels for you to join.'
@@ -233,25 +484,21 @@ class MentorCog(commands.Cog, name='Mentor'):
             )
             return
 
-        channel_menu = create_select(
-            options=channel_list,
-            min_values=1,
-            max_values=1,
-            custom_id='join-select'
-        )
-        action_row = create_actionrow(channel_menu)
-        await ctx.send('Select a TA channel to join:',
-                       components=[action_row],
-                       hidden=True)
+        text, components = self.join_menu(channel_list, 0)
+        await self.rest.respond(ctx.send,
+                                text,
+                                components=components,
+                                hidden=True)
 
     @cog_ext.cog_subcommand(base='mentor',
                             name='leave',
                             description='Leave a channel or queue')
+    @metrics.timed('mentor leave')
     async def mentor_leave(self, ctx: SlashContext):
-        channel_id, is_active = self.db.get_user_info(ctx.guild.id,
-                                                      ctx.author.id,
-                                                      False)
-        channel = self.check_and_get_channel(ctx, channel_id)
+        channel_id, is_active = self.queues.get_user_info(ctx.guild.id,
+                                                          ctx.author.id,
+                                                          False)
+        channel = await self.check_and_get_channel(ctx, channel_id)
 
         if not channel:
             result = embed_error(
@@ -260,8 +507,9 @@ class MentorCog(commands.Cog, name='Mentor'):
             )
 
         else:
-            self.db.delete_user(ctx.guild.id, ctx.author.id)
-            await channel.set_permissions(ctx.author, overwrite=None)
+            self.queues.delete_user(ctx.guild.id, ctx.author.id)
+            self.stats.record('leave', ctx.guild.id, channel.id,
+                              ctx.author.id)
             if is_active:
                 result = embed_success(
                     'Left active channel',
@@ -274,16 +522,20 @@ class MentorCog(commands.Cog, name='Mentor'):
                 )
 
         result.set_footer(text='Hint: Use `/mentor join` to join a channel.')
-        await ctx.send(embed=result, hidden=True)
+        await self.rest.respond(ctx.send, embed=result, hidden=True)
+        if channel:
+            await self.reconciler.edit_overwrites(channel,
+                                                  {ctx.author.id: None})
 
     @cog_ext.cog_subcommand(base='mentor',
                             name='query',
                             description='Query your current status')
+    @metrics.timed('mentor query')
     async def mentor_query(self, ctx: SlashContext):
-        channel_id, is_active, position = self.db.get_user_info(ctx.guild.id,
-                                                                ctx.author.id,
-                                                                True)
-        channel = self.check_and_get_channel(ctx, channel_id)
+        channel_id, is_active, position = self.queues.get_user_info(
+            ctx.guild.id, ctx.author.id, True
+        )
+        channel = await self.check_and_get_channel(ctx, channel_id)
 
         if not channel:
             result = embed_info(
@@ -300,21 +552,23 @@ class MentorCog(commands.Cog, name='Mentor'):
             result.set_footer(text='Hint: Use `/mentor leave` to leave.')
 
         else:
-            result = embed_info(
-                'In queue',
-                f'You have requested to join {channel.mention}. '
-                f'You are currently position #{position} in the queue.'
-            )
+            text = (f'You have requested to join {channel.mention}. '
+                    f'You are currently position #{position} in the queue.')
+            ahead = self.queues.queued_ahead(ctx.guild.id, ctx.author.id)
+            if (eta := self.stats.eta(ctx.guild.id, channel.id, ahead)):
+                text += f'\nEstimated wait: about {format_duration(eta)}.'
+            result = embed_info('In queue', text)
             result.set_footer(text='Hint: Use `/mentor leave` to leave.')
 
-        await ctx.send(embed=result, hidden=True)
+        await self.rest.respond(ctx.send, embed=result, hidden=True)
 
     @cog_ext.cog_subcommand(base='mentor',
                             name='setup',
                             description='Manages the current channel')
     @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor setup')
     async def mentor_setup(self, ctx: SlashContext):
-        if self.db.is_mentor_channel(ctx.guild.id, ctx.channel.id):
+        if await self.channels.is_mentor_channel(ctx.guild.id, ctx.channel.id):
             text = ('This channel is already a TA mentoring channel.\n'
                     'What would you like to do?')
             update_btn = create_button(label='Update',
@@ -339,9 +593,10 @@ class MentorCog(commands.Cog, name='Mentor'):
                                        custom_id='setup-cancel')
             action_row = create_actionrow(create_btn, cancel_btn)
 
-        await ctx.send(text,
-                       components=[action_row],
-                       hidden=True)
+        await self.rest.respond(ctx.send,
+                                text,
+                                components=[action_row],
+                                hidden=True)
 
     @cog_ext.cog_subcommand(base='mentor',
                             name='ls',
@@ -356,6 +611,7 @@ class MentorCog(commands.Cog, name='Mentor'):
                                 )
                             ])
     @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor ls')
     async def mentor_ls(self,
                         ctx: SlashContext,
                         channel: discord.TextChannel=None):
@@ -364,37 +620,38 @@ class MentorCog(commands.Cog, name='Mentor'):
         if not isinstance(channel, discord.TextChannel):
             raise commands.BadArgument(f'#{channel} is not a valid channel.')
 
-        if not self.db.is_mentor_channel(ctx.guild.id, channel.id):
+        if not await self.channels.is_mentor_channel(ctx.guild.id, channel.id):
             warning = embed_warning(
                 'Invalid channel',
                 f'{channel.mention} is not a mentoring channel.'
             )
             warning.set_footer(text='Hint: Use `/mentor setup` to configure.')
-            await ctx.send(embed=warning, hidden=True)
+            await self.rest.respond(ctx.send, embed=warning, hidden=True)
         else:
             async def get_usernames(user_ids):
-                for user_id in user_ids:
-                    if (user := await ctx.guild.fetch_member(user_id)):
-                        yield user.mention
-                    else:
-                        yield f'*(Invalid user {user_id})*'
-
-            active, inactive = self.db.get_users(ctx.guild.id, channel.id)
-            active_list = '\n'.join(
-                [name async for name in get_usernames(active)]
-            ) or '(No users)'
-            inactive_list = '\n'.join(
-                [name async for name in get_usernames(inactive)]
-            ) or '(No users)'
+                users = await self.members.get_many(ctx.guild, user_ids)
+                return [(user.mention if user else
+                         f'*(Invalid user {user_id})*') +
+                        self.priority_label(ctx.guild.id, user_id)
+                        for user_id, user in zip(user_ids, users)]
+
+            active, inactive = self.queues.get_users(ctx.guild.id,
+                                                     channel.id)
+            active_names, inactive_names = await asyncio.gather(
+                get_usernames(active),
+                get_usernames(inactive)
+            )
+            active_list = '\n'.join(active_names) or '(No users)'
+            inactive_list = '\n'.join(inactive_names) or '(No users)'
             embed = embed_info('User list', '')
             embed.add_field(name='Active', value=active_list, inline=True)
             embed.add_field(name='Queued', value=inactive_list, inline=True)
             embed.set_footer(text='Hint: use `/mentor rm` to remove a user.')
-            await ctx.send(embed=embed, hidden=True)
+            await self.rest.respond(ctx.send, embed=embed, hidden=True)
 
     @cog_ext.cog_subcommand(base='mentor',
                             name='rm',
-                            description='Remove a user from a channel '
+                            description='Remove users from their channel '
                                         'or queue',
                             options=[
                                 create_option(
@@ -402,49 +659,86 @@ class MentorCog(commands.Cog, name='Mentor'):
                                     description='The user to remove',
                                     option_type=SlashCommandOptionType.USER,
                                     required=True
-                                )
+                                ),
+                                *[create_option(
+                                    name=f'user{i}',
+                                    description='Another user to remove',
+                                    option_type=SlashCommandOptionType.USER,
+                                    required=False
+                                ) for i in range(2, 6)]
                             ])
     @commands.has_permissions(manage_channels=True)
-    async def mentor_rm(self, ctx: SlashContext, user: discord.Member):
-        channel_id, is_active = self.db.get_user_info(ctx.guild.id,
-                                                      user.id,
-                                                      False)
-        channel = self.check_and_get_channel(ctx, channel_id)
+    @metrics.timed('mentor rm')
+    async def mentor_rm(self,
+                        ctx: SlashContext,
+                        user: discord.Member,
+                        **more_users: discord.Member):
+        users = list({u.id: u for u in [user, *more_users.values()]}.values())
+        removed, missing, by_channel = [], [], {}
+        for user in users:
+            channel_id, is_active = self.queues.get_user_info(ctx.guild.id,
+                                                              user.id,
+                                                              False)
+            channel = await self.check_and_get_channel(ctx,
+                                                       channel_id,
+                                                       user.id)
+            if not channel:
+                missing.append(user)
+                continue
+            removed.append((user, channel, is_active))
+            by_channel.setdefault(channel, {})[user.id] = None
 
-        if not channel:
-            await ctx.send(
+        if not removed:
+            await self.rest.respond(
+                ctx.send,
                 embed=embed_error(
                     'Error',
-                    f'{user.mention} is not currently in any channel or queue.'
+                    ', '.join(user.mention for user in missing) +
+                    (' is' if len(missing) == 1 else ' are') +
+                    ' not currently in any channel or queue.'
                 ),
                 hidden=True
             )
             return
 
-        self.db.delete_user(ctx.guild.id, user.id)
-        await channel.set_permissions(user, overwrite=None)
+        with self.queues.batch():
+            for user, channel, _ in removed:
+                self.queues.delete_user(ctx.guild.id, user.id)
+                self.stats.record('remove', ctx.guild.id, channel.id,
+                                  user.id, ctx.author.id)
 
-        if is_active:
-            result = embed_success(
-                'User removed',
-                f'{user.mention} was removed from {channel.mention}.'
-            )
-        else:
-            result = embed_success(
-                'User removed',
-                f'{user.mention} was de-queued for {channel.mention}.'
-            )
-
-        await ctx.send(embed=result)
+        lines = [
+            f'{user.mention} was removed from {channel.mention}.'
+            if is_active else
+            f'{user.mention} was de-queued for {channel.mention}.'
+            for user, channel, is_active in removed
+        ]
+        lines += [f'{user.mention} is not in any channel or queue.'
+                  for user in missing]
+        result = embed_success(
+            'User removed' if len(removed) == 1 else 'Users removed',
+            '\n'.join(lines)
+        )
+        await self.rest.respond(ctx.send, embed=result)
+        await asyncio.gather(*(
+            self.reconciler.edit_overwrites(channel, changes)
+            for channel, changes in by_channel.items()
+        ))
 
     @cog_ext.cog_subcommand(base='mentor',
                             name='finish',
                             description='Finish the current mentoring session')
     @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor finish')
     async def mentor_finish(self, ctx: SlashContext):
-        active_users = self.db.get_active_users(ctx.guild.id, ctx.channel.id)
+        active_users = self.queues.clear_active_users(ctx.guild.id,
+                                                      ctx.channel.id)
+        for user_id in active_users:
+            self.stats.record('finish', ctx.guild.id, ctx.channel.id,
+                              user_id, ctx.author.id)
         if not active_users:
-            await ctx.send(
+            await self.rest.respond(
+                ctx.send,
                 embed=embed_warning(
                     'No active users',
                     'There are no active users in this channel!'
@@ -453,61 +747,588 @@ class MentorCog(commands.Cog, name='Mentor'):
             )
             return
 
-        for user_id in active_users:
-            self.db.delete_user(ctx.guild.id, user_id)
-            user = await ctx.guild.fetch_member(user_id)
-            if user:
-                await ctx.channel.set_permissions(user, overwrite=None)
-
-        await ctx.send(embed=embed_success(
+        await self.rest.respond(ctx.send, embed=embed_success(
             'Mentoring session ended',
             f'{len(active_users)} active users were removed from this channed.'
         ))
+        await self.reconciler.edit_overwrites(ctx.channel,
+                                              dict.fromkeys(active_users))
 
     @cog_ext.cog_subcommand(base='mentor',
-                            name='next',
-                            description='Invite the next user in the queue')
+                            name='clear',
+                            description='Remove all active and queued users '
+                                        'from this channel')
     @commands.has_permissions(manage_channels=True)
-    async def mentor_next(self, ctx: SlashContext):
-        user_id = self.db.get_next_user(ctx.guild.id, ctx.channel.id)
-        if not user_id:
-            await ctx.send(
-                embed=embed_info(
-                    'Empty queue',
-                    'There are no users in the queue for this channel!'
+    @metrics.timed('mentor clear')
+    async def mentor_clear(self, ctx: SlashContext):
+        active, queued = self.queues.clear_users(ctx.guild.id, ctx.channel.id)
+        for user_id in active + queued:
+            self.stats.record('clear', ctx.guild.id, ctx.channel.id,
+                              user_id, ctx.author.id)
+        if not active and not queued:
+            await self.rest.respond(
+                ctx.send,
+                embed=embed_warning(
+                    'No users',
+                    'There are no active or queued users in this channel!'
                 ),
                 hidden=True
             )
             return
 
-        user = await ctx.guild.fetch_member(user_id)
-        if not user:
-            self.db.delete_user(ctx.guild.id, user_id)
+        await self.rest.respond(ctx.send, embed=embed_success(
+            'Channel cleared',
+            f'{len(active)} active users and {len(queued)} queued users '
+            'were removed from this channel.'
+        ))
+        await self.reconciler.edit_overwrites(ctx.channel,
+                                              dict.fromkeys(active + queued))
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='dashboard',
+                            description='Toggle a live queue dashboard '
+                                        'in this channel')
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor dashboard')
+    async def mentor_dashboard(self, ctx: SlashContext):
+        if not await self.channels.is_mentor_channel(ctx.guild.id,
+                                                     ctx.channel.id):
+            warning = embed_warning(
+                'Invalid channel',
+                f'{ctx.channel.mention} is not a mentoring channel.'
+            )
+            warning.set_footer(text='Hint: Use `/mentor setup` to configure.')
+            await self.rest.respond(ctx.send, embed=warning, hidden=True)
+            return
+
+        # both deleting and posting a dashboard wait for REST calls
+        await self.rest.respond(ctx.defer, hidden=True)
+        if await self.dashboards.remove(ctx.guild.id, ctx.channel.id):
+            result = embed_success(
+                'Dashboard removed',
+                f'{ctx.channel.mention} no longer has a queue dashboard.'
+            )
+        else:
+            await self.dashboards.add(ctx.channel)
+            result = embed_success(
+                'Dashboard added',
+                f'The queue of {ctx.channel.mention} is now shown in a '
+                'pinned message that updates automatically.'
+            )
+        await self.rest.respond(ctx.send, embed=result, hidden=True)
+
+    async def invite_next(self,
+                          guild: discord.Guild,
+                          channel: discord.TextChannel,
+                          ta_id: int,
+                          count: int,
+                          priority: Priority=Priority.NORMAL):
+        '''Invites the next `count` uninvited users of a channel and grants
+        them access. Returns the invited members, and the IDs of claimed
+        users that were not valid members and were removed instead.'''
+        # claiming is synchronous, so concurrent invites never pick the same
+        # users, and the claims are persisted in one transaction
+        user_ids = self.queues.invite_users(guild.id, channel.id, ta_id, count)
+        if not user_ids:
+            return [], []
+
+        members = await self.members.get_many(guild, user_ids)
+        users, invalid = [], []
+        with self.queues.batch():
+            for user_id, user in zip(user_ids, members):
+                if user:
+                    users.append(user)
+                    self.stats.record('invite', guild.id, channel.id,
+                                      user_id, ta_id)
+                    self.schedule_invite_expiry(guild.id, user_id)
+                else:
+                    invalid.append(user_id)
+                    self.queues.delete_user(guild.id, user_id)
+                    self.stats.record('remove', guild.id, channel.id,
+                                      user_id, ta_id)
+        if users:
+            # one channel edit grants every invited user access
+            await self.reconciler.edit_overwrites(channel,
+                                                  {user.id: INVITE_OVERWRITE
+                                                   for user in users},
+                                                  priority)
+        return users, invalid
+
+    def schedule_invite_expiry(self, guild_id: int, user_id: int):
+        invite = self.queues.invites[guild_id, user_id]
+        self.invite_timers.schedule(
+            (guild_id, user_id, invite.invited_time),
+            invite.invited_time + self.invite_timeout * 1000
+        )
+
+    async def expire_invite(self, key: tuple[int, int, int]):
+        '''Moves a user who did not answer their invite to the end of the
+        queue, and invites the next user in their place.'''
+        guild_id, user_id, invited_time = key
+        if (not (invite := self.queues.invites.get((guild_id, user_id))) or
+            invite.invited_time != invited_time):
+            return
+        channel_key = ('channel', guild_id, invite.channel_id)
+        async with self.locks(channel_key, ('user', guild_id, user_id)):
+            if self.queues.invites.get((guild_id, user_id)) != invite:
+                return
+            self.queues.skip_user(guild_id, user_id)
+            self.stats.record('expire', guild_id, invite.channel_id,
+                              user_id, invite.ta_id)
+            if (not (guild := self.bot.get_guild(guild_id)) or
+                not (channel := guild.get_channel(invite.channel_id))):
+                return
+            await self.reconciler.edit_overwrites(channel,
+                                                  {user_id: None},
+                                                  Priority.BACKGROUND)
+
+            text = (f'<@{user_id}> did not answer in time and was moved to '
+                    'the end of the queue.')
+            components = []
+            # don't invite the same user again if they are the only one left
+            if self.queues.next_uninvited(guild_id, channel.id, 1) not in (
+                [], [user_id]
+            ):
+                users, _ = await self.invite_next(guild,
+                                                  channel,
+                                                  invite.ta_id,
+                                                  1,
+                                                  Priority.BACKGROUND)
+                if users:
+                    invite_text, components = self.invite_message(
+                        users, invite.ta_id
+                    )
+                    text += '\n' + invite_text
+            await self.rest.run(lambda: channel.send(text,
+                                                     components=components),
+                                Priority.BACKGROUND)
+
+    def invite_message(self, users: list[discord.Member], ta_id: int):
+        mentions = ', '.join(user.mention for user in users)
+        if len(users) == 1:
+            text = (f'{mentions}, it\'s your turn to join this channel!\n'
+                    'Please select an option:')
+            button_ids = f':{users[0].id}:{ta_id}'
+            join_btn   = create_button(label='Join',
+                                       style=ButtonStyle.success,
+                                       custom_id='next-join' + button_ids)
+            skip_btn   = create_button(label='Skip',
+                                       style=ButtonStyle.danger,
+                                       custom_id='next-skip' + button_ids)
+            action_row1 = create_actionrow(join_btn, skip_btn)
+            cancel_btn = create_button(label='Cancel (TA)',
+                                       style=ButtonStyle.secondary,
+                                       custom_id='next-cancel' + button_ids)
+            action_row2 = create_actionrow(cancel_btn)
+            return text, [action_row1, action_row2]
+
+        text = (f'{mentions}, it\'s your turn to join this channel!\n'
+                'Please select an option next to your name:')
+        action_rows = []
+        for user in users:
+            button_ids = f':{user.id}:{ta_id}'
+            join_btn   = create_button(label=f'Join: {user.display_name}'[:80],
+                                       style=ButtonStyle.success,
+                                       custom_id='next-join' + button_ids)
+            skip_btn   = create_button(label='Skip',
+                                       style=ButtonStyle.danger,
+                                       custom_id='next-skip' + button_ids)
+            cancel_btn = create_button(label='Cancel (TA)',
+                                       style=ButtonStyle.secondary,
+                                       custom_id='next-cancel' + button_ids)
+            action_rows.append(create_actionrow(join_btn,
+                                                skip_btn,
+                                                cancel_btn))
+        return text, action_rows
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='next',
+                            description='Invite the next users in the queue',
+                            options=[
+                                create_option(
+                                    name='count',
+                                    description='How many users to invite, '
+                                                f'up to {MAX_INVITES}. '
+                                                'Defaults to 1.',
+                                    option_type=SlashCommandOptionType.INTEGER,
+                                    required=False
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor next')
+    async def mentor_next(self, ctx: SlashContext, count: int=1):
+        if not 1 <= count <= MAX_INVITES:
+            raise commands.BadArgument(
+                f'You can invite 1 to {MAX_INVITES} users at a time.'
+            )
+        empty = embed_info(
+            'Empty queue',
+            'There are no uninvited users in the queue for this channel!'
+        )
+        if not self.queues.next_uninvited(ctx.guild.id, ctx.channel.id, 1):
+            await self.rest.respond(ctx.send, embed=empty, hidden=True)
+            return
+
+        # invited users are granted access before they are mentioned, so
+        # answer the interaction first instead of waiting for the edit
+        await self.rest.respond(ctx.defer)
+        users, invalid = await self.invite_next(ctx.guild,
+                                                ctx.channel,
+                                                ctx.author.id,
+                                                count)
+        if not users and not invalid:
+            # another TA invited the remaining users in the meantime
+            await self.rest.respond(ctx.send, embed=empty)
+            return
+        if not users:
             embed = embed_error(
                 'Invalid user',
                 'The next user in the queue is not a valid member. '
                 'They have been removed from the queue.'
+                if len(invalid) == 1 else
+                'The next users in the queue are not valid members. '
+                'They have been removed from the queue.'
             )
-            await ctx.send(embed=embed, hidden=True)
+            await self.rest.respond(ctx.send, embed=embed)
             return
 
-        await ctx.channel.set_permissions(user, read_messages=True)
-        text = (f'{user.mention}, it\'s your turn to join this channel!\n'
-                'Please select an option:')
-        button_ids = f':{user.id}:{ctx.author.id}'
-        join_btn   = create_button(label='Join',
-                                   style=ButtonStyle.success,
-                                   custom_id='next-join' + button_ids)
-        skip_btn   = create_button(label='Skip',
-                                   style=ButtonStyle.danger,
-                                   custom_id='next-skip' + button_ids)
-        action_row1 = create_actionrow(join_btn, skip_btn)
-        cancel_btn = create_button(label='Cancel (TA)',
-                                   style=ButtonStyle.secondary,
-                                   custom_id='next-cancel' + button_ids)
-        action_row2 = create_actionrow(cancel_btn)
-
-        await ctx.send(text, components=[action_row1, action_row2])
+        text, components = self.invite_message(users, ctx.author.id)
+        if invalid:
+            text += (f'\n({len(invalid)} invalid members were removed from '
+                     'the queue.)')
+        await self.rest.respond(ctx.send, text, components=components)
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='reconcile',
+                            description='Repair channel permissions that '
+                                        'do not match the queues',
+                            options=[
+                                create_option(
+                                    name='dry_run',
+                                    description='Only report the drift '
+                                                'without repairing it',
+                                    option_type=SlashCommandOptionType.BOOLEAN,
+                                    required=False
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor reconcile')
+    async def mentor_reconcile(self, ctx: SlashContext, dry_run: bool=False):
+        await self.rest.respond(ctx.defer, hidden=True)
+        report = await self.reconciler.reconcile_guild(ctx.guild, dry_run)
+        found = report.stale + report.missing
+        if not found:
+            embed = embed_success(
+                'No drift',
+                f'The permissions of all {report.channels} mentor channels '
+                'match their queues.'
+            )
+        elif dry_run:
+            embed = embed_warning(
+                'Drift found',
+                f'{report.stale} stale and {report.missing} missing '
+                f'overwrites in {report.channels} mentor channels.'
+            )
+            embed.set_footer(text='Hint: Run without `dry_run` to fix them.')
+        else:
+            embed = (embed_warning if report.failed else embed_success)(
+                'Permissions repaired',
+                f'{report.stale} stale and {report.missing} missing '
+                f'overwrites found, {report.fixed} fixed.' +
+                (f' {report.failed} channels could not be edited.'
+                 if report.failed else '')
+            )
+        await self.rest.respond(ctx.send, embed=embed, hidden=True)
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='sweep',
+                            description='Remove queue entries of deleted '
+                                        'channels and departed members',
+                            options=[
+                                create_option(
+                                    name='dry_run',
+                                    description='Only report the stale '
+                                                'entries without removing '
+                                                'them',
+                                    option_type=SlashCommandOptionType.BOOLEAN,
+                                    required=False
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor sweep')
+    async def mentor_sweep(self, ctx: SlashContext, dry_run: bool=False):
+        await self.rest.respond(ctx.defer, hidden=True)
+        report = await self.sweeper.sweep(dry_run,
+                                          full=True,
+                                          guild_id=ctx.guild.id)
+        found = (f'{report.channels} deleted channels and '
+                 f'{report.users} stale queue entries')
+        if not report:
+            embed = embed_success('Nothing to sweep',
+                                  'No stale queue entries were found.')
+        elif dry_run:
+            embed = embed_warning('Stale entries found', f'Found {found}.')
+            embed.set_footer(text='Hint: Run without `dry_run` to remove '
+                                  'them.')
+        else:
+            embed = embed_success('Stale entries removed',
+                                  f'Removed {found}.')
+        await self.rest.respond(ctx.send, embed=embed, hidden=True)
+
+    def stats_field(self, summary):
+        if not summary:
+            return '(No data)'
+        count, p50, p90, p99 = summary
+        return (f'{count} recorded\n'
+                f'median {format_duration(p50)}\n'
+                f'p90 {format_duration(p90)}\n'
+                f'p99 {format_duration(p99)}')
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='stats',
+                            description='Show wait and session statistics',
+                            options=[
+                                create_option(
+                                    name='channel',
+                                    description='The channel to show. '
+                                                'Defaults to the current one.',
+                                    option_type=SlashCommandOptionType.CHANNEL,
+                                    required=False
+                                ),
+                                create_option(
+                                    name='ta',
+                                    description='Show a TA instead of a '
+                                                'channel',
+                                    option_type=SlashCommandOptionType.USER,
+                                    required=False
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor stats')
+    async def mentor_stats(self,
+                           ctx: SlashContext,
+                           channel: discord.TextChannel=None,
+                           ta: discord.Member=None):
+        if ta:
+            scope, scope_id = 'ta', ta.id
+            embed = embed_info('Statistics', f'Sessions led by {ta.mention}')
+        else:
+            channel = channel or ctx.channel
+            scope, scope_id = 'channel', channel.id
+            embed = embed_info('Statistics', f'Queue of {channel.mention}')
+
+        for metric, name in (('wait', 'Wait time'),
+                             ('session', 'Session length')):
+            summary = self.stats.summary(ctx.guild.id, scope, scope_id, metric)
+            embed.add_field(name=name,
+                            value=self.stats_field(summary),
+                            inline=True)
+
+        if not ta:
+            lines = []
+            for ta_id in self.stats.ta_ids(ctx.guild.id)[:5]:
+                if (summary := self.stats.summary(ctx.guild.id, 'ta', ta_id,
+                                                  'session')):
+                    lines.append(f'<@{ta_id}>: {summary[0]} sessions, '
+                                 f'median {format_duration(summary[1])}')
+            embed.add_field(name='TAs in this server',
+                            value='\n'.join(lines) or '(No data)',
+                            inline=False)
+        embed.set_footer(text='Percentiles are accurate to within 2%.')
+        await self.rest.respond(ctx.send, embed=embed, hidden=True)
+
+    def priority_label(self, guild_id: int, user_id: int):
+        entry = self.queues.users.get((guild_id, user_id))
+        if not entry or entry.is_active or not entry.priority:
+            return ''
+        return f' ({priority_class(entry.priority)})'
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='boost',
+                            description='Change the priority of a queued '
+                                        'user',
+                            options=[
+                                create_option(
+                                    name='user',
+                                    description='The user to move',
+                                    option_type=SlashCommandOptionType.USER,
+                                    required=True
+                                ),
+                                create_option(
+                                    name='priority',
+                                    description='The priority class. '
+                                                'Defaults to boost.',
+                                    option_type=SlashCommandOptionType.STRING,
+                                    required=False,
+                                    choices=[
+                                        create_choice(name=name, value=name)
+                                        for name in PRIORITY_CLASSES
+                                    ]
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor boost')
+    async def mentor_boost(self,
+                           ctx: SlashContext,
+                           user: discord.Member,
+                           priority: str='boost'):
+        channel_id, is_active = self.queues.get_user_info(ctx.guild.id,
+                                                          user.id,
+                                                          False)
+        if not channel_id or is_active:
+            raise commands.BadArgument(f'{user} is not waiting in a queue.')
+
+        self.queues.set_priority(ctx.guild.id,
+                                 user.id,
+                                 PRIORITY_CLASSES[priority])
+        self.stats.record('boost', ctx.guild.id, channel_id, user.id,
+                          ctx.author.id)
+        _, _, position = self.queues.get_user_info(ctx.guild.id,
+                                                   user.id,
+                                                   True)
+        embed = embed_success(
+            'Priority changed',
+            f'{user.mention} now has {priority} priority and is position '
+            f'#{position} in the queue for <#{channel_id}>.'
+        )
+        await self.rest.respond(ctx.send, embed=embed, hidden=True)
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='export',
+                            description='Download the mentor channels and '
+                                        'queues of this server',
+                            options=[
+                                create_option(
+                                    name='users',
+                                    description='Include queued users. '
+                                                'Defaults to true.',
+                                    option_type=SlashCommandOptionType.BOOLEAN,
+                                    required=False
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor export')
+    async def mentor_export(self, ctx: SlashContext, users: bool=True):
+        await self.rest.respond(ctx.defer, hidden=True)
+        guild_id = ctx.guild.id
+        channel_rows = [
+            (guild_id, channel_id, description)
+            for channel_id, description in
+            (await self.channels.get_channels(guild_id)).items()
+        ]
+        user_rows = (
+            (guild_id, user_id, entry.channel_id, entry.queued_time,
+             entry.is_active, entry.priority)
+            for (guild, user_id), entry in self.queues.users.items()
+            if guild == guild_id
+        ) if users else ()
+        # large snapshots are written to disk instead of kept in memory
+        file = tempfile.TemporaryFile()
+        text = io.TextIOWrapper(file, encoding='utf-8')
+        channel_count, user_count = write_snapshot(text,
+                                                   channel_rows,
+                                                   user_rows)
+        text.flush()
+        text.detach()
+        file.seek(0)
+        embed = embed_success(
+            'Snapshot exported',
+            f'{channel_count} mentor channels and {user_count} queued '
+            'users. Use `/mentor import` to restore them.'
+        )
+        await self.rest.respond(ctx.send,
+                                embed=embed,
+                                file=discord.File(file,
+                                                  f'mentors-{guild_id}.jsonl'),
+                                hidden=True)
+
+    @cog_ext.cog_subcommand(base='mentor',
+                            name='import',
+                            description='Set up mentor channels from an '
+                                        'uploaded config or snapshot',
+                            options=[
+                                create_option(
+                                    name='users',
+                                    description='Also restore the queued '
+                                                'users of a snapshot',
+                                    option_type=SlashCommandOptionType.BOOLEAN,
+                                    required=False
+                                )
+                            ])
+    @commands.has_permissions(manage_channels=True)
+    @metrics.timed('mentor import')
+    async def mentor_import(self, ctx: SlashContext, users: bool=False):
+        await self.rest.respond(ctx.send,
+                                'Upload a snapshot from `/mentor export` or a '
+                                'CSV file with `channel_id,description` '
+                                'columns in this channel, or type `^C` to '
+                                'cancel:',
+                                hidden=True)
+
+        def check_reply(msg):
+            return msg.author == ctx.author and msg.channel == ctx.channel
+
+        try:
+            reply = await self.bot.wait_for('message',
+                                            check=check_reply,
+                                            timeout=60)
+        except asyncio.TimeoutError:
+            reply = None
+        if not reply or reply.content.strip().upper() == '^C':
+            if reply:
+                await reply.delete()
+            await self.rest.respond(ctx.send,
+                                    'Operation cancelled.',
+                                    hidden=True)
+            return
+        if not reply.attachments:
+            await reply.delete()
+            raise commands.BadArgument('No file was uploaded.')
+        data = await reply.attachments[0].read()
+        await reply.delete()
+
+        guild_id = ctx.guild.id
+        channel_rows, user_rows = [], []
+        skipped = 0
+        try:
+            for kind, row in read_snapshot(
+                data.decode('utf-8-sig').splitlines(), guild_id
+            ):
+                if row[0] != guild_id:
+                    skipped += 1
+                elif kind == 'channel':
+                    if isinstance(ctx.guild.get_channel(row[1]),
+                                  discord.TextChannel):
+                        channel_rows.append(row)
+                    else:
+                        skipped += 1
+                elif users:
+                    user_rows.append(row)
+        except (SnapshotError, UnicodeDecodeError) as ex:
+            raise commands.BadArgument(f'Invalid file: {ex}') from None
+
+        channels = 0
+        if channel_rows:
+            channels = await self.channels.import_channels(guild_id,
+                                                           channel_rows)
+        restored = 0
+        if user_rows:
+            mentor_channels = await self.channels.get_channels(guild_id)
+            restored = self.queues.import_users(
+                row for row in user_rows if row[2] in mentor_channels
+            )
+            skipped += len(user_rows) - restored
+            # grant the restored active users their overwrites
+            await self.reconciler.reconcile_guild(ctx.guild)
+        embed = embed_success(
+            'Snapshot imported',
+            f'{channels} mentor channels set up and {restored} queued users '
+            'restored.'
+        )
+        if skipped:
+            embed.set_footer(text=f'{skipped} rows of other servers, missing '
+                                  'channels or queued users were skipped.')
+        await self.rest.respond(ctx.send, embed=embed, hidden=True)
 
 
 def setup(bot):
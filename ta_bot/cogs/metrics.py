@@ -0,0 +1,54 @@
+import logging
+import os
+
+from discord.ext import commands
+
+from ..utils import metrics
+
+
+class MetricsCog(commands.Cog, name='Metrics'):
+    '''Serves bot metrics in the Prometheus text format'''
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.logger = logging.getLogger(__name__)
+        self.server = None
+        self.host = os.environ.get('METRICS_HOST') or '127.0.0.1'
+        self.port = int(os.environ.get('METRICS_PORT') or 9100)
+
+        # count every Discord HTTP call, whichever cog makes it
+        self.original_request = bot.http.request
+
+        async def request(route, **kwargs):
+            metrics.discord_requests.inc(method=route.method,
+                                         route=route.path)
+            return await self.original_request(route, **kwargs)
+        bot.http.request = request
+
+        metrics.rest_queue_depth.add_collector(self.collect_rest_depths)
+        self.start_task = bot.loop.create_task(self.start_server())
+
+    async def start_server(self):
+        try:
+            self.server = await metrics.serve(self.host, self.port)
+        except OSError as ex:
+            self.logger.error('Could not serve metrics on %s:%d: %s',
+                              self.host, self.port, ex)
+        else:
+            self.logger.info('Serving metrics on http://%s:%d/metrics',
+                             self.host, self.port)
+
+    def collect_rest_depths(self):
+        return {(bucket or 'none', ): depth
+                for bucket, depth in self.bot.rest.queue_depths().items()}
+
+    def cog_unload(self):
+        self.bot.http.request = self.original_request
+        metrics.rest_queue_depth.remove_collector(self.collect_rest_depths)
+        self.start_task.cancel()
+        if self.server:
+            self.server.close()
+
+
+def setup(bot):
+    bot.add_cog(MetricsCog(bot))
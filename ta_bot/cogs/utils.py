@@ -3,19 +3,44 @@ from copy import copy
 import discord
 from discord.ext import commands
 
+from ..utils.profiling import PROFILER
+
 
 class UtilsCog(commands.Cog, name='Utils'):
     '''Some bot utilities'''
 
     def __init__(self, bot):
         self.bot = bot
-        
+
     @commands.command(brief='Pings the bot')
     async def ping(self, ctx):
         '''Get the latency of the bot'''
         latency_ms = self.bot.latency * 1000
         await ctx.send(f'Pong! {latency_ms:.1f} ms')
 
+    @commands.command(brief='Profiles slow commands')
+    @commands.is_owner()
+    async def profile(self,
+                      ctx,
+                      minutes: float=5,
+                      threshold_ms: int=500,
+                      sample_rate: float=1.0):
+        '''Profile slash commands and components for a number of minutes.
+        Invocations slower than the threshold have their call breakdown
+        written to the profiles directory. Use 0 minutes to stop.'''
+        if minutes <= 0:
+            PROFILER.disable()
+            await ctx.send(f'Profiling stopped. {PROFILER.written} slow '
+                           'commands were recorded.')
+            return
+        if not 0 < sample_rate <= 1:
+            raise commands.BadArgument('The sample rate must be in (0, 1].')
+
+        PROFILER.enable(minutes * 60, threshold_ms / 1000, sample_rate)
+        await ctx.send(f'Profiling commands for {minutes:g} minutes. '
+                       f'Commands slower than {threshold_ms} ms are written '
+                       f'to `{PROFILER.directory}/`.')
+
 
 def setup(bot):
     bot.add_cog(UtilsCog(bot))
@@ -0,0 +1,89 @@
+'''Exports and imports mentor channels and queues, e.g. to set up a new term
+from a channel config or to move the bot to another host. The store is read
+from MENTOR_STORE like the bot does, unless --store is given.
+
+    python -m ta_bot.snapshot export [--guild ID] [--no-users] [-o FILE]
+    python -m ta_bot.snapshot import [--guild ID] [--no-users] FILE
+
+Exports are JSON lines, written as the rows are read. Imports take an export
+or a CSV channel config with a `channel_id,description[,guild_id]` header;
+--guild supplies the guild of rows without one. Existing channels are
+updated and users who are already queued are kept. Queues should only be
+imported while the bot is stopped, since it keeps them in memory.
+'''
+
+import argparse
+import os
+import sys
+
+from .utils.snapshot import SnapshotError, import_snapshot, read_snapshot
+from .utils.snapshot import write_snapshot
+from .utils.storage import open_store
+
+
+def export_store(args):
+    store = open_store(args.store)
+    out = (open(args.output, 'w', encoding='utf-8') if args.output
+           else sys.stdout)
+    try:
+        users = () if args.no_users else store.iter_users(args.guild)
+        channels, users = write_snapshot(
+            out, store.iter_mentor_channels(args.guild), users
+        )
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        store.close()
+    print(f'Exported {channels} channels and {users} queued users',
+          file=sys.stderr)
+
+
+def import_store(args):
+    store = open_store(args.store)
+    try:
+        with open(args.file, encoding='utf-8-sig', newline='') as file:
+            with store.transaction():
+                channels, users = import_snapshot(
+                    store, read_snapshot(file, args.guild),
+                    users=not args.no_users
+                )
+    finally:
+        store.close()
+    print(f'Imported {channels} channels and {users} queued users',
+          file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m ta_bot.snapshot',
+        description='Export or import mentor channels and queues.'
+    )
+    parser.add_argument('--store',
+                        default=os.environ.get('MENTOR_STORE') or
+                        'database/mentors.sqlite3',
+                        help='SQLite file or redis:// URL (default: '
+                             'MENTOR_STORE)')
+    parser.add_argument('--guild', type=int,
+                        help='only export this guild, or the guild of '
+                             'imported rows without one')
+    parser.add_argument('--no-users', action='store_true',
+                        help='leave out queued users')
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help='write a snapshot')
+    export.add_argument('-o', '--output',
+                        help='output file (default: standard output)')
+    export.set_defaults(run=export_store)
+    restore = commands.add_parser('import',
+                                  help='import a snapshot or channel config')
+    restore.add_argument('file')
+    restore.set_defaults(run=import_store)
+
+    args = parser.parse_args()
+    try:
+        args.run(args)
+    except SnapshotError as ex:
+        parser.exit(1, f'{parser.prog}: {args.file}: {ex}\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import discord
+from discord_slash.utils.manage_components import create_select_option
+
+from .database import AsyncMentorDbConn
+
+
+class MentorChannelRegistry:
+    '''Cached per-guild view of the mentor_channels table.
+
+    A guild's channels are loaded on first use and kept until they change
+    through this registry or a gateway event invalidates them. The join menu
+    options are built once per guild and reused until then.'''
+
+    def __init__(self, db: AsyncMentorDbConn):
+        self.db = db
+        self.guilds = {}
+        self.options = {}
+        self.generations = {}
+
+    async def get_channels(self, guild_id: int):
+        '''Returns a dict mapping the guild's mentor channel IDs to their
+        descriptions.'''
+        if (channels := self.guilds.get(guild_id)) is None:
+            generation = self.generations.get(guild_id, 0)
+            channels = dict(await self.db.get_mentor_channels(guild_id))
+            # don't cache a result that was invalidated while loading
+            if generation == self.generations.get(guild_id, 0):
+                self.guilds[guild_id] = channels
+        return channels
+
+    async def is_mentor_channel(self, guild_id: int, channel_id: int):
+        return channel_id in await self.get_channels(guild_id)
+
+    async def update(self, guild_id: int, channel_id: int, description: str):
+        result = await self.db.update_mentor_channel(guild_id,
+                                                     channel_id,
+                                                     description)
+        self.invalidate(guild_id)
+        return result
+
+    async def delete(self, guild_id: int, channel_id: int):
+        result = await self.db.delete_mentor_channel(guild_id, channel_id)
+        self.invalidate(guild_id)
+        return result
+
+    async def import_channels(self, guild_id: int, rows):
+        '''Adds or updates the guild's mentor channels from (guild_id,
+        channel_id, description) rows in one import.'''
+        result = await self.db.import_channels(rows)
+        self.invalidate(guild_id)
+        return result
+
+    def invalidate(self, guild_id: int):
+        self.generations[guild_id] = self.generations.get(guild_id, 0) + 1
+        self.guilds.pop(guild_id, None)
+        self.options.pop(guild_id, None)
+
+    async def select_options(self, guild: discord.Guild):
+        '''Returns the join menu options of a guild, ordered like the channel
+        list. Mentor channels that no longer exist are left out.'''
+        if (options := self.options.get(guild.id)) is None:
+            generation = self.generations.get(guild.id, 0)
+            channels = [
+                (channel, description)
+                for channel_id, description in
+                (await self.get_channels(guild.id)).items()
+                if (channel := guild.get_channel(channel_id))
+            ]
+            channels.sort(key=lambda item: item[0].position)
+            options = [
+                create_select_option(
+                    label=f'#{channel.name}'[:100],
+                    value=f'join-{channel.id}',
+                    description=(description or '')[:100] or None
+                )
+                for channel, description in channels
+            ]
+            if generation == self.generations.get(guild.id, 0):
+                self.options[guild.id] = options
+        return options
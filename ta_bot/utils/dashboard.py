@@ -0,0 +1,156 @@
+import asyncio
+import logging
+
+import discord
+
+from .database import AsyncMentorDbConn
+from .discord_embeds import embed_info
+from .mentor_queue import MentorQueues
+from .rest_scheduler import Priority, RestScheduler
+
+
+MAX_LISTED = 20
+
+
+def dashboard_embed(channel: discord.TextChannel,
+                    active: list[int],
+                    queued: list[int]):
+    def mentions(user_ids):
+        lines = [f'`{i}.` <@{user_id}>'
+                 for i, user_id in enumerate(user_ids[:MAX_LISTED], 1)]
+        if len(user_ids) > MAX_LISTED:
+            lines.append(f'... and {len(user_ids) - MAX_LISTED} more')
+        return '\n'.join(lines) or '(No users)'
+
+    embed = embed_info(f'Queue for #{channel.name}', '')
+    embed.add_field(name=f'Active ({len(active)})',
+                    value=mentions(active),
+                    inline=True)
+    embed.add_field(name=f'Queued ({len(queued)})',
+                    value=mentions(queued),
+                    inline=True)
+    embed.set_footer(text='Hint: Use `/mentor join` to join the queue.')
+    return embed
+
+
+class DashboardUpdater:
+    '''Keeps one pinned dashboard message per opted-in mentor channel up to
+    date. Queue changes only mark a channel as dirty; a background task
+    edits each dirty dashboard at most once per `interval` seconds, so a
+    burst of joins and leaves costs a single edit.'''
+
+    def __init__(self,
+                 bot,
+                 queues: MentorQueues,
+                 db: AsyncMentorDbConn,
+                 rest: RestScheduler,
+                 interval: float=5):
+        self.bot = bot
+        self.queues = queues
+        self.db = db
+        self.rest = rest
+        self.interval = interval
+        self.logger = logging.getLogger(__name__)
+        self.messages = {}
+        self.dirty = set()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        queues.listeners.append(self.mark_dirty)
+
+    def load(self, rows):
+        '''Loads dashboards from MentorDbConn.get_dashboards rows and
+        refreshes all of them.'''
+        self.messages = {(guild_id, channel_id): message_id
+                         for guild_id, channel_id, message_id in rows}
+        self.dirty.update(self.messages)
+        self.wakeup.set()
+
+    def start(self):
+        self.task = self.bot.loop.create_task(self.run())
+
+    def stop(self):
+        self.queues.listeners.remove(self.mark_dirty)
+        if self.task:
+            self.task.cancel()
+
+    def mark_dirty(self, guild_id: int, channel_id: int):
+        if (guild_id, channel_id) in self.messages:
+            self.dirty.add((guild_id, channel_id))
+            self.wakeup.set()
+
+    async def add(self, channel: discord.TextChannel):
+        '''Posts and pins a dashboard in the channel.'''
+        active, queued = self.queues.get_users(channel.guild.id, channel.id)
+        embed = dashboard_embed(channel, active, queued)
+        message = await self.rest.run(lambda: channel.send(embed=embed),
+                                      Priority.NORMAL,
+                                      bucket=f'dashboard:{channel.id}')
+        try:
+            await self.rest.run(message.pin,
+                                Priority.NORMAL,
+                                bucket=f'dashboard:{channel.id}')
+        except discord.HTTPException:
+            self.logger.warning('Could not pin dashboard in #%s', channel)
+        self.messages[channel.guild.id, channel.id] = message.id
+        await self.db.set_dashboard(channel.guild.id, channel.id, message.id)
+
+    async def remove(self, guild_id: int, channel_id: int):
+        '''Forgets a channel's dashboard and deletes its message. Returns
+        whether the channel had one.'''
+        if not (message_id := self.messages.pop((guild_id, channel_id),
+                                                None)):
+            return False
+        self.dirty.discard((guild_id, channel_id))
+        await self.db.delete_dashboard(guild_id, channel_id)
+        if (channel := self.bot.get_channel(channel_id)):
+            message = channel.get_partial_message(message_id)
+            try:
+                await self.rest.run(message.delete,
+                                    Priority.BACKGROUND,
+                                    bucket=f'dashboard:{channel_id}')
+            except discord.HTTPException:
+                pass
+        return True
+
+    async def refresh(self, guild_id: int, channel_id: int):
+        if not (message_id := self.messages.get((guild_id, channel_id))):
+            return
+        if not (channel := self.bot.get_channel(channel_id)):
+            # the cache may just not hold the channel yet, so only a 404
+            # proves it was deleted
+            try:
+                channel = await self.rest.run(
+                    lambda: self.bot.fetch_channel(channel_id),
+                    Priority.BACKGROUND,
+                    bucket=f'dashboard:{channel_id}'
+                )
+            except discord.NotFound:
+                await self.remove(guild_id, channel_id)
+                return
+
+        active, queued = self.queues.get_users(guild_id, channel_id)
+        embed = dashboard_embed(channel, active, queued)
+        message = channel.get_partial_message(message_id)
+        try:
+            await self.rest.run(lambda: message.edit(embed=embed),
+                                Priority.BACKGROUND,
+                                bucket=f'dashboard:{channel_id}',
+                                coalesce_key=('dashboard', channel_id))
+        except discord.NotFound:
+            # the message was deleted by hand, so opt the channel out
+            await self.remove(guild_id, channel_id)
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            dirty, self.dirty = self.dirty, set()
+            results = await asyncio.gather(*(self.refresh(*key)
+                                             for key in dirty),
+                                           return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    self.logger.error('Failed to update dashboard',
+                                      exc_info=result)
+            await asyncio.sleep(self.interval)
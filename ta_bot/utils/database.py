@@ -1,23 +1,33 @@
+import asyncio
+import concurrent.futures
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+from . import metrics
+from .profiling import span
+from .storage import IMPORT_BATCH_SIZE, MentorStore, batched, open_store
 
-class MentorDbConn:
 
-    def __init__(self, dbfile: str):
-        self.conn = sqlite3.connect(dbfile)
-        self.create_tables()
-
-    def create_tables(self):
-        self.conn.execute('''
+# Each migration is a list of statements that upgrades the schema by one
+# version. Version 1 matches the tables created before versioning existed, so
+# old database files upgrade in place. VACUUM cannot run in a transaction, so
+# it runs right after its migration was committed.
+MIGRATIONS = [
+    [
+        '''
             CREATE TABLE IF NOT EXISTS mentor_channels (
                 guild_id    INTEGER,
                 channel_id  INTEGER,
                 description TEXT,
                 PRIMARY KEY (guild_id, channel_id)
             );
-        ''')
-        self.conn.execute('''
+        ''',
+        '''
             CREATE TABLE IF NOT EXISTS mentor_users (
                 guild_id    INTEGER,
                 user_id     INTEGER,
@@ -26,7 +36,249 @@ class MentorDbConn:
                 is_active   INTEGER,
                 PRIMARY KEY (guild_id, user_id)
             );
+        ''',
+    ],
+    [
+        # covers get_users and the position count in get_user_info
+        '''
+            CREATE INDEX IF NOT EXISTS mentor_users_by_time
+            ON mentor_users (guild_id, channel_id, queued_time,
+                             user_id, is_active);
+        ''',
+        # covers get_next_user and get_active_users
+        '''
+            CREATE INDEX IF NOT EXISTS mentor_users_by_state
+            ON mentor_users (guild_id, channel_id, is_active,
+                             queued_time, user_id);
+        ''',
+    ],
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS mentor_dashboards (
+                guild_id    INTEGER,
+                channel_id  INTEGER,
+                message_id  INTEGER,
+                PRIMARY KEY (guild_id, channel_id)
+            );
+        ''',
+    ],
+    [
+        # append-only history of queue events
+        '''
+            CREATE TABLE IF NOT EXISTS mentor_events (
+                event_id    INTEGER PRIMARY KEY,
+                guild_id    INTEGER,
+                channel_id  INTEGER,
+                user_id     INTEGER,
+                ta_id       INTEGER,
+                event       TEXT,
+                time        INTEGER
+            );
+        ''',
+        # covers get_active_sessions
+        '''
+            CREATE INDEX IF NOT EXISTS mentor_events_by_user
+            ON mentor_events (guild_id, user_id, event, time);
+        ''',
+        # buckets of the wait and session length sketches
+        '''
+            CREATE TABLE IF NOT EXISTS mentor_stats (
+                guild_id    INTEGER,
+                scope       TEXT,
+                scope_id    INTEGER,
+                metric      TEXT,
+                bucket      INTEGER,
+                count       INTEGER,
+                PRIMARY KEY (guild_id, scope, scope_id, metric, bucket)
+            );
+        ''',
+    ],
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS mentor_invites (
+                guild_id     INTEGER,
+                user_id      INTEGER,
+                channel_id   INTEGER,
+                ta_id        INTEGER,
+                invited_time INTEGER,
+                PRIMARY KEY (guild_id, user_id)
+            );
+        ''',
+    ],
+    [
+        # queues are ordered by queued_time - priority, see MentorQueues
+        '''
+            ALTER TABLE mentor_users
+            ADD COLUMN priority INTEGER NOT NULL DEFAULT 0;
+        ''',
+        'DROP INDEX IF EXISTS mentor_users_by_time;',
+        'DROP INDEX IF EXISTS mentor_users_by_state;',
+        '''
+            CREATE INDEX mentor_users_by_time
+            ON mentor_users (guild_id, channel_id, queued_time - priority,
+                             user_id, is_active, queued_time, priority);
+        ''',
+        '''
+            CREATE INDEX mentor_users_by_state
+            ON mentor_users (guild_id, channel_id, is_active,
+                             queued_time - priority, user_id, queued_time,
+                             priority);
+        ''',
+    ],
+    [
+        # member overwrites granted by the bot, the only ones reconciliation
+        # removes; users who are active or invited already have one
+        '''
+            CREATE TABLE IF NOT EXISTS mentor_grants (
+                guild_id    INTEGER,
+                channel_id  INTEGER,
+                user_id     INTEGER,
+                PRIMARY KEY (guild_id, channel_id, user_id)
+            );
+        ''',
+        '''
+            INSERT OR IGNORE INTO mentor_grants
+            SELECT guild_id, channel_id, user_id FROM mentor_users
+            WHERE is_active;
+        ''',
+        '''
+            INSERT OR IGNORE INTO mentor_grants
+            SELECT guild_id, channel_id, user_id FROM mentor_invites;
+        ''',
+    ],
+    [
+        # let maintain return free pages; the mode of an existing file only
+        # changes with a VACUUM
+        'PRAGMA auto_vacuum = INCREMENTAL;',
+        'VACUUM;',
+    ],
+    [
+        # covers get_last_visits, which only reads the recent activations
+        '''
+            CREATE INDEX IF NOT EXISTS mentor_events_by_time
+            ON mentor_events (event, time, guild_id, user_id);
+        ''',
+    ],
+]
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -16000,
+    'temp_store': 'MEMORY',
+}
+# seconds to wait for the write lock held by another process, and for one
+# that is migrating the same file when opening it
+TIMEOUT = 5
+MIGRATION_TIMEOUT = 600
+# attempts at committing a group of writes, and seconds between them
+BATCH_ATTEMPTS = 3
+BATCH_RETRY_DELAY = 0.5
+
+
+def current_timestamp():
+    '''Returns the current time in milliseconds, as stored in queued_time.'''
+    return int(datetime.utcnow().timestamp() * 1000)
+
+
+class MentorDbConn(MentorStore):
+
+    def __init__(self, dbfile: str):
+        # another process may be migrating the file, see migrate
+        self.conn = sqlite3.connect(dbfile, timeout=MIGRATION_TIMEOUT)
+        self.transaction_depth = 0
+        for pragma, value in PRAGMAS.items():
+            self.conn.execute(f'PRAGMA {pragma} = {value};')
+        self.migrate()
+        self.conn.execute(f'PRAGMA busy_timeout = {TIMEOUT * 1000};')
+
+    def schema_version(self):
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER NOT NULL
+            );
         ''')
+        cursor = self.conn.execute('SELECT MAX(version) FROM schema_version;')
+        return cursor.fetchone()[0] or 0
+
+    def migrate(self):
+        '''Applies every migration newer than the stored schema version, each
+        in its own transaction. A failed migration leaves no trace, so it is
+        retried from the start on the next run.
+
+        Each transaction takes the write lock before reading the version, so
+        when several processes open the same file, every migration is
+        applied by exactly one of them while the others wait.'''
+        while True:
+            # the sqlite3 module only begins transactions implicitly before
+            # DML, so schema changes need an explicit one
+            with self.transaction(immediate=True):
+                version = self.schema_version()
+                if version >= len(MIGRATIONS):
+                    return
+                statements = MIGRATIONS[version]
+                for statement in statements:
+                    if statement != 'VACUUM;':
+                        self.conn.execute(statement)
+                self.conn.execute('''
+                    INSERT INTO schema_version (version) VALUES (?);
+                ''', (version + 1, ))
+            # files converted by older versions need no VACUUM
+            if ('VACUUM;' in statements and
+                    self.conn.execute('PRAGMA auto_vacuum;').fetchone()[0]
+                    != 2):
+                self.conn.execute('VACUUM;')
+
+    @contextmanager
+    def transaction(self, immediate: bool=False):
+        '''Groups every write made inside the block into one transaction,
+        which is committed when the outermost block exits and rolled back if
+        it raises. With `immediate`, the write lock is taken right away.'''
+        if self.transaction_depth == 0 and not self.conn.in_transaction:
+            self.conn.execute('BEGIN IMMEDIATE;' if immediate else 'BEGIN;')
+        self.transaction_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self.transaction_depth -= 1
+            if self.transaction_depth == 0:
+                self.conn.rollback()
+            raise
+        self.transaction_depth -= 1
+        if self.transaction_depth == 0:
+            self.conn.commit()
+
+    @contextmanager
+    def savepoint(self):
+        self.conn.execute('SAVEPOINT job;')
+        try:
+            yield
+        except BaseException:
+            self.conn.execute('ROLLBACK TO job;')
+            raise
+        finally:
+            self.conn.execute('RELEASE job;')
+
+    def commit(self):
+        '''Commits pending writes, unless they belong to an enclosing
+        transaction block.'''
+        if self.transaction_depth == 0:
+            self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def maintain(self, max_pages: int=2000):
+        '''Refreshes the query planner statistics and returns up to
+        `max_pages` free pages to the file system.'''
+        self.conn.execute('ANALYZE;')
+        free = self.conn.execute('PRAGMA freelist_count;').fetchone()[0]
+        pages = min(free, max_pages)
+        # the pragma frees one page per step, and the sqlite3 module only
+        # steps it once
+        for _ in range(pages):
+            self.conn.execute('PRAGMA incremental_vacuum(1);')
+        return pages
 
     def get_mentor_channels(self, guild_id: int):
         cursor = self.conn.cursor()
@@ -37,6 +289,39 @@ class MentorDbConn:
         cursor.execute(query, (guild_id, ))
         return cursor.fetchall()
 
+    def get_all_channels(self):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, channel_id FROM mentor_channels;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    def iter_mentor_channels(self, guild_id: int=None):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, channel_id, description FROM mentor_channels
+            WHERE ? IS NULL OR guild_id = ?
+            ORDER BY guild_id, channel_id;
+        '''
+        cursor.execute(query, (guild_id, guild_id))
+        while (rows := cursor.fetchmany(IMPORT_BATCH_SIZE)):
+            yield from rows
+
+    def import_channels(self, rows):
+        '''Imports every row in one transaction.'''
+        query = '''
+            INSERT OR REPLACE INTO mentor_channels
+                (guild_id, channel_id, description)
+            VALUES (?, ?, ?);
+        '''
+        count = 0
+        with self.transaction():
+            for batch in batched(rows):
+                self.conn.executemany(query, batch)
+                count += len(batch)
+        return count
+
     def is_mentor_channel(self, guild_id: int, channel_id: int):
         cursor = self.conn.cursor()
         query = '''
@@ -57,7 +342,7 @@ class MentorDbConn:
             VALUES (?, ?, ?);
         '''
         cursor.execute(query, (guild_id, channel_id, description))
-        self.conn.commit()
+        self.commit()
         return cursor.rowcount
 
     def delete_mentor_channel(self, guild_id: int, channel_id: int):
@@ -67,12 +352,62 @@ class MentorDbConn:
             WHERE guild_id = ? AND channel_id = ?;
         '''
         cursor.execute(query_channels, (guild_id, channel_id))
+        query_dashboards = '''
+            DELETE FROM mentor_dashboards
+            WHERE guild_id = ? AND channel_id = ?;
+        '''
+        cursor.execute(query_dashboards, (guild_id, channel_id))
+        query_grants = '''
+            DELETE FROM mentor_grants
+            WHERE guild_id = ? AND channel_id = ?;
+        '''
+        cursor.execute(query_grants, (guild_id, channel_id))
         query_users = '''
             DELETE FROM mentor_users
             WHERE guild_id = ? AND channel_id = ?;
         '''
         cursor.execute(query_users, (guild_id, channel_id))
-        self.conn.commit()
+        self.commit()
+        return cursor.rowcount
+
+    def delete_guild(self, guild_id: int):
+        cursor = self.conn.cursor()
+        rowcount = 0
+        for table in ('mentor_channels', 'mentor_dashboards',
+                      'mentor_users', 'mentor_invites', 'mentor_grants'):
+            cursor.execute(f'DELETE FROM {table} WHERE guild_id = ?;',
+                           (guild_id, ))
+            rowcount += cursor.rowcount
+        self.commit()
+        return rowcount
+
+    def get_dashboards(self):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, channel_id, message_id FROM mentor_dashboards;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    def set_dashboard(self, guild_id: int, channel_id: int, message_id: int):
+        cursor = self.conn.cursor()
+        query = '''
+            INSERT OR REPLACE INTO mentor_dashboards
+                (guild_id, channel_id, message_id)
+            VALUES (?, ?, ?);
+        '''
+        cursor.execute(query, (guild_id, channel_id, message_id))
+        self.commit()
+        return cursor.rowcount
+
+    def delete_dashboard(self, guild_id: int, channel_id: int):
+        cursor = self.conn.cursor()
+        query = '''
+            DELETE FROM mentor_dashboards
+            WHERE guild_id = ? AND channel_id = ?;
+        '''
+        cursor.execute(query, (guild_id, channel_id))
+        self.commit()
         return cursor.rowcount
 
     def get_user_info(self, guild_id: int, user_id: int, fetch_pos: bool):
@@ -80,13 +415,14 @@ class MentorDbConn:
         user is active, and their current position in the queue.'''
         cursor = self.conn.cursor()
         channel_query = '''
-            SELECT channel_id, is_active, queued_time FROM mentor_users
+            SELECT channel_id, is_active, queued_time - priority
+            FROM mentor_users
             WHERE guild_id = ? AND user_id = ?;
         '''
         cursor.execute(channel_query, (guild_id, user_id))
         if not (result := cursor.fetchone()):
             return (None, None, None) if fetch_pos else (None, None)
-        channel_id, is_active, queued_time = result
+        channel_id, is_active, sort_key = result
 
         if not fetch_pos:
             return channel_id, bool(is_active)
@@ -95,9 +431,9 @@ class MentorDbConn:
             SELECT COUNT(*) FROM mentor_users
             WHERE guild_id = ? AND
                   channel_id = ? AND
-                  queued_time <= ?;
+                  queued_time - priority <= ?;
         '''
-        cursor.execute(position_query, (guild_id, channel_id, queued_time))
+        cursor.execute(position_query, (guild_id, channel_id, sort_key))
         position = cursor.fetchone()[0]
         return channel_id, bool(is_active), position
 
@@ -109,7 +445,7 @@ class MentorDbConn:
         query = '''
             SELECT user_id, is_active FROM mentor_users
             WHERE guild_id = ? AND channel_id = ?
-            ORDER BY queued_time ASC;
+            ORDER BY queued_time - priority ASC, user_id ASC;
         '''
         cursor.execute(query, (guild_id, channel_id))
         for user_id, is_active in cursor.fetchall():
@@ -119,16 +455,62 @@ class MentorDbConn:
                 inactive.append(user_id)
         return active, inactive
 
-    def add_user(self, guild_id: int, user_id: int, channel_id: int):
+    def get_all_users(self):
+        '''Returns every row of mentor_users, for rebuilding in-memory
+        queues.'''
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, user_id, channel_id, queued_time, is_active,
+                   priority
+            FROM mentor_users;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    def iter_users(self, guild_id: int=None):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, user_id, channel_id, queued_time, is_active,
+                   priority
+            FROM mentor_users
+            WHERE ? IS NULL OR guild_id = ?
+            ORDER BY guild_id, channel_id, queued_time - priority, user_id;
+        '''
+        cursor.execute(query, (guild_id, guild_id))
+        while (rows := cursor.fetchmany(IMPORT_BATCH_SIZE)):
+            yield from rows
+
+    def import_users(self, rows):
+        '''Imports every row in one transaction.'''
+        query = '''
+            INSERT OR IGNORE INTO mentor_users
+                (guild_id, user_id, channel_id, queued_time, is_active,
+                 priority)
+            VALUES (?, ?, ?, ?, ?, ?);
+        '''
+        count = 0
+        with self.transaction():
+            for batch in batched(rows):
+                count += self.conn.executemany(query, batch).rowcount
+        return count
+
+    def add_user(self,
+                 guild_id: int,
+                 user_id: int,
+                 channel_id: int,
+                 queued_time: int=None,
+                 priority: int=0):
         cursor = self.conn.cursor()
         query = '''
             INSERT INTO mentor_users
-                (guild_id, user_id, channel_id, queued_time, is_active)
-            VALUES (?, ?, ?, ?, 0);
+                (guild_id, user_id, channel_id, queued_time, is_active,
+                 priority)
+            VALUES (?, ?, ?, ?, 0, ?);
         '''
-        timestamp = int(datetime.utcnow().timestamp() * 1000)
-        cursor.execute(query, (guild_id, user_id, channel_id, timestamp))
-        self.conn.commit()
+        timestamp = queued_time or current_timestamp()
+        cursor.execute(query, (guild_id, user_id, channel_id, timestamp,
+                               priority))
+        self.commit()
         return cursor.rowcount
 
     def make_active(self, guild_id: int, user_id: int, is_active: bool=True):
@@ -139,7 +521,7 @@ class MentorDbConn:
             WHERE guild_id = ? AND user_id = ?;
         '''
         cursor.execute(query, (is_active, guild_id, user_id))
-        self.conn.commit()
+        self.commit()
         return cursor.rowcount
 
     def delete_user(self, guild_id: int, user_id: int):
@@ -149,7 +531,42 @@ class MentorDbConn:
             WHERE guild_id = ? AND user_id = ?;
         '''
         cursor.execute(query, (guild_id, user_id))
-        self.conn.commit()
+        self.commit()
+        return cursor.rowcount
+
+    def delete_users(self, guild_id: int, user_ids: list[int]):
+        cursor = self.conn.cursor()
+        query = '''
+            DELETE FROM mentor_users
+            WHERE guild_id = ? AND user_id = ?;
+        '''
+        cursor.executemany(query, [(guild_id, user_id)
+                                   for user_id in user_ids])
+        self.commit()
+        return cursor.rowcount
+
+    def clear_active_users(self, guild_id: int, channel_id: int):
+        '''Removes every active user of a channel in a single statement.'''
+        cursor = self.conn.cursor()
+        query = '''
+            DELETE FROM mentor_users
+            WHERE guild_id = ? AND
+                  channel_id = ? AND
+                  is_active = 1;
+        '''
+        cursor.execute(query, (guild_id, channel_id))
+        self.commit()
+        return cursor.rowcount
+
+    def clear_users(self, guild_id: int, channel_id: int):
+        '''Removes every active and queued user of a channel.'''
+        cursor = self.conn.cursor()
+        query = '''
+            DELETE FROM mentor_users
+            WHERE guild_id = ? AND channel_id = ?;
+        '''
+        cursor.execute(query, (guild_id, channel_id))
+        self.commit()
         return cursor.rowcount
 
     def get_active_users(self, guild_id: int, channel_id: int):
@@ -170,7 +587,7 @@ class MentorDbConn:
             WHERE guild_id = ? AND
                   channel_id = ? AND
                   is_active = 0
-            ORDER BY queued_time ASC
+            ORDER BY queued_time - priority ASC, user_id ASC
             LIMIT 1;
         '''
         cursor.execute(query, (guild_id, channel_id))
@@ -178,7 +595,7 @@ class MentorDbConn:
             return result[0]
         return None
 
-    def skip_user(self, guild_id: int, user_id: int):
+    def skip_user(self, guild_id: int, user_id: int, queued_time: int=None):
         channel_id, is_active = self.get_user_info(guild_id, user_id, False)
         if not channel_id or is_active:
             return
@@ -186,9 +603,307 @@ class MentorDbConn:
         cursor = self.conn.cursor()
         query = '''
             UPDATE mentor_users
-            SET queued_time = ?
+            SET queued_time = ?, priority = 0
             WHERE guild_id = ? AND user_id = ?;
         '''
-        timestamp = int(datetime.utcnow().timestamp() * 1000)
+        timestamp = queued_time or current_timestamp()
         cursor.execute(query, (timestamp, guild_id, user_id))
-        self.conn.commit()
+        self.commit()
+
+    def set_priority(self, guild_id: int, user_id: int, priority: int):
+        cursor = self.conn.cursor()
+        query = '''
+            UPDATE mentor_users
+            SET priority = ?
+            WHERE guild_id = ? AND user_id = ?;
+        '''
+        cursor.execute(query, (priority, guild_id, user_id))
+        self.commit()
+        return cursor.rowcount
+
+    def get_invites(self):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, user_id, channel_id, ta_id, invited_time
+            FROM mentor_invites;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    def add_invite(self,
+                   guild_id: int,
+                   user_id: int,
+                   channel_id: int,
+                   ta_id: int,
+                   invited_time: int=None):
+        cursor = self.conn.cursor()
+        query = '''
+            INSERT OR REPLACE INTO mentor_invites
+                (guild_id, user_id, channel_id, ta_id, invited_time)
+            VALUES (?, ?, ?, ?, ?);
+        '''
+        cursor.execute(query, (guild_id, user_id, channel_id, ta_id,
+                               invited_time or current_timestamp()))
+        self.commit()
+        return cursor.rowcount
+
+    def delete_invite(self, guild_id: int, user_id: int):
+        cursor = self.conn.cursor()
+        query = '''
+            DELETE FROM mentor_invites
+            WHERE guild_id = ? AND user_id = ?;
+        '''
+        cursor.execute(query, (guild_id, user_id))
+        self.commit()
+        return cursor.rowcount
+
+    def get_grants(self):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, channel_id, user_id FROM mentor_grants;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    def add_grants(self, guild_id: int, channel_id: int, user_ids: list[int]):
+        cursor = self.conn.cursor()
+        query = '''
+            INSERT OR IGNORE INTO mentor_grants (guild_id, channel_id, user_id)
+            VALUES (?, ?, ?);
+        '''
+        cursor.executemany(query, [(guild_id, channel_id, user_id)
+                                   for user_id in user_ids])
+        self.commit()
+        return cursor.rowcount
+
+    def delete_grants(self,
+                      guild_id: int,
+                      channel_id: int,
+                      user_ids: list[int]):
+        cursor = self.conn.cursor()
+        query = '''
+            DELETE FROM mentor_grants
+            WHERE guild_id = ? AND channel_id = ? AND user_id = ?;
+        '''
+        cursor.executemany(query, [(guild_id, channel_id, user_id)
+                                   for user_id in user_ids])
+        self.commit()
+        return cursor.rowcount
+
+    def add_event(self,
+                  guild_id: int,
+                  channel_id: int,
+                  user_id: int,
+                  event: str,
+                  ta_id: int=None,
+                  time: int=None):
+        cursor = self.conn.cursor()
+        query = '''
+            INSERT INTO mentor_events
+                (guild_id, channel_id, user_id, ta_id, event, time)
+            VALUES (?, ?, ?, ?, ?, ?);
+        '''
+        cursor.execute(query, (guild_id, channel_id, user_id, ta_id, event,
+                               time or current_timestamp()))
+        self.commit()
+        return cursor.rowcount
+
+    def get_active_sessions(self):
+        '''Returns (guild_id, user_id, time, ta_id) of the latest activation
+        of every active user.'''
+        cursor = self.conn.cursor()
+        # starts from the few active users and seeks the latest activation
+        # of each in mentor_events_by_user, instead of scanning the history
+        query = '''
+            SELECT u.guild_id, u.user_id, e.time, e.ta_id
+            FROM mentor_users AS u
+            JOIN mentor_events AS e
+                ON e.event_id = (
+                    SELECT event_id FROM mentor_events
+                    WHERE guild_id = u.guild_id AND
+                          user_id = u.user_id AND
+                          event = 'activate'
+                    ORDER BY time DESC, event_id DESC
+                    LIMIT 1
+                )
+            WHERE u.is_active = 1;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+    def get_last_visits(self, since: int):
+        cursor = self.conn.cursor()
+        # after ANALYZE, the planner prefers a full scan of
+        # mentor_events_by_user for its grouping, which ignores `since`
+        query = '''
+            SELECT guild_id, user_id, MAX(time)
+            FROM mentor_events INDEXED BY mentor_events_by_time
+            WHERE event = 'activate' AND time >= ?
+            GROUP BY guild_id, user_id;
+        '''
+        cursor.execute(query, (since, ))
+        return cursor.fetchall()
+
+    def add_stat_sample(self,
+                        guild_id: int,
+                        scope: str,
+                        scope_id: int,
+                        metric: str,
+                        bucket: int):
+        cursor = self.conn.cursor()
+        query = '''
+            INSERT INTO mentor_stats
+                (guild_id, scope, scope_id, metric, bucket, count)
+            VALUES (?, ?, ?, ?, ?, 1)
+            ON CONFLICT (guild_id, scope, scope_id, metric, bucket)
+            DO UPDATE SET count = count + 1;
+        '''
+        cursor.execute(query, (guild_id, scope, scope_id, metric, bucket))
+        self.commit()
+        return cursor.rowcount
+
+    def get_stats(self):
+        cursor = self.conn.cursor()
+        query = '''
+            SELECT guild_id, scope, scope_id, metric, bucket, count
+            FROM mentor_stats;
+        '''
+        cursor.execute(query)
+        return cursor.fetchall()
+
+
+class AsyncMentorDbConn:
+    '''Owns a MentorStore on a dedicated writer thread, so that storage calls
+    and their fsyncs never run on the event loop. Every public method of
+    MentorStore is exposed here as a coroutine function, and calls are
+    executed one at a time in submission order. `store` is a SQLite file or
+    a storage URL, as accepted by open_store.
+
+    Calls that are queued together are group-committed: the writer drains up
+    to `max_batch` pending calls, optionally waiting `group_commit_window`
+    seconds for more, and commits them as one transaction. Each call runs in
+    its own savepoint, so a failing call does not undo the others. A
+    transaction that fails as a whole, e.g. because another process held
+    the write lock for too long, is retried from the start.'''
+
+    def __init__(self,
+                 store: str,
+                 group_commit_window: float=0.0,
+                 max_batch: int=256):
+        self.jobs = queue.SimpleQueue()
+        self.group_commit_window = group_commit_window
+        self.max_batch = max_batch
+        self.logger = logging.getLogger(__name__)
+        ready = concurrent.futures.Future()
+        self.thread = threading.Thread(target=self._run,
+                                       args=(store, ready),
+                                       name='mentor-db',
+                                       daemon=True)
+        self.thread.start()
+        # surface errors from opening the database in the caller
+        ready.result()
+
+    def _run(self, store: str, ready: concurrent.futures.Future):
+        try:
+            conn = open_store(store)
+        except Exception as ex:
+            ready.set_exception(ex)
+            return
+        ready.set_result(None)
+
+        running = True
+        while running:
+            batch = [self.jobs.get()]
+            if batch[0] is None:
+                break
+            deadline = time.monotonic() + self.group_commit_window
+            while len(batch) < self.max_batch:
+                try:
+                    timeout = deadline - time.monotonic()
+                    job = (self.jobs.get(timeout=timeout) if timeout > 0
+                           else self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+                if job is None:
+                    running = False
+                    break
+                batch.append(job)
+            self._run_batch(conn, batch)
+        conn.close()
+
+    def _run_batch(self, conn: MentorStore, batch: list):
+        batch = [job for job in batch if job[0].set_running_or_notify_cancel()]
+        for attempt in range(1, BATCH_ATTEMPTS + 1):
+            try:
+                outcomes = self._commit_batch(conn, batch)
+                break
+            except Exception as ex:
+                if attempt < BATCH_ATTEMPTS:
+                    self.logger.warning('Retrying %d storage calls after a '
+                                        'failed commit: %s', len(batch), ex)
+                    time.sleep(BATCH_RETRY_DELAY * attempt)
+                    continue
+                self.logger.error('Failed to commit %d storage calls',
+                                  len(batch), exc_info=ex)
+                outcomes = [(future, False, ex) for future, *_ in batch]
+
+        # only report results once they are durable
+        for future, ok, value in outcomes:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _commit_batch(self, conn: MentorStore, batch: list):
+        outcomes = []
+        # other processes may write the same file in cluster mode; taking
+        # the write lock first keeps a read at the start of the batch from
+        # making its first write fail without waiting for the lock
+        with conn.transaction(immediate=True):
+            for future, method, args, kwargs in batch:
+                try:
+                    with conn.savepoint():
+                        with metrics.db_query_latency.time(method=method):
+                            result = getattr(conn, method)(*args, **kwargs)
+                except Exception as ex:
+                    outcomes.append((future, False, ex))
+                else:
+                    outcomes.append((future, True, result))
+        return outcomes
+
+    def submit(self, method: str, *args, **kwargs):
+        '''Queues a call to a MentorStore method and returns a
+        concurrent.futures.Future for its result.'''
+        future = concurrent.futures.Future()
+        self.jobs.put((future, method, args, kwargs))
+        return future
+
+    def submit_logged(self, method: str, *args, what: str):
+        '''Queues a call like submit, for writes nobody waits for, and logs
+        an error saying what failed to `what` if it fails.'''
+        def check(future: concurrent.futures.Future):
+            if (ex := future.exception()):
+                self.logger.error('Failed to %s', what, exc_info=ex)
+
+        future = self.submit(method, *args)
+        future.add_done_callback(check)
+        return future
+
+    def __getattr__(self, method: str):
+        if method.startswith('_') or not callable(getattr(MentorStore,
+                                                          method,
+                                                          None)):
+            raise AttributeError(method)
+
+        async def call(*args, **kwargs):
+            with span('storage'):
+                return await asyncio.wrap_future(self.submit(method,
+                                                             *args,
+                                                             **kwargs))
+        call.__name__ = method
+        return call
+
+    def close(self):
+        '''Finishes all pending calls and closes the store.'''
+        self.jobs.put(None)
+        self.thread.join()
@@ -0,0 +1,54 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from . import metrics
+
+
+class KeyedLocks:
+    '''A set of asyncio locks created on demand for hashable keys, such as
+    ('channel', guild_id, channel_id). Locks are discarded once nobody holds
+    or waits for them. Wait times are recorded per key kind, which is the
+    first item of tuple keys.'''
+
+    def __init__(self):
+        self.locks = {}
+
+    def __len__(self):
+        return len(self.locks)
+
+    def locked(self, key):
+        return key in self.locks and self.locks[key][0].locked()
+
+    @asynccontextmanager
+    async def __call__(self, *keys):
+        '''Acquires the locks of every given key. Keys are always taken in
+        sorted order, so overlapping acquisitions cannot deadlock.'''
+        keys = sorted(set(keys), key=repr)
+        acquired = []
+        try:
+            for key in keys:
+                if not (entry := self.locks.get(key)):
+                    entry = self.locks[key] = [asyncio.Lock(), 0]
+                entry[1] += 1
+                start = time.perf_counter()
+                try:
+                    await entry[0].acquire()
+                except BaseException:
+                    self._release_ref(key)
+                    raise
+                kind = key[0] if isinstance(key, tuple) else 'other'
+                metrics.lock_wait.observe(time.perf_counter() - start,
+                                          kind=kind)
+                acquired.append(key)
+            yield
+        finally:
+            for key in reversed(acquired):
+                self.locks[key][0].release()
+                self._release_ref(key)
+
+    def _release_ref(self, key):
+        entry = self.locks[key]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self.locks[key]
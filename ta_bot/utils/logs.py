@@ -0,0 +1,153 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import time
+
+
+# attributes of every LogRecord; anything else was passed through `extra`
+RECORD_ATTRIBUTES = {
+    *vars(logging.LogRecord('', 0, '', 0, '', (), None)),
+    'message', 'asctime'
+}
+
+
+def record_fields(record: logging.LogRecord):
+    return {key: value for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    '''Formats records as one JSON object per line. Fields passed through
+    `extra` become keys of their own.'''
+
+    def format(self, record: logging.LogRecord):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            **record_fields(record)
+        }
+        if record.exc_info:
+            entry['traceback'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    '''The usual text format, with fields passed through `extra` appended
+    to the message as key=value pairs.'''
+
+    def formatMessage(self, record: logging.LogRecord):
+        message = super().formatMessage(record)
+        if (fields := record_fields(record)):
+            message += ' ' + ' '.join(f'{key}={value}'
+                                      for key, value in fields.items())
+        return message
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    '''Puts records on an in-process queue without formatting them, so that
+    tracebacks are formatted by the listener thread instead of the event
+    loop.'''
+
+    def prepare(self, record: logging.LogRecord):
+        # arguments may change before the listener gets to them
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class FieldsFilter(logging.Filter):
+    '''Adds the same fields to every record.'''
+
+    def __init__(self, fields: dict):
+        super().__init__()
+        self.fields = fields
+
+    def filter(self, record: logging.LogRecord):
+        record.__dict__.update(self.fields)
+        return True
+
+
+def setup_logging(level: int=logging.INFO, fmt: str='text', **fields):
+    '''Configures the root logger to hand records to a background thread,
+    which formats and writes them to stderr. `fmt` is 'text' or 'json', and
+    `fields` are added to every record. Returns the QueueListener, which is
+    stopped at exit after writing the remaining records.'''
+    handler = logging.StreamHandler()
+    if fmt == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter(
+            '%(asctime)s %(levelname)s %(name)s: %(message)s'
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LocalQueueHandler(log_queue)
+    if fields:
+        queue_handler.addFilter(FieldsFilter(fields))
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class ErrorAggregator:
+    '''Rate-limits error logs per (command, exception type).
+
+    The first error of a key is logged with its traceback and opens a
+    window of `interval` seconds, during which further errors of that key
+    are only counted. Once the window is over, `flush` logs a single
+    summary of the repeats, and the next error is logged in full again.'''
+
+    def __init__(self, logger: logging.Logger, interval: float=60):
+        self.logger = logger
+        self.interval = interval
+        # (command, exception type) -> [window start, repeats]
+        self.windows = {}
+
+    def report(self, command: str, exception: BaseException, **fields):
+        '''Logs an exception raised by a command, unless one of the same
+        type was logged for it recently. Returns whether it was logged.'''
+        key = (command, type(exception).__name__)
+        now = time.monotonic()
+        if (window := self.windows.get(key)):
+            if now - window[0] < self.interval:
+                window[1] += 1
+                return False
+            self._summarize(key, window)
+
+        self.windows[key] = [now, 0]
+        self.logger.error('Caught exception in command %s: %s',
+                          command, exception,
+                          exc_info=exception,
+                          extra={'command': command,
+                                 'error': key[1],
+                                 **fields})
+        return True
+
+    def flush(self, force: bool=False):
+        '''Logs a summary of every window that is over, or of every window
+        with `force`.'''
+        now = time.monotonic()
+        for key, window in list(self.windows.items()):
+            if force or now - window[0] >= self.interval:
+                del self.windows[key]
+                self._summarize(key, window)
+
+    def _summarize(self, key: tuple[str, str], window: list):
+        command, error = key
+        if (repeats := window[1]):
+            self.logger.warning('%d more %s exceptions in command %s in '
+                                'the last %d s',
+                                repeats, error, command,
+                                round(time.monotonic() - window[0]),
+                                extra={'command': command,
+                                       'error': error,
+                                       'repeats': repeats})
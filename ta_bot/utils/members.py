@@ -0,0 +1,104 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+import discord
+
+from .profiling import span
+from .rest_scheduler import Priority, RestScheduler
+
+
+class MemberResolver:
+    '''Resolves user IDs to guild members with as few REST calls as possible.
+
+    Lookups try the gateway member cache first, then a TTL/LRU cache of
+    earlier fetches (including members that were not found), and only then
+    fetch from the API, concurrently and with duplicate requests merged.'''
+
+    def __init__(self,
+                 rest: RestScheduler,
+                 ttl: float=300,
+                 max_size: int=4096,
+                 concurrency: int=8):
+        self.rest = rest
+        self.ttl = ttl
+        self.max_size = max_size
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cache = OrderedDict()
+        self.inflight = {}
+        self.stats = {
+            'gateway_hits': 0,
+            'cache_hits': 0,
+            'misses': 0,
+            'not_found': 0,
+        }
+
+    def _cached(self, key: tuple[int, int]):
+        if not (item := self.cache.get(key)):
+            return False, None
+        expires, member = item
+        if expires < time.monotonic():
+            del self.cache[key]
+            return False, None
+        self.cache.move_to_end(key)
+        return True, member
+
+    def _store(self, key: tuple[int, int], member: discord.Member):
+        self.cache[key] = (time.monotonic() + self.ttl, member)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+    async def _fetch(self, guild: discord.Guild, user_id: int):
+        async with self.semaphore:
+            try:
+                member = await self.rest.run(
+                    lambda: guild.fetch_member(user_id),
+                    Priority.NORMAL
+                )
+            except discord.NotFound:
+                self.stats['not_found'] += 1
+                member = None
+        self._store((guild.id, user_id), member)
+        return member
+
+    async def get(self, guild: discord.Guild, user_id: int):
+        '''Returns the member with the given ID, or None if they are not in
+        the guild.'''
+        if (member := guild.get_member(user_id)):
+            self.stats['gateway_hits'] += 1
+            return member
+
+        key = (guild.id, user_id)
+        found, member = self._cached(key)
+        if found:
+            self.stats['cache_hits'] += 1
+            return member
+
+        self.stats['misses'] += 1
+        if not (task := self.inflight.get(key)):
+            task = self.inflight[key] = asyncio.ensure_future(
+                self._fetch(guild, user_id)
+            )
+            task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        with span('member fetches'):
+            return await asyncio.shield(task)
+
+    async def get_many(self, guild: discord.Guild, user_ids: list[int]):
+        '''Resolves several members concurrently, returning a list in the
+        same order as `user_ids`.'''
+        return await asyncio.gather(*(self.get(guild, user_id)
+                                      for user_id in user_ids))
+
+    def update(self, member: discord.Member):
+        key = (member.guild.id, member.id)
+        if key in self.cache:
+            self._store(key, member)
+
+    def invalidate(self, guild_id: int, user_id: int=None):
+        '''Forgets a cached member, or every member of a guild.'''
+        if user_id is not None:
+            self.cache.pop((guild_id, user_id), None)
+            return
+        for key in [key for key in self.cache if key[0] == guild_id]:
+            del self.cache[key]
@@ -0,0 +1,349 @@
+from collections import namedtuple
+from contextlib import contextmanager
+
+from sortedcontainers import SortedList
+
+from .database import AsyncMentorDbConn, current_timestamp
+
+
+# How far ahead of their join time each priority class is queued, in
+# milliseconds. The bonus is fixed, so a user who has waited longer than the
+# difference between two classes is ahead of anyone joining later in the
+# higher one: higher classes go first, but never starve the lower ones.
+PRIORITY_CLASSES = {
+    'normal': 0,
+    'first visit': 5 * 60 * 1000,
+    'boost': 15 * 60 * 1000,
+}
+# a user gets the first visit bonus if they were not helped in this window
+FIRST_VISIT_WINDOW = 24 * 60 * 60 * 1000
+
+
+class QueueEntry(namedtuple('QueueEntry',
+                            'channel_id is_active queued_time priority',
+                            defaults=(0, ))):
+    __slots__ = ()
+
+    @property
+    def sort_key(self):
+        '''The effective queued time, which orders the queue.'''
+        return self.queued_time - self.priority
+
+
+Invite = namedtuple('Invite', 'channel_id ta_id invited_time')
+
+
+def priority_class(priority: int):
+    '''Returns the name of the priority class with the given bonus.'''
+    for name, bonus in PRIORITY_CLASSES.items():
+        if bonus == priority:
+            return name
+    return f'+{priority // 1000} s'
+
+
+class ChannelQueue:
+    '''The users of one mentor channel, kept sorted by (sort_key, user_id).
+    Active users and queued users are stored separately so that the next
+    queued user is always at the front of `queued`.'''
+
+    def __init__(self):
+        self.active = SortedList()
+        self.queued = SortedList()
+
+    def __len__(self):
+        return len(self.active) + len(self.queued)
+
+    def add(self, key: tuple[int, int], is_active: bool):
+        (self.active if is_active else self.queued).add(key)
+
+    def remove(self, key: tuple[int, int], is_active: bool):
+        (self.active if is_active else self.queued).remove(key)
+
+    def position(self, key: tuple[int, int]):
+        '''Returns the 1-based number of users, active or queued, that are
+        ordered no later than the given key.'''
+        return self.active.bisect_right(key) + self.queued.bisect_right(key)
+
+
+class MentorQueues:
+    '''Authoritative in-memory state of the mentor_users table.
+
+    Reads are answered from per-channel sorted lists in O(log n) or better,
+    and every change is written behind to the database through the
+    AsyncMentorDbConn writer thread, which preserves submission order.
+    Functions in `listeners` are called with (guild_id, channel_id) whenever
+    a channel's users change.
+
+    Queued users who were invited by a TA are tracked in `invites` until
+    they join, are skipped or leave the queue, so that they are not invited
+    twice.'''
+
+    def __init__(self, db: AsyncMentorDbConn):
+        self.db = db
+        self.users = {}
+        self.channels = {}
+        self.invites = {}
+        self.pending = None
+        self.listeners = []
+
+    def load(self, rows):
+        '''Rebuilds the queues from mentor_users rows, as returned by
+        MentorDbConn.get_all_users.'''
+        self.users.clear()
+        self.channels.clear()
+        self.invites.clear()
+        for (guild_id, user_id, channel_id, queued_time, is_active,
+             priority) in rows:
+            self._insert(guild_id, user_id, QueueEntry(channel_id,
+                                                       bool(is_active),
+                                                       queued_time,
+                                                       priority))
+
+    def load_invites(self, rows):
+        '''Loads invites from MentorDbConn.get_invites rows. Invites of users
+        who are no longer queued are ignored.'''
+        for guild_id, user_id, channel_id, ta_id, invited_time in rows:
+            entry = self.users.get((guild_id, user_id))
+            if entry and not entry.is_active:
+                self.invites[guild_id, user_id] = Invite(channel_id,
+                                                         ta_id,
+                                                         invited_time)
+
+    def _channel(self, guild_id: int, channel_id: int):
+        key = (guild_id, channel_id)
+        if not (queue := self.channels.get(key)):
+            queue = self.channels[key] = ChannelQueue()
+        return queue
+
+    def _notify(self, guild_id: int, channel_id: int):
+        for listener in self.listeners:
+            listener(guild_id, channel_id)
+
+    def _insert(self, guild_id: int, user_id: int, entry: QueueEntry):
+        self.users[guild_id, user_id] = entry
+        self._channel(guild_id, entry.channel_id).add(
+            (entry.sort_key, user_id), entry.is_active
+        )
+        self._notify(guild_id, entry.channel_id)
+
+    def _remove(self, guild_id: int, user_id: int):
+        if not (entry := self.users.pop((guild_id, user_id), None)):
+            return None
+        key = (guild_id, entry.channel_id)
+        queue = self.channels[key]
+        queue.remove((entry.sort_key, user_id), entry.is_active)
+        if not queue:
+            del self.channels[key]
+        if self.invites.pop((guild_id, user_id), None):
+            self._persist('delete_invite', guild_id, user_id)
+        self._notify(guild_id, entry.channel_id)
+        return entry
+
+    def _persist(self, method: str, *args):
+        if self.pending is not None:
+            self.pending.append((method, args, {}))
+            return
+        self.db.submit_logged(method, *args, what='persist queue change')
+
+    @contextmanager
+    def batch(self):
+        '''Collects the writes made inside the block, e.g. by one command, and
+        persists them in a single transaction when it exits. The block must
+        not await, or writes from other tasks would join the batch.'''
+        if self.pending is not None:
+            yield self
+            return
+        self.pending = []
+        try:
+            yield self
+        finally:
+            calls, self.pending = self.pending, None
+            if calls:
+                self.db.submit_logged('run_batch', calls,
+                                      what='persist queue change')
+
+    def get_user_info(self, guild_id: int, user_id: int, fetch_pos: bool):
+        '''Same as MentorDbConn.get_user_info.'''
+        if not (entry := self.users.get((guild_id, user_id))):
+            return (None, None, None) if fetch_pos else (None, None)
+        if not fetch_pos:
+            return entry.channel_id, entry.is_active
+        queue = self.channels[guild_id, entry.channel_id]
+        position = queue.position((entry.sort_key, user_id))
+        return entry.channel_id, entry.is_active, position
+
+    def get_users(self, guild_id: int, channel_id: int):
+        '''Returns two lists: the active users of a channel, and the users
+        currently in the queue.'''
+        if not (queue := self.channels.get((guild_id, channel_id))):
+            return [], []
+        return ([user_id for _, user_id in queue.active],
+                [user_id for _, user_id in queue.queued])
+
+    def get_active_users(self, guild_id: int, channel_id: int):
+        return self.get_users(guild_id, channel_id)[0]
+
+    def get_next_user(self, guild_id: int, channel_id: int):
+        queue = self.channels.get((guild_id, channel_id))
+        if not queue or not queue.queued:
+            return None
+        return queue.queued[0][1]
+
+    def next_uninvited(self, guild_id: int, channel_id: int, count: int):
+        '''Returns up to `count` queued users of a channel that have no
+        pending invite, in queue order.'''
+        if not (queue := self.channels.get((guild_id, channel_id))):
+            return []
+        user_ids = []
+        for _, user_id in queue.queued:
+            if len(user_ids) == count:
+                break
+            if (guild_id, user_id) not in self.invites:
+                user_ids.append(user_id)
+        return user_ids
+
+    def queued_ahead(self, guild_id: int, user_id: int):
+        '''Returns the number of queued users in front of a queued user, or
+        None if the user is not queued.'''
+        entry = self.users.get((guild_id, user_id))
+        if not entry or entry.is_active:
+            return None
+        queue = self.channels[guild_id, entry.channel_id]
+        return queue.queued.bisect_left((entry.sort_key, user_id))
+
+    def queue_length(self, guild_id: int, channel_id: int):
+        if not (queue := self.channels.get((guild_id, channel_id))):
+            return 0
+        return len(queue.queued)
+
+    def add_user(self,
+                 guild_id: int,
+                 user_id: int,
+                 channel_id: int,
+                 priority: int=0):
+        if (guild_id, user_id) in self.users:
+            return 0
+        timestamp = current_timestamp()
+        self._insert(guild_id, user_id, QueueEntry(channel_id,
+                                                   False,
+                                                   timestamp,
+                                                   priority))
+        self._persist('add_user', guild_id, user_id, channel_id, timestamp,
+                      priority)
+        return 1
+
+    def import_users(self, rows):
+        '''Adds users from rows like those of MentorDbConn.get_all_users,
+        keeping their join times, and persists them in one import. Users who
+        are already queued are skipped. Returns the number of users added.'''
+        added = []
+        for (guild_id, user_id, channel_id, queued_time, is_active,
+             priority) in rows:
+            if (guild_id, user_id) in self.users:
+                continue
+            self._insert(guild_id, user_id, QueueEntry(channel_id,
+                                                       bool(is_active),
+                                                       queued_time,
+                                                       priority))
+            added.append((guild_id, user_id, channel_id, queued_time,
+                          bool(is_active), priority))
+        if added:
+            self._persist('import_users', added)
+        return len(added)
+
+    def set_priority(self, guild_id: int, user_id: int, priority: int):
+        '''Moves a user to their place for a new priority bonus, keeping
+        their join time and any pending invite.'''
+        if not (entry := self.users.get((guild_id, user_id))):
+            return 0
+        queue = self.channels[guild_id, entry.channel_id]
+        queue.remove((entry.sort_key, user_id), entry.is_active)
+        entry = self.users[guild_id, user_id] = entry._replace(
+            priority=priority
+        )
+        queue.add((entry.sort_key, user_id), entry.is_active)
+        self._notify(guild_id, entry.channel_id)
+        self._persist('set_priority', guild_id, user_id, priority)
+        return 1
+
+    def make_active(self, guild_id: int, user_id: int, is_active: bool=True):
+        if not (entry := self._remove(guild_id, user_id)):
+            return 0
+        self._insert(guild_id, user_id, entry._replace(is_active=is_active))
+        self._persist('make_active', guild_id, user_id, is_active)
+        return 1
+
+    def delete_user(self, guild_id: int, user_id: int):
+        if not self._remove(guild_id, user_id):
+            return 0
+        self._persist('delete_user', guild_id, user_id)
+        return 1
+
+    def clear_active_users(self, guild_id: int, channel_id: int):
+        '''Removes every active user of a channel and returns their IDs.'''
+        user_ids = self.get_active_users(guild_id, channel_id)
+        for user_id in user_ids:
+            self._remove(guild_id, user_id)
+        if user_ids:
+            self._persist('clear_active_users', guild_id, channel_id)
+        return user_ids
+
+    def clear_users(self, guild_id: int, channel_id: int):
+        '''Removes every user of a channel and returns two lists: the active
+        users and the queued users that were removed.'''
+        active, queued = self.get_users(guild_id, channel_id)
+        if active or queued:
+            self.drop_channel(guild_id, channel_id)
+            self._persist('clear_users', guild_id, channel_id)
+        return active, queued
+
+    def skip_user(self, guild_id: int, user_id: int):
+        '''Moves a queued user to the end of the queue, dropping their
+        priority bonus.'''
+        entry = self.users.get((guild_id, user_id))
+        if not entry or entry.is_active:
+            return
+        timestamp = current_timestamp()
+        self._remove(guild_id, user_id)
+        self._insert(guild_id, user_id, entry._replace(queued_time=timestamp,
+                                                       priority=0))
+        self._persist('skip_user', guild_id, user_id, timestamp)
+
+    def invite_users(self,
+                     guild_id: int,
+                     channel_id: int,
+                     ta_id: int,
+                     count: int=1):
+        '''Claims the next `count` uninvited queued users of a channel for a
+        TA, persisting all invites in one transaction, and returns their
+        IDs in queue order.'''
+        user_ids = self.next_uninvited(guild_id, channel_id, count)
+        timestamp = current_timestamp()
+        with self.batch():
+            for user_id in user_ids:
+                self.invites[guild_id, user_id] = Invite(channel_id,
+                                                         ta_id,
+                                                         timestamp)
+                self._persist('add_invite', guild_id, user_id, channel_id,
+                              ta_id, timestamp)
+        return user_ids
+
+    def cancel_invite(self, guild_id: int, user_id: int):
+        '''Withdraws a user's invite, keeping them in the queue.'''
+        if not self.invites.pop((guild_id, user_id), None):
+            return 0
+        self._persist('delete_invite', guild_id, user_id)
+        return 1
+
+    def drop_channel(self, guild_id: int, channel_id: int):
+        '''Forgets every user of a channel and returns their IDs. The rows
+        themselves are removed by MentorDbConn.delete_mentor_channel.'''
+        if not (queue := self.channels.pop((guild_id, channel_id), None)):
+            return []
+        user_ids = [user_id for _, user_id in [*queue.active, *queue.queued]]
+        for user_id in user_ids:
+            del self.users[guild_id, user_id]
+            if self.invites.pop((guild_id, user_id), None):
+                self._persist('delete_invite', guild_id, user_id)
+        self._notify(guild_id, channel_id)
+        return user_ids
@@ -0,0 +1,245 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from .profiling import PROFILER
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05,
+              0.1, 0.5, 1)
+
+
+def format_labels(names: tuple[str], values: tuple, extra: str=''):
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    '''Base class of the metric types. Values are kept per tuple of label
+    values and may be updated from any thread.'''
+
+    type = None
+
+    def __init__(self, name: str, doc: str, labels: tuple[str]=()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, '', value)
+                    for key, value in self.values.items()]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.doc}',
+                 f'# TYPE {self.name} {self.type}']
+        for name, key, extra, value in self.samples():
+            labels = format_labels(self.labels, key, extra)
+            lines.append(f'{name}{labels} {value}')
+        return '\n'.join(lines)
+
+
+class CollectedMetric(Metric):
+    '''A metric with one sample per label values, which is either updated
+    directly or, if a collector function is given, computed at scrape time.
+    Collectors return a dict mapping tuples of label values to values.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.collectors = []
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        self.collectors.remove(collector)
+
+    def samples(self):
+        samples = super().samples()
+        for collector in self.collectors:
+            samples += [(self.name, tuple(map(str, key)), '', value)
+                        for key, value in collector().items()]
+        return samples
+
+
+class Counter(CollectedMetric):
+    '''A counter. Collectors must return running totals that only reset
+    when the process restarts.'''
+
+    type = 'counter'
+
+    def inc(self, amount: float=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(CollectedMetric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, *args, buckets: tuple[float]=DEFAULT_BUCKETS,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            if not (state := self.values.get(key)):
+                state = self.values[key] = [[0] * len(self.buckets), 0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append((f'{self.name}_bucket', key,
+                                    f'le="{bound}"', cumulative))
+                samples.append((f'{self.name}_bucket', key,
+                                'le="+Inf"', count))
+                samples.append((f'{self.name}_sum', key, '', total))
+                samples.append((f'{self.name}_count', key, '', count))
+        return samples
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        return '\n'.join(metric.render()
+                         for metric in self.metrics.values()) + '\n'
+
+
+REGISTRY = Registry()
+
+command_latency = REGISTRY.register(Histogram(
+    'ta_bot_command_seconds',
+    'Time spent handling slash commands and components',
+    ('command', )
+))
+db_query_latency = REGISTRY.register(Histogram(
+    'ta_bot_db_query_seconds',
+    'Time spent in MentorStore methods on the database thread',
+    ('method', ),
+    buckets=DB_BUCKETS
+))
+lock_wait = REGISTRY.register(Histogram(
+    'ta_bot_lock_wait_seconds',
+    'Time spent waiting for interaction locks',
+    ('kind', ),
+    buckets=(0.0001, 0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60)
+))
+queue_length = REGISTRY.register(Gauge(
+    'ta_bot_queue_length',
+    'Number of users waiting in each mentor queue',
+    ('guild', 'channel')
+))
+discord_requests = REGISTRY.register(Counter(
+    'ta_bot_discord_http_requests_total',
+    'Discord HTTP API calls made by the bot',
+    ('method', 'route')
+))
+rest_queue_depth = REGISTRY.register(Gauge(
+    'ta_bot_rest_queue_depth',
+    'Outbound Discord calls waiting in the scheduler per bucket',
+    ('bucket', )
+))
+command_errors = REGISTRY.register(Counter(
+    'ta_bot_command_errors_total',
+    'Exceptions raised by commands',
+    ('command', 'error')
+))
+member_lookups = REGISTRY.register(Counter(
+    'ta_bot_member_lookups_total',
+    'Member resolver lookups by outcome',
+    ('outcome', )
+))
+
+
+@asynccontextmanager
+async def track(command: str):
+    '''Records the duration of a command in command_latency, and profiles it
+    while the profiler is active.'''
+    with command_latency.time(command=command):
+        if PROFILER.active:
+            async with PROFILER.profile(command):
+                yield
+        else:
+            yield
+
+
+def timed(command: str):
+    '''Decorates a coroutine function to track it as `command`.'''
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            async with track(command):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+async def serve(host: str, port: int, registry: Registry=REGISTRY):
+    '''Serves the registry in the Prometheus text format over HTTP.'''
+
+    async def handle(reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            method, path, *_ = request.decode('latin-1').split() + ['', '']
+            if method == 'GET' and path.split('?')[0] == '/metrics':
+                status, body = '200 OK', registry.render()
+            else:
+                status, body = '404 Not Found', 'Not found\n'
+            body = body.encode()
+            writer.write(f'HTTP/1.1 {status}\r\n'
+                         'Content-Type: text/plain; version=0.0.4\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
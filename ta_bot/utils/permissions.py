@@ -0,0 +1,57 @@
+import discord
+
+
+# the overwrites the bot grants in mentor channels: invited users can see the
+# channel, active users can also talk in it
+INVITE_OVERWRITE = discord.PermissionOverwrite(read_messages=True)
+ACTIVE_OVERWRITE = discord.PermissionOverwrite(send_messages=True)
+
+
+def current_overwrites(channel: discord.abc.GuildChannel):
+    '''Returns the channel's overwrites keyed by target ID.
+
+    Unlike `channel.overwrites`, members missing from the member cache are
+    kept (as `discord.Object`), so that writing the result back does not drop
+    their overwrites.'''
+    overwrites = {}
+    for raw in channel._overwrites:
+        if raw.type in ('role', 0):
+            if not (target := channel.guild.get_role(raw.id)):
+                continue
+        else:
+            target = (channel.guild.get_member(raw.id) or
+                      discord.Object(id=raw.id))
+        overwrite = discord.PermissionOverwrite.from_pair(
+            discord.Permissions(int(raw.allow)),
+            discord.Permissions(int(raw.deny))
+        )
+        overwrites[raw.id] = (target, overwrite)
+    return overwrites
+
+
+async def edit_member_overwrites(
+    channel: discord.abc.GuildChannel,
+    changes: dict[int, discord.PermissionOverwrite],
+    reason: str=None
+):
+    '''Replaces the overwrites of several members in a single channel edit.
+    `changes` maps member IDs to their new overwrite, or to None to remove
+    it. Returns the number of overwrites that actually changed; no request is
+    made if nothing did.'''
+    overwrites = current_overwrites(channel)
+    changed = 0
+    for member_id, overwrite in changes.items():
+        current = overwrites.get(member_id)
+        if overwrite is None or overwrite.is_empty():
+            if current:
+                del overwrites[member_id]
+                changed += 1
+        elif not current or current[1] != overwrite:
+            target = current[0] if current else discord.Object(id=member_id)
+            overwrites[member_id] = (target, overwrite)
+            changed += 1
+
+    if changed:
+        await channel.edit(overwrites=dict(overwrites.values()),
+                           reason=reason)
+    return changed
@@ -0,0 +1,133 @@
+import contextvars
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager, contextmanager
+
+
+current_profile = contextvars.ContextVar('current_profile', default=None)
+
+
+class CommandProfile:
+    '''Timing breakdown of a single command invocation.'''
+
+    def __init__(self, command: str):
+        self.command = command
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.spans = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.profiler = None
+
+
+class CommandProfiler:
+    '''Profiles slash commands and component handlers for a limited time
+    window, and writes the profile of every invocation slower than a
+    threshold to disk.
+
+    Every invocation gets a breakdown of the time spent awaiting storage,
+    member lookups, permission edits and interaction responses. A sampled
+    fraction also runs under cProfile, one at a time since cProfile sees the
+    whole event loop thread. When no window is open, the only cost is
+    checking `active`.'''
+
+    def __init__(self, directory: str='profiles'):
+        self.directory = directory
+        self.logger = logging.getLogger(__name__)
+        self.active = False
+        self.until = 0
+        self.threshold = 0.5
+        self.sample_rate = 1.0
+        self.cprofile_busy = False
+        self.written = 0
+
+    def enable(self,
+               duration: float,
+               threshold: float=0.5,
+               sample_rate: float=1.0):
+        self.until = time.monotonic() + duration
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.written = 0
+        self.active = True
+
+    def disable(self):
+        self.active = False
+
+    @asynccontextmanager
+    async def profile(self, command: str):
+        if time.monotonic() >= self.until:
+            self.active = False
+            yield
+            return
+
+        profile = CommandProfile(command)
+        token = current_profile.set(profile)
+        if not self.cprofile_busy and random.random() < self.sample_rate:
+            self.cprofile_busy = True
+            profile.profiler = cProfile.Profile()
+            profile.profiler.enable()
+        try:
+            yield
+        finally:
+            if profile.profiler:
+                profile.profiler.disable()
+                self.cprofile_busy = False
+            current_profile.reset(token)
+            profile.elapsed = time.perf_counter() - profile.start
+            if profile.elapsed >= self.threshold:
+                self.write(profile)
+
+    def write(self, profile: CommandProfile):
+        os.makedirs(self.directory, exist_ok=True)
+        name = re.sub(r'[^\w-]+', '_', profile.command)
+        path = os.path.join(self.directory,
+                            f'{int(time.time() * 1000)}-{name}')
+
+        report = io.StringIO()
+        report.write(f'command: {profile.command}\n'
+                     f'elapsed: {profile.elapsed * 1000:.1f} ms\n\n')
+        accounted = 0
+        for span, seconds in sorted(profile.spans.items(),
+                                    key=lambda item: -item[1]):
+            accounted += seconds
+            report.write(f'{span:<24} {seconds * 1000:9.1f} ms '
+                         f'({profile.calls[span]} calls)\n')
+        report.write(f'{"other":<24} '
+                     f'{max(0, profile.elapsed - accounted) * 1000:9.1f} ms\n')
+
+        if profile.profiler:
+            profile.profiler.dump_stats(path + '.prof')
+            report.write('\n')
+            stats = pstats.Stats(profile.profiler, stream=report)
+            stats.sort_stats('cumulative').print_stats(30)
+
+        with open(path + '.txt', 'w') as file:
+            file.write(report.getvalue())
+        self.written += 1
+        self.logger.info('Wrote profile of slow command %s to %s.txt',
+                         profile.command, path)
+
+
+@contextmanager
+def span(name: str):
+    '''Attributes the time spent in the block to `name` in the current
+    command's profile, if one is being recorded.'''
+    if not (profile := current_profile.get()):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.spans[name] += time.perf_counter() - start
+        profile.calls[name] += 1
+
+
+PROFILER = CommandProfiler()
@@ -0,0 +1,198 @@
+import asyncio
+import logging
+
+import discord
+
+from .channel_registry import MentorChannelRegistry
+from .database import AsyncMentorDbConn
+from .mentor_queue import MentorQueues
+from .permissions import (ACTIVE_OVERWRITE,
+                          INVITE_OVERWRITE,
+                          current_overwrites)
+from .rest_scheduler import Priority, RestScheduler
+
+
+class ReconcileReport:
+    '''Drift found by a reconciliation run. `stale` counts bot overwrites
+    of users who are no longer in the channel, `missing` active users
+    without their overwrite.'''
+
+    def __init__(self):
+        self.channels = 0
+        self.stale = 0
+        self.missing = 0
+        self.fixed = 0
+        self.failed = 0
+
+    def __iadd__(self, other: 'ReconcileReport'):
+        self.channels += other.channels
+        self.stale += other.stale
+        self.missing += other.missing
+        self.fixed += other.fixed
+        self.failed += other.failed
+        return self
+
+    def __str__(self):
+        return (f'{self.channels} channels checked, '
+                f'{self.stale} stale and {self.missing} missing overwrites '
+                f'found, {self.fixed} fixed, {self.failed} channels failed')
+
+
+def overwrite_drift(channel: discord.abc.GuildChannel,
+                    active: set[int],
+                    queued: set[int],
+                    granted: set[int]):
+    '''Returns the member overwrite changes that bring a mentor channel in
+    line with its queue.
+
+    Active users must have the active overwrite. The overwrites the bot
+    granted are removed from users who are no longer active, except that
+    queued users may keep an invite. Other overwrites were set by hand and
+    are left alone, even if they look the same.'''
+    changes = {}
+    overwrites = current_overwrites(channel)
+    for target_id, (target, overwrite) in overwrites.items():
+        if (isinstance(target, discord.Role) or target_id in active or
+            target_id not in granted):
+            continue
+        if (overwrite == ACTIVE_OVERWRITE or
+            overwrite == INVITE_OVERWRITE and target_id not in queued):
+            changes[target_id] = None
+    for user_id in active:
+        if (not (current := overwrites.get(user_id)) or
+            current[1] != ACTIVE_OVERWRITE):
+            changes[user_id] = ACTIVE_OVERWRITE
+    return changes
+
+
+class OverwriteReconciler:
+    '''Repairs the permission overwrites of mentor channels that drifted
+    from the queues, e.g. after a crash between a queue change and its
+    permission edit. At most `concurrency` channels are repaired at a
+    time, at background priority.
+
+    Member overwrites are edited through `edit_overwrites`, which records
+    the grants in the mentor_grants table, so that only overwrites the bot
+    granted are ever removed.'''
+
+    def __init__(self,
+                 db: AsyncMentorDbConn,
+                 queues: MentorQueues,
+                 channels: MentorChannelRegistry,
+                 rest: RestScheduler,
+                 concurrency: int=4):
+        self.db = db
+        self.queues = queues
+        self.channels = channels
+        self.rest = rest
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.logger = logging.getLogger(__name__)
+        # (guild_id, channel_id) -> IDs of the members granted an overwrite
+        self.grants = {}
+        # (guild_id, channel_id, user_id) -> the latest edit of the member
+        self.latest = {}
+
+    def load(self, rows):
+        '''Loads grants from MentorDbConn.get_grants rows.'''
+        self.grants.clear()
+        for guild_id, channel_id, user_id in rows:
+            self.grants.setdefault((guild_id, channel_id), set()).add(user_id)
+
+    def _submit(self, method: str, *args):
+        self.db.submit_logged(method, *args, what='record overwrite grants')
+
+    def _forget(self, guild_id: int, channel_id: int, user_ids):
+        granted = self.grants.get((guild_id, channel_id), set())
+        if (user_ids := [user_id for user_id in user_ids
+                         if user_id in granted]):
+            granted.difference_update(user_ids)
+            self._submit('delete_grants', guild_id, channel_id, user_ids)
+
+    async def edit_overwrites(self,
+                              channel: discord.abc.GuildChannel,
+                              changes: dict[int, discord.PermissionOverwrite],
+                              priority: Priority=Priority.NORMAL):
+        '''Applies member overwrite changes like
+        RestScheduler.edit_overwrites. Grants are recorded before the edit,
+        removals only after it succeeded and if no later edit of the same
+        member was made meanwhile, so no granted overwrite is forgotten.'''
+        key = (channel.guild.id, channel.id)
+        granted = self.grants.setdefault(key, set())
+        if (added := [user_id for user_id, overwrite in changes.items()
+                      if overwrite is not None and user_id not in granted]):
+            granted.update(added)
+            self._submit('add_grants', *key, added)
+        token = object()
+        for user_id in changes:
+            self.latest[(*key, user_id)] = token
+        try:
+            result = await self.rest.edit_overwrites(channel,
+                                                     changes,
+                                                     priority)
+        finally:
+            latest = [user_id for user_id in changes
+                      if self.latest.get((*key, user_id)) is token]
+            for user_id in latest:
+                del self.latest[(*key, user_id)]
+        self._forget(*key, [user_id for user_id in latest
+                            if changes[user_id] is None])
+        return result
+
+    async def reconcile_channel(self,
+                                channel: discord.abc.GuildChannel,
+                                dry_run: bool=False):
+        report = ReconcileReport()
+        report.channels = 1
+        async with self.semaphore:
+            key = (channel.guild.id, channel.id)
+            active, queued = map(set, self.queues.get_users(*key))
+            granted = self.grants.get(key, set())
+            changes = overwrite_drift(channel, active, queued, granted)
+            report.missing = sum(overwrite is not None
+                                 for overwrite in changes.values())
+            report.stale = len(changes) - report.missing
+            if dry_run:
+                return report
+            # grants whose overwrite was removed by hand
+            overwrites = current_overwrites(channel)
+            self._forget(*key, [user_id for user_id in granted
+                                if user_id not in overwrites and
+                                   user_id not in active and
+                                   user_id not in queued and
+                                   (*key, user_id) not in self.latest])
+            if not changes:
+                return report
+            try:
+                await self.edit_overwrites(channel,
+                                           changes,
+                                           Priority.BACKGROUND)
+            except discord.HTTPException as ex:
+                self.logger.warning('Could not reconcile #%s: %s',
+                                    channel, ex)
+                report.failed = 1
+            else:
+                report.fixed = len(changes)
+        return report
+
+    async def reconcile_guild(self,
+                              guild: discord.Guild,
+                              dry_run: bool=False):
+        report = ReconcileReport()
+        channels = [
+            channel
+            for channel_id in await self.channels.get_channels(guild.id)
+            if (channel := guild.get_channel(channel_id))
+        ]
+        for result in await asyncio.gather(*(
+            self.reconcile_channel(channel, dry_run) for channel in channels
+        )):
+            report += result
+        return report
+
+    async def reconcile_all(self, guilds: list[discord.Guild]):
+        report = ReconcileReport()
+        for result in await asyncio.gather(*(self.reconcile_guild(guild)
+                                             for guild in guilds)):
+            report += result
+        self.logger.info('Reconciled permission overwrites: %s', report)
+        return report
@@ -0,0 +1,856 @@
+import hashlib
+import socket
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from .database import current_timestamp
+from .storage import IMPORT_BATCH_SIZE, MentorStore, batched
+
+
+class RedisError(Exception):
+    '''An error reply from the server.'''
+
+
+class RespClient:
+    '''A minimal blocking client for servers speaking the Redis protocol
+    (RESP2). Only what RedisMentorStore needs is implemented: single
+    commands and pipelined MULTI/EXEC transactions.'''
+
+    def __init__(self,
+                 host: str='localhost',
+                 port: int=6379,
+                 db: int=0,
+                 password: str=None,
+                 timeout: float=5):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        # commands sent on every new connection, e.g. SCRIPT LOAD
+        self.setup = []
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port),
+                                             timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile('rb')
+        setup = []
+        if self.password:
+            setup.append(('AUTH', self.password))
+        if self.db:
+            setup.append(('SELECT', self.db))
+        setup.extend(self.setup)
+        if setup:
+            self._send(setup)
+            for _ in setup:
+                self._check(self._read())
+
+    def close(self):
+        if self.sock:
+            self.file.close()
+            self.sock.close()
+            self.sock = self.file = None
+
+    @staticmethod
+    def _encode(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode()
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _send(self, commands):
+        self.sock.sendall(b''.join(self._encode(args) for args in commands))
+
+    def _read(self):
+        line = self.file.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('Connection closed by the server')
+        kind, value = line[:1], line[1:-2]
+        if kind == b'+':
+            return value.decode()
+        if kind == b'-':
+            return RedisError(value.decode())
+        if kind == b':':
+            return int(value)
+        if kind == b'$':
+            if (length := int(value)) < 0:
+                return None
+            data = self.file.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            if (length := int(value)) < 0:
+                return None
+            return [self._read() for _ in range(length)]
+        raise ConnectionError(f'Unexpected reply {line!r}')
+
+    @staticmethod
+    def _check(reply):
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def _roundtrip(self, commands):
+        if not self.sock:
+            self.connect()
+        try:
+            self._send(commands)
+            return [self._read() for _ in commands]
+        except (OSError, ConnectionError):
+            # the connection state is unknown, so start over next time
+            self.close()
+            raise
+
+    def execute(self, *args):
+        return self._check(self._roundtrip([args])[0])
+
+    def transaction(self, commands: list[tuple]):
+        '''Runs the commands atomically in one round trip and returns their
+        replies. Failed commands have a RedisError as their reply.'''
+        replies = self._roundtrip([('MULTI', ), *commands, ('EXEC', )])
+        for reply in replies[:-1]:
+            self._check(reply)
+        if (results := replies[-1]) is None:
+            raise RedisError('Transaction aborted')
+        return self._check(results)
+
+
+# Every script gets the key prefix and guild ID as its first two arguments.
+# Per guild, the store keeps
+#   {prefix}:{guild}:channels          hash channel -> description
+#   {prefix}:{guild}:users             hash user ->
+#                                      channel:queued_time:active:priority
+#   {prefix}:{guild}:queued:{channel}  zset of queued users by sort key
+#   {prefix}:{guild}:active:{channel}  zset of active users by sort key
+#   {prefix}:{guild}:invites           hash user -> channel:ta:invited_time
+#   {prefix}:{guild}:grants            set of channel:user overwrites granted
+#   {prefix}:{guild}:events            list of time:channel:user:event:ta
+#   {prefix}:{guild}:sessions          hash user -> activation time:ta
+#   {prefix}:{guild}:visits            hash user -> last activation time
+#   {prefix}:{guild}:stats             hash scope:id:metric:bucket -> count
+# and globally {prefix}:guilds, the guilds that have users or statistics,
+# {prefix}:dashboards, a hash guild:channel -> message, and {prefix}:version,
+# the layout version. The sort key is queued_time - priority, and entries
+# written before priorities existed have no priority field. Sorted set
+# members are user IDs zero-padded to 20 digits, so that users with the same
+# sort key are ordered by ID like in SQLite. Descriptions are stored with an
+# '=' in front, so that a missing description ('') differs from an empty
+# one ('=').
+LAYOUT_VERSION = 1
+
+SCRIPT_HEADER = '''
+local g = ARGV[1] .. ':' .. ARGV[2]
+local users = g .. ':users'
+local function entry(user)
+    local value = redis.call('HGET', users, user)
+    if not value then
+        return nil
+    end
+    local channel, time, active, priority =
+        string.match(value, '^(%d+):(%d+):(%d):?(%d*)$')
+    return channel, time, active, priority ~= '' and priority or '0'
+end
+local function score(time, priority)
+    return string.format('%d', tonumber(time) - tonumber(priority))
+end
+local function zset(channel, active)
+    return g .. (active == '1' and ':active:' or ':queued:') .. channel
+end
+local function member(user)
+    return string.rep('0', 20 - #user) .. user
+end
+local function set_entry(user, channel, time, active, priority)
+    redis.call('HSET', users, user,
+               table.concat({channel, time, active, priority}, ':'))
+    redis.call('ZADD', zset(channel, active), score(time, priority),
+               member(user))
+end
+local function clear(key)
+    local members = redis.call('ZRANGE', key, 0, -1)
+    for _, padded in ipairs(members) do
+        redis.call('HDEL', users, string.match(padded, '^0*(%d+)$'))
+    end
+    redis.call('DEL', key)
+    return #members
+end
+'''
+
+SCRIPTS = {
+    'migrate': '''
+        local version = tonumber(redis.call('GET', ARGV[1] .. ':version')
+                                 or '0')
+        if version >= tonumber(ARGV[3]) then
+            return version
+        end
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            g = ARGV[1] .. ':' .. guild
+            users = g .. ':users'
+            local values = redis.call('HGETALL', users)
+            for i = 1, #values, 2 do
+                local channel, time, active, priority = entry(values[i])
+                redis.call('ZREM', zset(channel, active), values[i])
+                set_entry(values[i], channel, time, active, priority)
+            end
+            local channels = redis.call('HGETALL', g .. ':channels')
+            for i = 1, #channels, 2 do
+                if channels[i + 1] ~= '' then
+                    redis.call('HSET', g .. ':channels', channels[i],
+                               '=' .. channels[i + 1])
+                end
+            end
+        end
+        redis.call('SET', ARGV[1] .. ':version', ARGV[3])
+        return version
+    ''',
+    'update_mentor_channel': '''
+        redis.call('HSET', g .. ':channels', ARGV[3], ARGV[4])
+        redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        return 1
+    ''',
+    'get_all_channels': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            local channels = redis.call('HKEYS', ARGV[1] .. ':' .. guild
+                                                 .. ':channels')
+            for _, channel in ipairs(channels) do
+                rows[#rows + 1] = guild .. ':' .. channel
+            end
+        end
+        return rows
+    ''',
+    'import_channels': '''
+        for i = 3, #ARGV, 2 do
+            redis.call('HSET', g .. ':channels', ARGV[i], ARGV[i + 1])
+        end
+        redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        return (#ARGV - 2) / 2
+    ''',
+    'delete_mentor_channel': '''
+        redis.call('HDEL', g .. ':channels', ARGV[3])
+        redis.call('HDEL', ARGV[1] .. ':dashboards', ARGV[2] .. ':' .. ARGV[3])
+        for _, grant in ipairs(redis.call('SMEMBERS', g .. ':grants')) do
+            if string.sub(grant, 1, #ARGV[3] + 1) == ARGV[3] .. ':' then
+                redis.call('SREM', g .. ':grants', grant)
+            end
+        end
+        return clear(zset(ARGV[3], '1')) + clear(zset(ARGV[3], '0'))
+    ''',
+    'delete_guild': '''
+        local count = 0
+        local values = redis.call('HGETALL', users)
+        for i = 1, #values, 2 do
+            local channel, time, active = entry(values[i])
+            redis.call('DEL', zset(channel, active))
+            count = count + 1
+        end
+        count = count + redis.call('HLEN', g .. ':channels')
+                      + redis.call('HLEN', g .. ':invites')
+                      + redis.call('SCARD', g .. ':grants')
+        redis.call('DEL', users, g .. ':channels', g .. ':invites',
+                   g .. ':grants')
+        local dashboards = ARGV[1] .. ':dashboards'
+        for _, key in ipairs(redis.call('HKEYS', dashboards)) do
+            if string.sub(key, 1, #ARGV[2] + 1) == ARGV[2] .. ':' then
+                redis.call('HDEL', dashboards, key)
+                count = count + 1
+            end
+        end
+        return count
+    ''',
+    'get_user_info': '''
+        local channel, time, active, priority = entry(ARGV[3])
+        if not channel then
+            return nil
+        end
+        local key = score(time, priority)
+        local position = redis.call('ZCOUNT', zset(channel, '0'), '-inf', key)
+            + redis.call('ZCOUNT', zset(channel, '1'), '-inf', key)
+        return {channel, active, position}
+    ''',
+    'get_users': '''
+        return {redis.call('ZRANGE', zset(ARGV[3], '1'), 0, -1),
+                redis.call('ZRANGE', zset(ARGV[3], '0'), 0, -1)}
+    ''',
+    'get_all_users': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            local values = redis.call('HGETALL', ARGV[1] .. ':' .. guild
+                                                 .. ':users')
+            for i = 1, #values, 2 do
+                rows[#rows + 1] = guild .. ':' .. values[i] .. ':'
+                                  .. values[i + 1]
+            end
+        end
+        return rows
+    ''',
+    'add_user': '''
+        if redis.call('HEXISTS', users, ARGV[3]) == 1 then
+            return redis.error_reply('user is already queued')
+        end
+        set_entry(ARGV[3], ARGV[4], ARGV[5], '0', ARGV[6])
+        redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        return 1
+    ''',
+    'import_users': '''
+        local count = 0
+        for i = 3, #ARGV, 5 do
+            if redis.call('HEXISTS', users, ARGV[i]) == 0 then
+                set_entry(ARGV[i], ARGV[i + 1], ARGV[i + 2], ARGV[i + 3],
+                          ARGV[i + 4])
+                count = count + 1
+            end
+        end
+        if count > 0 then
+            redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        end
+        return count
+    ''',
+    'make_active': '''
+        local channel, time, active, priority = entry(ARGV[3])
+        if not channel then
+            return 0
+        end
+        redis.call('ZREM', zset(channel, active), member(ARGV[3]))
+        set_entry(ARGV[3], channel, time, ARGV[4], priority)
+        return 1
+    ''',
+    'set_priority': '''
+        local channel, time, active = entry(ARGV[3])
+        if not channel then
+            return 0
+        end
+        set_entry(ARGV[3], channel, time, active, ARGV[4])
+        return 1
+    ''',
+    'delete_users': '''
+        local count = 0
+        for i = 3, #ARGV do
+            local channel, time, active = entry(ARGV[i])
+            if channel then
+                redis.call('ZREM', zset(channel, active), member(ARGV[i]))
+                redis.call('HDEL', users, ARGV[i])
+                count = count + 1
+            end
+        end
+        return count
+    ''',
+    'clear_active_users': '''
+        return clear(zset(ARGV[3], '1'))
+    ''',
+    'clear_users': '''
+        return clear(zset(ARGV[3], '1')) + clear(zset(ARGV[3], '0'))
+    ''',
+    'skip_user': '''
+        local channel, time, active = entry(ARGV[3])
+        if not channel or active == '1' then
+            return nil
+        end
+        set_entry(ARGV[3], channel, ARGV[4], '0', '0')
+        return nil
+    ''',
+    'add_invite': '''
+        redis.call('HSET', g .. ':invites', ARGV[3],
+                   table.concat(ARGV, ':', 4, 6))
+        redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        return 1
+    ''',
+    'get_invites': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            local values = redis.call('HGETALL', ARGV[1] .. ':' .. guild
+                                                 .. ':invites')
+            for i = 1, #values, 2 do
+                rows[#rows + 1] = guild .. ':' .. values[i] .. ':'
+                                  .. values[i + 1]
+            end
+        end
+        return rows
+    ''',
+    'add_grants': '''
+        local count = 0
+        for i = 4, #ARGV do
+            count = count + redis.call('SADD', g .. ':grants',
+                                       ARGV[3] .. ':' .. ARGV[i])
+        end
+        redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        return count
+    ''',
+    'delete_grants': '''
+        local count = 0
+        for i = 4, #ARGV do
+            count = count + redis.call('SREM', g .. ':grants',
+                                       ARGV[3] .. ':' .. ARGV[i])
+        end
+        return count
+    ''',
+    'get_grants': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            local grants = redis.call('SMEMBERS', ARGV[1] .. ':' .. guild
+                                                  .. ':grants')
+            for _, grant in ipairs(grants) do
+                rows[#rows + 1] = guild .. ':' .. grant
+            end
+        end
+        return rows
+    ''',
+    'add_event': '''
+        redis.call('RPUSH', g .. ':events',
+                   ARGV[7] .. ':' .. table.concat(ARGV, ':', 3, 6))
+        if ARGV[5] == 'activate' then
+            redis.call('HSET', g .. ':sessions', ARGV[4],
+                       ARGV[7] .. ':' .. ARGV[6])
+            redis.call('HSET', g .. ':visits', ARGV[4], ARGV[7])
+        else
+            redis.call('HDEL', g .. ':sessions', ARGV[4])
+        end
+        return 1
+    ''',
+    'get_active_sessions': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            g = ARGV[1] .. ':' .. guild
+            users = g .. ':users'
+            local values = redis.call('HGETALL', g .. ':sessions')
+            for i = 1, #values, 2 do
+                local channel, time, active = entry(values[i])
+                if active == '1' then
+                    rows[#rows + 1] = guild .. ':' .. values[i] .. ':'
+                                      .. values[i + 1]
+                end
+            end
+        end
+        return rows
+    ''',
+    'get_last_visits': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            local values = redis.call('HGETALL', ARGV[1] .. ':' .. guild
+                                                 .. ':visits')
+            for i = 1, #values, 2 do
+                if tonumber(values[i + 1]) >= tonumber(ARGV[3]) then
+                    rows[#rows + 1] = guild .. ':' .. values[i] .. ':'
+                                      .. values[i + 1]
+                end
+            end
+        end
+        return rows
+    ''',
+    'add_stat_sample': '''
+        redis.call('HINCRBY', g .. ':stats',
+                   table.concat(ARGV, ':', 3, 6), 1)
+        redis.call('SADD', ARGV[1] .. ':guilds', ARGV[2])
+        return 1
+    ''',
+    'get_stats': '''
+        local rows = {}
+        for _, guild in ipairs(redis.call('SMEMBERS', ARGV[1] .. ':guilds')) do
+            local values = redis.call('HGETALL', ARGV[1] .. ':' .. guild
+                                                 .. ':stats')
+            for i = 1, #values, 2 do
+                rows[#rows + 1] = guild .. ':' .. values[i] .. ':'
+                                  .. values[i + 1]
+            end
+        end
+        return rows
+    ''',
+}
+
+
+def ids(values):
+    return [int(value) for value in values]
+
+
+def encode_description(description: str):
+    return '' if description is None else '=' + description
+
+
+def decode_description(value: str):
+    return value[1:] if value else None
+
+
+class RedisMentorStore(MentorStore):
+    '''Keeps mentor channels and queues on a Redis-protocol server, so that
+    several bot processes or hosts can share them. Queues are sorted sets
+    scored by queued_time.
+
+    Every method is a single command or Lua script, and so is atomic on its
+    own. run_batch sends a whole batch as one MULTI/EXEC transaction, but
+    unlike SQLite, a failing call in it does not undo the others. Scripts
+    are loaded on every new connection and called by their SHA1 digest.
+    Data written by older versions is upgraded when the store is
+    opened.'''
+
+    def __init__(self, client: RespClient, prefix: str='mentor'):
+        self.client = client
+        self.prefix = prefix
+        self.scripts = {}
+        for name, body in SCRIPTS.items():
+            script = SCRIPT_HEADER + body
+            self.scripts[name] = hashlib.sha1(script.encode()).hexdigest()
+            self.client.setup.append(('SCRIPT', 'LOAD', script))
+        # commands of the batch being recorded, with their decoders
+        self.pending = None
+        self._script('migrate', '', LAYOUT_VERSION)
+
+    @classmethod
+    def from_url(cls, url: str):
+        '''Creates a store from redis://[:password@]host[:port][/db], with
+        an optional ?prefix= for the key prefix.'''
+        parts = urlsplit(url)
+        options = parse_qs(parts.query)
+        client = RespClient(parts.hostname or 'localhost',
+                            parts.port or 6379,
+                            int(parts.path.strip('/') or 0),
+                            unquote(parts.password or '') or None)
+        return cls(client, options.get('prefix', ['mentor'])[0])
+
+    def close(self):
+        self.client.close()
+
+    def _key(self, guild_id: int, *parts):
+        return ':'.join(map(str, (self.prefix, guild_id, *parts)))
+
+    def _command(self, args: tuple, decode=None):
+        decode = decode or (lambda reply: reply)
+        if self.pending is not None:
+            self.pending.append((args, decode))
+            return None
+        try:
+            return decode(self.client.execute(*args))
+        except RedisError as ex:
+            if not str(ex).startswith('NOSCRIPT'):
+                raise
+            # the server lost its scripts, which reconnecting loads again
+            self.client.close()
+            return decode(self.client.execute(*args))
+
+    def _raise(self, reply: RedisError):
+        if str(reply).startswith('NOSCRIPT'):
+            # the other commands of the transaction may have run, so only
+            # later calls can be retried
+            self.client.close()
+        raise reply
+
+    def _script(self, name: str, guild_id, *args, decode=None):
+        return self._command(('EVALSHA', self.scripts[name], 0,
+                              self.prefix, guild_id, *args),
+                             decode)
+
+    def _scan_hash(self, key: str):
+        '''Yields the fields and values of a hash, a batch at a time. Fields
+        may be repeated if the hash is resized meanwhile.'''
+        cursor = '0'
+        while True:
+            cursor, values = self.client.execute('HSCAN', key, cursor,
+                                                 'COUNT', IMPORT_BATCH_SIZE)
+            for i in range(0, len(values), 2):
+                yield values[i], values[i + 1]
+            if cursor == '0':
+                return
+
+    def _guild_ids(self, guild_id: int=None):
+        if guild_id is not None:
+            return [guild_id]
+        return ids(self.client.execute('SMEMBERS', f'{self.prefix}:guilds'))
+
+    def _import(self, script: str, batch: list[tuple]):
+        '''Runs an import script for each guild of a batch of rows, as part
+        of the batch being recorded or else in a transaction of its own,
+        and returns the sum of their results.'''
+        guilds = {}
+        for guild_id, *values in batch:
+            guilds.setdefault(guild_id, []).extend(values)
+        commands = [('EVALSHA', self.scripts[script], 0,
+                     self.prefix, guild_id, *values)
+                    for guild_id, values in guilds.items()]
+        if self.pending is not None:
+            self.pending.extend((command, int) for command in commands)
+            return 0
+        replies = self.client.transaction(commands)
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                self._raise(reply)
+        return sum(replies)
+
+    def run_batch(self, calls: list[tuple[str, tuple, dict]]):
+        self.pending = []
+        try:
+            for method, args, kwargs in calls:
+                getattr(self, method)(*args, **kwargs)
+            pending = self.pending
+        finally:
+            self.pending = None
+        if not pending:
+            return []
+        replies = self.client.transaction([args for args, _ in pending])
+        results = []
+        for (_, decode), reply in zip(pending, replies):
+            if isinstance(reply, RedisError):
+                self._raise(reply)
+            results.append(decode(reply))
+        return results
+
+    def get_mentor_channels(self, guild_id: int):
+        def decode(reply):
+            return [(int(reply[i]), decode_description(reply[i + 1]))
+                    for i in range(0, len(reply), 2)]
+        return self._command(('HGETALL', self._key(guild_id, 'channels')),
+                             decode)
+
+    def get_all_channels(self):
+        def decode(reply):
+            return [tuple(ids(row.split(':'))) for row in reply]
+        return self._script('get_all_channels', '', decode=decode)
+
+    def iter_mentor_channels(self, guild_id: int=None):
+        for guild in self._guild_ids(guild_id):
+            for channel_id, description in self._scan_hash(
+                self._key(guild, 'channels')
+            ):
+                yield guild, int(channel_id), decode_description(description)
+
+    def import_channels(self, rows):
+        '''Imports the rows of each batch in one transaction. Unlike SQLite,
+        earlier batches are kept if a later one fails.'''
+        count = 0
+        for batch in batched(rows):
+            self._import('import_channels',
+                         [(guild_id, channel_id,
+                           encode_description(description))
+                          for guild_id, channel_id, description in batch])
+            count += len(batch)
+        return count
+
+    def is_mentor_channel(self, guild_id: int, channel_id: int):
+        return self._command(('HEXISTS',
+                              self._key(guild_id, 'channels'),
+                              channel_id),
+                             bool)
+
+    def update_mentor_channel(self,
+                              guild_id: int,
+                              channel_id: int,
+                              description: str):
+        return self._script('update_mentor_channel',
+                            guild_id,
+                            channel_id,
+                            encode_description(description))
+
+    def delete_mentor_channel(self, guild_id: int, channel_id: int):
+        return self._script('delete_mentor_channel', guild_id, channel_id)
+
+    def delete_guild(self, guild_id: int):
+        return self._script('delete_guild', guild_id)
+
+    def get_dashboards(self):
+        def decode(reply):
+            return [(*ids(reply[i].split(':')), int(reply[i + 1]))
+                    for i in range(0, len(reply), 2)]
+        return self._command(('HGETALL', f'{self.prefix}:dashboards'),
+                             decode)
+
+    def set_dashboard(self, guild_id: int, channel_id: int, message_id: int):
+        return self._command(('HSET',
+                              f'{self.prefix}:dashboards',
+                              f'{guild_id}:{channel_id}',
+                              message_id),
+                             lambda reply: 1)
+
+    def delete_dashboard(self, guild_id: int, channel_id: int):
+        return self._command(('HDEL',
+                              f'{self.prefix}:dashboards',
+                              f'{guild_id}:{channel_id}'))
+
+    def get_user_info(self, guild_id: int, user_id: int, fetch_pos: bool):
+        def decode(reply):
+            if not reply:
+                return (None, None, None) if fetch_pos else (None, None)
+            channel_id, is_active, position = reply
+            if not fetch_pos:
+                return int(channel_id), is_active == '1'
+            return int(channel_id), is_active == '1', position
+        return self._script('get_user_info', guild_id, user_id,
+                            decode=decode)
+
+    def get_users(self, guild_id: int, channel_id: int):
+        def decode(reply):
+            return ids(reply[0]), ids(reply[1])
+        return self._script('get_users', guild_id, channel_id,
+                            decode=decode)
+
+    def get_all_users(self):
+        def decode(reply):
+            rows = []
+            for row in reply:
+                guild_id, user_id, channel_id, queued_time, is_active, \
+                    *priority = ids(row.split(':'))
+                rows.append((guild_id, user_id, channel_id, queued_time,
+                             is_active, priority[0] if priority else 0))
+            return rows
+        return self._script('get_all_users', '', decode=decode)
+
+    def iter_users(self, guild_id: int=None):
+        for guild in self._guild_ids(guild_id):
+            for user_id, value in self._scan_hash(self._key(guild, 'users')):
+                channel_id, queued_time, is_active, *priority = \
+                    ids(value.split(':'))
+                yield (guild, int(user_id), channel_id, queued_time,
+                       is_active, priority[0] if priority else 0)
+
+    def import_users(self, rows):
+        '''Imports the rows of each batch in one transaction. Unlike SQLite,
+        earlier batches are kept if a later one fails.'''
+        count = 0
+        for batch in batched(rows):
+            count += self._import(
+                'import_users',
+                [(guild_id, user_id, channel_id, queued_time,
+                  int(bool(is_active)), priority)
+                 for guild_id, user_id, channel_id, queued_time, is_active,
+                     priority in batch]
+            )
+        return count
+
+    def add_user(self,
+                 guild_id: int,
+                 user_id: int,
+                 channel_id: int,
+                 queued_time: int=None,
+                 priority: int=0):
+        return self._script('add_user',
+                            guild_id,
+                            user_id,
+                            channel_id,
+                            queued_time or current_timestamp(),
+                            priority)
+
+    def make_active(self, guild_id: int, user_id: int, is_active: bool=True):
+        return self._script('make_active',
+                            guild_id,
+                            user_id,
+                            int(bool(is_active)))
+
+    def delete_user(self, guild_id: int, user_id: int):
+        return self._script('delete_users', guild_id, user_id)
+
+    def delete_users(self, guild_id: int, user_ids: list[int]):
+        return self._script('delete_users', guild_id, *user_ids)
+
+    def clear_active_users(self, guild_id: int, channel_id: int):
+        return self._script('clear_active_users', guild_id, channel_id)
+
+    def clear_users(self, guild_id: int, channel_id: int):
+        return self._script('clear_users', guild_id, channel_id)
+
+    def get_active_users(self, guild_id: int, channel_id: int):
+        return self._command(('ZRANGE',
+                              self._key(guild_id, 'active', channel_id),
+                              0, -1),
+                             ids)
+
+    def get_next_user(self, guild_id: int, channel_id: int):
+        def decode(reply):
+            return int(reply[0]) if reply else None
+        return self._command(('ZRANGE',
+                              self._key(guild_id, 'queued', channel_id),
+                              0, 0),
+                             decode)
+
+    def skip_user(self, guild_id: int, user_id: int, queued_time: int=None):
+        return self._script('skip_user',
+                            guild_id,
+                            user_id,
+                            queued_time or current_timestamp())
+
+    def set_priority(self, guild_id: int, user_id: int, priority: int):
+        return self._script('set_priority', guild_id, user_id, priority)
+
+    def get_invites(self):
+        def decode(reply):
+            return [tuple(ids(row.split(':'))) for row in reply]
+        return self._script('get_invites', '', decode=decode)
+
+    def add_invite(self,
+                   guild_id: int,
+                   user_id: int,
+                   channel_id: int,
+                   ta_id: int,
+                   invited_time: int=None):
+        return self._script('add_invite',
+                            guild_id,
+                            user_id,
+                            channel_id,
+                            ta_id,
+                            invited_time or current_timestamp())
+
+    def delete_invite(self, guild_id: int, user_id: int):
+        return self._command(('HDEL', self._key(guild_id, 'invites'),
+                              user_id))
+
+    def get_grants(self):
+        def decode(reply):
+            return [tuple(ids(row.split(':'))) for row in reply]
+        return self._script('get_grants', '', decode=decode)
+
+    def add_grants(self, guild_id: int, channel_id: int, user_ids: list[int]):
+        return self._script('add_grants', guild_id, channel_id, *user_ids)
+
+    def delete_grants(self,
+                      guild_id: int,
+                      channel_id: int,
+                      user_ids: list[int]):
+        return self._script('delete_grants', guild_id, channel_id, *user_ids)
+
+    def add_event(self,
+                  guild_id: int,
+                  channel_id: int,
+                  user_id: int,
+                  event: str,
+                  ta_id: int=None,
+                  time: int=None):
+        return self._script('add_event',
+                            guild_id,
+                            channel_id,
+                            user_id,
+                            event,
+                            ta_id or '',
+                            time or current_timestamp())
+
+    def get_active_sessions(self):
+        def decode(reply):
+            rows = []
+            for row in reply:
+                guild_id, user_id, time, ta_id = row.split(':')
+                rows.append((int(guild_id), int(user_id), int(time),
+                             int(ta_id) if ta_id else None))
+            return rows
+        return self._script('get_active_sessions', '', decode=decode)
+
+    def get_last_visits(self, since: int):
+        def decode(reply):
+            return [tuple(ids(row.split(':'))) for row in reply]
+        return self._script('get_last_visits', '', since, decode=decode)
+
+    def add_stat_sample(self,
+                        guild_id: int,
+                        scope: str,
+                        scope_id: int,
+                        metric: str,
+                        bucket: int):
+        return self._script('add_stat_sample',
+                            guild_id, scope, scope_id, metric, bucket)
+
+    def get_stats(self):
+        def decode(reply):
+            rows = []
+            for row in reply:
+                guild_id, scope, scope_id, metric, bucket, count = \
+                    row.split(':')
+                rows.append((int(guild_id), scope, int(scope_id), metric,
+                             int(bucket), int(count)))
+            return rows
+        return self._script('get_stats', '', decode=decode)
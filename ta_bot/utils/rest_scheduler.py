@@ -0,0 +1,165 @@
+import asyncio
+import enum
+import heapq
+import itertools
+from collections import Counter, defaultdict
+
+import discord
+
+from .permissions import edit_member_overwrites
+from .profiling import span
+
+
+class Priority(enum.IntEnum):
+    INTERACTION = 0
+    NORMAL = 1
+    BACKGROUND = 2
+
+
+class Request:
+
+    def __init__(self, factory, priority: Priority, bucket: str, key):
+        self.factory = factory
+        self.priority = priority
+        self.bucket = bucket
+        self.coalesce_key = key
+        self.future = asyncio.get_event_loop().create_future()
+        self.started = False
+
+
+class RestScheduler:
+    '''Orders outbound Discord API calls shared by all cogs.
+
+    Calls are coroutine factories run by a fixed pool of workers, highest
+    priority first, so interaction responses never queue behind bulk work.
+    Calls in the same bucket (e.g. one channel) run one at a time, which
+    matches Discord's per-route rate limits. Calls submitted with a
+    `coalesce_key` that is still waiting replace the waiting call instead of
+    queueing another one.'''
+
+    def __init__(self, concurrency: int=8):
+        self.concurrency = concurrency
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.workers = []
+        self.coalescing = {}
+        self.busy_buckets = set()
+        self.parked = defaultdict(list)
+        self.depths = Counter()
+        self.overwrite_changes = {}
+
+    def _start_workers(self):
+        if not self.workers:
+            self.workers = [asyncio.ensure_future(self._work())
+                            for _ in range(self.concurrency)]
+
+    def _push(self, request: Request):
+        heapq.heappush(self.heap, (request.priority,
+                                   next(self.counter),
+                                   request))
+        self.wakeup.set()
+
+    def _next_request(self):
+        while self.heap:
+            _, _, request = heapq.heappop(self.heap)
+            if request.started:
+                # stale entry left behind by a priority upgrade
+                continue
+            if request.bucket and request.bucket in self.busy_buckets:
+                self.parked[request.bucket].append(request)
+                continue
+            return request
+        self.wakeup.clear()
+        return None
+
+    async def _work(self):
+        while True:
+            if not (request := self._next_request()):
+                await self.wakeup.wait()
+                continue
+
+            request.started = True
+            self.depths[request.bucket] -= 1
+            if not self.depths[request.bucket]:
+                del self.depths[request.bucket]
+            if request.coalesce_key is not None:
+                del self.coalescing[request.coalesce_key]
+            if request.bucket:
+                self.busy_buckets.add(request.bucket)
+
+            try:
+                result = await request.factory()
+            except Exception as ex:
+                if not request.future.done():
+                    request.future.set_exception(ex)
+            else:
+                if not request.future.done():
+                    request.future.set_result(result)
+            finally:
+                if request.bucket:
+                    self.busy_buckets.discard(request.bucket)
+                    for parked in self.parked.pop(request.bucket, []):
+                        self._push(parked)
+
+    def submit(self,
+               factory,
+               priority: Priority=Priority.NORMAL,
+               bucket: str=None,
+               coalesce_key=None):
+        '''Queues a call and returns a future for its result. `factory` is a
+        function returning the coroutine to await.'''
+        self._start_workers()
+        if coalesce_key is not None:
+            if (request := self.coalescing.get(coalesce_key)):
+                request.factory = factory
+                if priority < request.priority:
+                    request.priority = priority
+                    self._push(request)
+                return request.future
+
+        request = Request(factory, priority, bucket, coalesce_key)
+        if coalesce_key is not None:
+            self.coalescing[coalesce_key] = request
+        self.depths[bucket] += 1
+        self._push(request)
+        return request.future
+
+    async def run(self, factory, *args, **kwargs):
+        '''Same as submit, but waits for the result.'''
+        return await asyncio.shield(self.submit(factory, *args, **kwargs))
+
+    async def respond(self, method, *args, **kwargs):
+        '''Calls an interaction response method, such as `ctx.send` or
+        `ctx.edit_origin`, with the highest priority.'''
+        with span('interaction responses'):
+            return await self.run(lambda: method(*args, **kwargs),
+                                  Priority.INTERACTION)
+
+    async def edit_overwrites(self,
+                              channel: discord.abc.GuildChannel,
+                              changes: dict[int, discord.PermissionOverwrite],
+                              priority: Priority=Priority.NORMAL):
+        '''Applies member overwrite changes to a channel. Changes made before
+        the edit starts are merged, so bursts become a single request, and a
+        later change for the same member replaces an earlier one.'''
+        self.overwrite_changes.setdefault(channel.id, {}).update(changes)
+
+        async def apply():
+            batch = self.overwrite_changes.pop(channel.id, {})
+            return await edit_member_overwrites(channel, batch)
+
+        with span('permission edits'):
+            return await self.run(apply,
+                                  priority,
+                                  bucket=f'channel:{channel.id}',
+                                  coalesce_key=('overwrites', channel.id))
+
+    def queue_depths(self):
+        '''Returns the number of waiting calls per bucket.'''
+        return dict(self.depths)
+
+    def close(self):
+        for worker in self.workers:
+            worker.cancel()
+        self.workers = []
@@ -0,0 +1,24 @@
+def shard_for_guild(guild_id: int, shard_count: int):
+    '''Returns the shard that receives a guild's events, as documented by
+    Discord.'''
+    return (guild_id >> 22) % shard_count
+
+
+def owned_shards(bot):
+    '''Returns the shard IDs this process connects, or None if it handles
+    every guild.'''
+    if not bot.shard_count:
+        return None
+    if (shard_ids := getattr(bot, 'shard_ids', None)) is not None:
+        return set(shard_ids)
+    if bot.shard_id is not None:
+        return {bot.shard_id}
+    return None
+
+
+def owns_guild(bot, guild_id: int):
+    '''Whether this process receives the events of a guild. Per-guild state
+    such as the queues and locks lives only in the owning process.'''
+    shards = owned_shards(bot)
+    return shards is None or shard_for_guild(guild_id,
+                                             bot.shard_count) in shards
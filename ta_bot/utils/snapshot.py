@@ -0,0 +1,116 @@
+import csv
+import itertools
+import json
+
+from .storage import IMPORT_BATCH_SIZE, MentorStore
+
+
+CHANNEL_FIELDS = ('guild_id', 'channel_id', 'description')
+USER_FIELDS = ('guild_id', 'user_id', 'channel_id', 'queued_time',
+               'is_active', 'priority')
+
+
+class SnapshotError(ValueError):
+    '''A malformed snapshot or channel config file.'''
+
+
+def write_snapshot(file, channel_rows, user_rows):
+    '''Writes mentor_channels and mentor_users rows to a text file as JSON
+    lines, one row at a time. Returns the numbers of channels and users
+    written.'''
+    counts = []
+    for kind, fields, rows in (('channel', CHANNEL_FIELDS, channel_rows),
+                               ('user', USER_FIELDS, user_rows)):
+        count = 0
+        for row in rows:
+            record = {'type': kind, **dict(zip(fields, row))}
+            if kind == 'user':
+                record['is_active'] = bool(record['is_active'])
+            file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+        counts.append(count)
+    return tuple(counts)
+
+
+def _parse_row(kind: str, record: dict, guild_id: int, line: int):
+    if record.get('guild_id') in (None, ''):
+        record['guild_id'] = guild_id
+    try:
+        if kind == 'channel':
+            return (int(record['guild_id']),
+                    int(record['channel_id']),
+                    record.get('description') or None)
+        if kind == 'user':
+            return (int(record['guild_id']),
+                    int(record['user_id']),
+                    int(record['channel_id']),
+                    int(record['queued_time']),
+                    bool(record.get('is_active')),
+                    int(record.get('priority') or 0))
+    except (KeyError, TypeError, ValueError) as ex:
+        raise SnapshotError(f'Line {line}: invalid {kind} row') from ex
+    raise SnapshotError(f'Line {line}: unknown row type {kind!r}')
+
+
+def read_snapshot(lines, guild_id: int=None):
+    '''Parses a snapshot written by write_snapshot, or a CSV channel config
+    with a header row naming the channel_id, description and optionally
+    guild_id columns. Yields ('channel', row) and ('user', row) pairs as
+    they are read; rows without a guild ID get `guild_id`.'''
+    lines = iter(lines)
+    for first in lines:
+        if first.strip():
+            break
+    else:
+        return
+    lines = itertools.chain([first], lines)
+
+    if first.lstrip().startswith('{'):
+        for line_no, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as ex:
+                raise SnapshotError(f'Line {line_no}: {ex}') from None
+            if not isinstance(record, dict):
+                raise SnapshotError(f'Line {line_no}: expected an object')
+            yield record.get('type'), _parse_row(record.get('type'),
+                                                 record,
+                                                 guild_id,
+                                                 line_no)
+        return
+
+    reader = csv.DictReader(lines, skipinitialspace=True)
+    if 'channel_id' not in (reader.fieldnames or ()):
+        raise SnapshotError('Line 1: expected a header with a channel_id '
+                            'column')
+    for record in reader:
+        yield 'channel', _parse_row('channel', record, guild_id,
+                                    reader.line_num)
+
+
+def import_snapshot(store: MentorStore,
+                    records,
+                    users: bool=True,
+                    batch_size: int=IMPORT_BATCH_SIZE):
+    '''Imports the pairs yielded by read_snapshot into a store in batches,
+    without queued users unless `users`, so that a file is never held in
+    memory as a whole. Call it inside store.transaction() to import a file
+    atomically. Returns the numbers of channels and users imported.'''
+    batches = {'channel': [], 'user': []}
+    imported = {'channel': 0, 'user': 0}
+    methods = {'channel': store.import_channels, 'user': store.import_users}
+    for kind, row in records:
+        if kind == 'user' and not users:
+            continue
+        batch = batches[kind]
+        batch.append(row)
+        if len(batch) >= batch_size:
+            imported[kind] += methods[kind](batch)
+            batch.clear()
+    # channels go first, so queues never refer to missing channels
+    for kind in ('channel', 'user'):
+        if batches[kind]:
+            imported[kind] += methods[kind](batches[kind])
+    return imported['channel'], imported['user']
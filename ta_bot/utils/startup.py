@@ -0,0 +1,78 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    '''Times the phases of startup. Time spent in a nested phase is only
+    counted for the nested one, so the phases add up.'''
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.stack = []
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        self.stack.append(0.0)
+        try:
+            yield
+        finally:
+            nested = self.stack.pop()
+            elapsed = time.perf_counter() - start
+            self.phases[name] = self.phases.get(name, 0) + elapsed - nested
+            if self.stack:
+                self.stack[-1] += elapsed
+            self.logger.info('Startup phase %s took %.1f ms',
+                             name, (elapsed - nested) * 1000)
+
+    def report(self):
+        phases = ', '.join(f'{name} {seconds * 1000:.1f} ms'
+                           for name, seconds in self.phases.items())
+        total = time.perf_counter() - self.start
+        self.logger.info('Started in %.1f ms (%s)', total * 1000, phases)
+
+
+def command_hash(application_id: int, definitions: dict):
+    '''Hashes the command definitions of SlashCommand.to_dict, along with
+    the application they are registered for.'''
+    data = json.dumps([application_id, definitions],
+                      sort_keys=True,
+                      default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+async def sync_commands_if_changed(bot, slash, hash_file: str):
+    '''Syncs slash commands with Discord unless their definitions are the
+    same as at the last successful sync, as recorded in `hash_file`.
+    Returns whether a sync was made. Delete the file to force a sync.'''
+    logger = logging.getLogger(__name__)
+    # to_dict waits until the bot is ready
+    definitions = await slash.to_dict()
+    with bot.startup.phase('command sync'):
+        digest = command_hash(bot.user.id, definitions)
+        try:
+            with open(hash_file) as file:
+                synced = file.read().strip() == digest
+        except FileNotFoundError:
+            synced = False
+
+        if synced:
+            logger.info('Slash commands are unchanged, skipping sync')
+        else:
+            try:
+                await slash.sync_all_commands()
+            except Exception:
+                logger.exception('Could not sync slash commands')
+                return False
+            os.makedirs(os.path.dirname(hash_file) or '.', exist_ok=True)
+            with open(hash_file + '.tmp', 'w') as file:
+                file.write(digest + '\n')
+            os.replace(hash_file + '.tmp', hash_file)
+    bot.startup.report()
+    return not synced
@@ -0,0 +1,174 @@
+import math
+
+from .database import AsyncMentorDbConn, current_timestamp
+from .mentor_queue import MentorQueues
+
+
+# events after which an active user's session is over
+SESSION_END_EVENTS = {'leave', 'finish', 'remove', 'clear'}
+# an ETA is only shown once a channel has this many sessions
+MIN_ETA_SAMPLES = 5
+
+
+def format_duration(seconds: float):
+    '''Formats a duration as e.g. "45 s", "12 min" or "1 h 5 min".'''
+    if seconds < 60:
+        return f'{seconds:.0f} s'
+    minutes = round(seconds / 60)
+    if minutes < 60:
+        return f'{minutes} min'
+    return f'{minutes // 60} h {minutes % 60} min'
+
+
+class QuantileSketch:
+    '''A streaming quantile sketch with logarithmic buckets, as in DDSketch.
+    Quantiles of positive values are estimated within `relative_accuracy`
+    of the true value, using one counter per bucket no matter how many
+    values are added. Values below 1 are counted as 1.'''
+
+    def __init__(self, relative_accuracy: float=0.02):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.count = 0
+
+    def bucket(self, value: float):
+        return math.ceil(math.log(max(value, 1)) / self.log_gamma)
+
+    def add_bucket(self, bucket: int, count: int=1):
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + count
+        self.count += count
+
+    def add(self, value: float):
+        bucket = self.bucket(value)
+        self.add_bucket(bucket)
+        return bucket
+
+    def quantile(self, q: float):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                break
+        if bucket == 0:
+            return 1.0
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
+
+
+class StatsTracker:
+    '''Records queue events to the append-only mentor_events history and
+    keeps wait and session length sketches per channel and per TA.
+
+    A wait lasts from joining (or being skipped to the end of the queue)
+    until joining the channel, and is attributed to the TA who invited the
+    user. A session lasts from joining the channel until leaving it by any
+    means. Sketch buckets are persisted as they change, so statistics never
+    need to scan the history.'''
+
+    def __init__(self, db: AsyncMentorDbConn, queues: MentorQueues):
+        self.db = db
+        self.queues = queues
+        # (guild_id, scope, scope_id, metric) -> QuantileSketch
+        self.sketches = {}
+        # (guild_id, user_id) -> (activation time, ta_id)
+        self.sessions = {}
+        # (guild_id, user_id) -> latest activation time
+        self.visits = {}
+
+    def load(self, stat_rows, session_rows, visit_rows=()):
+        '''Loads sketches from MentorDbConn.get_stats rows, the sessions in
+        progress from MentorDbConn.get_active_sessions rows, and recent
+        visits from MentorDbConn.get_last_visits rows.'''
+        self.sketches.clear()
+        for guild_id, scope, scope_id, metric, bucket, count in stat_rows:
+            self.sketch(guild_id, scope, scope_id, metric).add_bucket(bucket,
+                                                                      count)
+        self.sessions = {(guild_id, user_id): (time, ta_id)
+                         for guild_id, user_id, time, ta_id in session_rows}
+        self.visits = {(guild_id, user_id): time
+                       for guild_id, user_id, time in visit_rows}
+
+    def sketch(self, guild_id: int, scope: str, scope_id: int, metric: str):
+        key = (guild_id, scope, scope_id, metric)
+        if not (sketch := self.sketches.get(key)):
+            sketch = self.sketches[key] = QuantileSketch()
+        return sketch
+
+    def _submit(self, method: str, *args):
+        self.db.submit_logged(method, *args, what='record queue event')
+
+    def _observe(self,
+                 guild_id: int,
+                 channel_id: int,
+                 ta_id: int,
+                 metric: str,
+                 seconds: float):
+        scopes = [('channel', channel_id)]
+        if ta_id:
+            scopes.append(('ta', ta_id))
+        for scope, scope_id in scopes:
+            sketch = self.sketch(guild_id, scope, scope_id, metric)
+            bucket = sketch.add(seconds)
+            self._submit('add_stat_sample',
+                         guild_id, scope, scope_id, metric, bucket)
+
+    def record(self,
+               event: str,
+               guild_id: int,
+               channel_id: int,
+               user_id: int,
+               ta_id: int=None):
+        '''Records that `event` happened to a user of a channel. Call it
+        after the queue itself was changed.'''
+        now = current_timestamp()
+        self._submit('add_event',
+                     guild_id, channel_id, user_id, event, ta_id, now)
+        key = (guild_id, user_id)
+        if event == 'activate':
+            if (entry := self.queues.users.get(key)):
+                self._observe(guild_id, channel_id, ta_id, 'wait',
+                              (now - entry.queued_time) / 1000)
+            self.sessions[key] = (now, ta_id)
+            self.visits[key] = now
+        elif event in SESSION_END_EVENTS:
+            if (session := self.sessions.pop(key, None)):
+                start, session_ta = session
+                self._observe(guild_id, channel_id, session_ta, 'session',
+                              (now - start) / 1000)
+
+    def visited_since(self, guild_id: int, user_id: int, since: int):
+        '''Returns whether a user was activated at or after `since`, as far
+        back as the visits loaded at startup go.'''
+        return self.visits.get((guild_id, user_id), -1) >= since
+
+    def summary(self, guild_id: int, scope: str, scope_id: int, metric: str):
+        '''Returns (count, p50, p90, p99) in seconds, or None without
+        data.'''
+        sketch = self.sketches.get((guild_id, scope, scope_id, metric))
+        if not sketch or not sketch.count:
+            return None
+        return (sketch.count, *(sketch.quantile(q) for q in (.5, .9, .99)))
+
+    def ta_ids(self, guild_id: int):
+        '''Returns the TAs with statistics in a guild, most sessions
+        first.'''
+        counts = {}
+        for (guild, scope, scope_id, _), sketch in self.sketches.items():
+            if guild == guild_id and scope == 'ta':
+                counts[scope_id] = counts.get(scope_id, 0) + sketch.count
+        return sorted(counts, key=lambda ta_id: -counts[ta_id])
+
+    def eta(self, guild_id: int, channel_id: int, ahead: int):
+        '''Estimates the seconds until a queued user with `ahead` users in
+        front of them joins the channel: one median session for each of
+        them and one for the session in progress. Returns None without
+        enough data.'''
+        sketch = self.sketches.get((guild_id, 'channel', channel_id,
+                                    'session'))
+        if not sketch or sketch.count < MIN_ETA_SAMPLES:
+            return None
+        return (ahead + 1) * sketch.quantile(.5)
+
@@ -0,0 +1,239 @@
+import itertools
+from contextlib import contextmanager
+
+
+# rows per executemany call or transaction of a bulk import
+IMPORT_BATCH_SIZE = 500
+
+
+def batched(rows, size: int=IMPORT_BATCH_SIZE):
+    '''Splits an iterable into lists of up to `size` rows.'''
+    rows = iter(rows)
+    while (batch := list(itertools.islice(rows, size))):
+        yield batch
+
+
+class MentorStore:
+    '''Storage of mentor channels, dashboards and queues.
+
+    Every backend implements these methods with the same arguments and
+    results as the SQLite implementation, MentorDbConn. Stores are not
+    thread-safe; AsyncMentorDbConn owns one on its writer thread.'''
+
+    @contextmanager
+    def transaction(self, immediate: bool=False):
+        '''Groups the writes made inside the block, as far as the backend
+        can. With `immediate`, backends that lock take the write lock right
+        away, so that reads inside the block never conflict with writers in
+        other processes.'''
+        yield self
+
+    @contextmanager
+    def savepoint(self):
+        '''Undoes the writes made inside the block if it raises, as far as
+        the backend can.'''
+        yield
+
+    def run_batch(self, calls: list[tuple[str, tuple, dict]]):
+        '''Runs a list of (method, args, kwargs) calls in one transaction and
+        returns their results.'''
+        with self.transaction():
+            return [getattr(self, method)(*args, **kwargs)
+                    for method, args, kwargs in calls]
+
+    def close(self):
+        pass
+
+    def maintain(self):
+        '''Runs routine maintenance, such as refreshing query planner
+        statistics and returning free space. Returns the number of pages
+        freed; backends without maintenance return 0.'''
+        return 0
+
+    def get_mentor_channels(self, guild_id: int):
+        '''Returns (channel_id, description) for each mentor channel.'''
+        raise NotImplementedError
+
+    def get_all_channels(self):
+        '''Returns (guild_id, channel_id) for every mentor channel.'''
+        raise NotImplementedError
+
+    def iter_mentor_channels(self, guild_id: int=None):
+        '''Yields (guild_id, channel_id, description) for the mentor channels
+        of a guild, or of every guild, reading them in batches. Only for
+        direct use of a store, as the rows are read lazily.'''
+        raise NotImplementedError
+
+    def import_channels(self, rows):
+        '''Adds or updates mentor channels from (guild_id, channel_id,
+        description) rows, in batches, and returns the number of rows.'''
+        raise NotImplementedError
+
+    def is_mentor_channel(self, guild_id: int, channel_id: int):
+        raise NotImplementedError
+
+    def update_mentor_channel(self,
+                              guild_id: int,
+                              channel_id: int,
+                              description: str):
+        raise NotImplementedError
+
+    def delete_mentor_channel(self, guild_id: int, channel_id: int):
+        '''Deletes a mentor channel with its dashboard and queue.'''
+        raise NotImplementedError
+
+    def delete_guild(self, guild_id: int):
+        '''Deletes the mentor channels, dashboards, queues and invites of a
+        guild. Its history and statistics are kept.'''
+        raise NotImplementedError
+
+    def get_dashboards(self):
+        '''Returns (guild_id, channel_id, message_id) for each dashboard.'''
+        raise NotImplementedError
+
+    def set_dashboard(self, guild_id: int, channel_id: int, message_id: int):
+        raise NotImplementedError
+
+    def delete_dashboard(self, guild_id: int, channel_id: int):
+        raise NotImplementedError
+
+    def get_user_info(self, guild_id: int, user_id: int, fetch_pos: bool):
+        '''Returns (channel_id, is_active), followed by the position if
+        `fetch_pos` is set. Everything is None if the user is not queued.'''
+        raise NotImplementedError
+
+    def get_users(self, guild_id: int, channel_id: int):
+        '''Returns the active and the queued user IDs of a channel, each in
+        queue order.'''
+        raise NotImplementedError
+
+    def get_all_users(self):
+        '''Returns (guild_id, user_id, channel_id, queued_time, is_active,
+        priority) for every queued or active user.'''
+        raise NotImplementedError
+
+    def iter_users(self, guild_id: int=None):
+        '''Yields the rows of get_all_users for a guild, or every guild, in
+        queue order per channel, reading them in batches. Only for direct
+        use of a store, as the rows are read lazily.'''
+        raise NotImplementedError
+
+    def import_users(self, rows):
+        '''Adds users from rows like those of get_all_users, in batches,
+        skipping users who are already queued. Returns the number of users
+        added.'''
+        raise NotImplementedError
+
+    def add_user(self,
+                 guild_id: int,
+                 user_id: int,
+                 channel_id: int,
+                 queued_time: int=None,
+                 priority: int=0):
+        raise NotImplementedError
+
+    def make_active(self, guild_id: int, user_id: int, is_active: bool=True):
+        raise NotImplementedError
+
+    def delete_user(self, guild_id: int, user_id: int):
+        raise NotImplementedError
+
+    def delete_users(self, guild_id: int, user_ids: list[int]):
+        raise NotImplementedError
+
+    def clear_active_users(self, guild_id: int, channel_id: int):
+        raise NotImplementedError
+
+    def clear_users(self, guild_id: int, channel_id: int):
+        raise NotImplementedError
+
+    def get_active_users(self, guild_id: int, channel_id: int):
+        raise NotImplementedError
+
+    def get_next_user(self, guild_id: int, channel_id: int):
+        raise NotImplementedError
+
+    def skip_user(self, guild_id: int, user_id: int, queued_time: int=None):
+        '''Moves a queued user to the end of the queue and resets their
+        priority.'''
+        raise NotImplementedError
+
+    def set_priority(self, guild_id: int, user_id: int, priority: int):
+        '''Sets the bonus, in milliseconds, that a user is queued ahead of
+        their queued_time.'''
+        raise NotImplementedError
+
+    def get_invites(self):
+        '''Returns (guild_id, user_id, channel_id, ta_id, invited_time) for
+        every pending invite.'''
+        raise NotImplementedError
+
+    def add_invite(self,
+                   guild_id: int,
+                   user_id: int,
+                   channel_id: int,
+                   ta_id: int,
+                   invited_time: int=None):
+        raise NotImplementedError
+
+    def delete_invite(self, guild_id: int, user_id: int):
+        raise NotImplementedError
+
+    def get_grants(self):
+        '''Returns (guild_id, channel_id, user_id) for every member overwrite
+        the bot granted and has not removed yet.'''
+        raise NotImplementedError
+
+    def add_grants(self, guild_id: int, channel_id: int, user_ids: list[int]):
+        raise NotImplementedError
+
+    def delete_grants(self,
+                      guild_id: int,
+                      channel_id: int,
+                      user_ids: list[int]):
+        raise NotImplementedError
+
+    def add_event(self,
+                  guild_id: int,
+                  channel_id: int,
+                  user_id: int,
+                  event: str,
+                  ta_id: int=None,
+                  time: int=None):
+        '''Appends an event to the queue history.'''
+        raise NotImplementedError
+
+    def get_active_sessions(self):
+        '''Returns (guild_id, user_id, time, ta_id) of the latest activation
+        of every active user.'''
+        raise NotImplementedError
+
+    def get_last_visits(self, since: int):
+        '''Returns (guild_id, user_id, time) of the latest activation of
+        every user activated at or after `since`.'''
+        raise NotImplementedError
+
+    def add_stat_sample(self,
+                        guild_id: int,
+                        scope: str,
+                        scope_id: int,
+                        metric: str,
+                        bucket: int):
+        '''Counts one sample in a bucket of a statistics sketch.'''
+        raise NotImplementedError
+
+    def get_stats(self):
+        '''Returns (guild_id, scope, scope_id, metric, bucket, count) for
+        every non-empty sketch bucket.'''
+        raise NotImplementedError
+
+
+def open_store(url: str):
+    '''Opens the store at `url`: redis://[:password@]host[:port][/db] for a
+    Redis-protocol server, or a SQLite file path, optionally prefixed with
+    sqlite:///.'''
+    if url.startswith('redis://'):
+        from .redis_store import RedisMentorStore
+        return RedisMentorStore.from_url(url)
+    from .database import MentorDbConn
+    return MentorDbConn(url.removeprefix('sqlite:///'))
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+
+from .channel_registry import MentorChannelRegistry
+from .dashboard import DashboardUpdater
+from .database import AsyncMentorDbConn
+from .mentor_queue import MentorQueues
+from .sharding import owns_guild
+from .stats import StatsTracker
+
+
+class SweepReport:
+    '''Stale rows found by a sweep. `users` counts every queue entry that
+    was dropped, including those of stale guilds and channels, and `pages`
+    the database pages returned by maintenance.'''
+
+    def __init__(self):
+        self.guilds = 0
+        self.channels = 0
+        self.users = 0
+        self.pages = 0
+
+    def __bool__(self):
+        return bool(self.guilds or self.channels or self.users or self.pages)
+
+    def __str__(self):
+        return (f'{self.guilds} removed guilds, {self.channels} deleted '
+                f'channels, {self.users} queue entries, '
+                f'{self.pages} free pages')
+
+
+class StaleRowSweeper:
+    '''Deletes the mentor rows of removed guilds, deleted channels and
+    departed members in batches.
+
+    Gateway events only mark candidates, which a background task checks
+    against the gateway cache and deletes together every `interval`
+    seconds. Every `full_interval` seconds, all stored channels are checked
+    as well, to catch removals that happened while the bot was offline, and
+    the store runs its maintenance. Departed members are only known from
+    member remove events, since the member cache is incomplete without the
+    members intent.'''
+
+    def __init__(self,
+                 bot,
+                 db: AsyncMentorDbConn,
+                 queues: MentorQueues,
+                 channels: MentorChannelRegistry,
+                 dashboards: DashboardUpdater,
+                 stats: StatsTracker,
+                 interval: float=60,
+                 full_interval: float=6 * 3600):
+        self.bot = bot
+        self.db = db
+        self.queues = queues
+        self.channels = channels
+        self.dashboards = dashboards
+        self.stats = stats
+        self.interval = interval
+        self.full_interval = full_interval
+        self.logger = logging.getLogger(__name__)
+        self.pending_guilds = set()
+        self.pending_channels = set()
+        self.pending_users = set()
+        self.task = None
+
+    def start(self):
+        self.task = self.bot.loop.create_task(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def guild_removed(self, guild_id: int):
+        self.pending_guilds.add(guild_id)
+
+    def channel_deleted(self, guild_id: int, channel_id: int):
+        self.pending_channels.add((guild_id, channel_id))
+
+    def member_removed(self, guild_id: int, user_id: int):
+        if (guild_id, user_id) in self.queues.users:
+            self.pending_users.add((guild_id, user_id))
+
+    def drop_channel(self, guild_id: int, channel_id: int):
+        # ends the sessions of the dropped users like any other removal
+        for user_id in self.queues.drop_channel(guild_id, channel_id):
+            self.stats.record('remove', guild_id, channel_id, user_id)
+
+    async def find_stale(self, full: bool, guild_id: int=None):
+        '''Returns the stale guilds, channels and users among the candidates,
+        and among all stored channels with `full`. Only `guild_id` is
+        checked if it is given.'''
+        guilds = set(self.pending_guilds)
+        channels = set(self.pending_channels)
+        users = set(self.pending_users)
+        if full:
+            channels.update(await self.db.get_all_channels())
+            channels.update(self.queues.channels)
+            channels.update(self.dashboards.messages)
+            guilds.update(guild for guild, _ in channels)
+        if guild_id is not None:
+            guilds &= {guild_id}
+            channels = {key for key in channels if key[0] == guild_id}
+            users = {key for key in users if key[0] == guild_id}
+
+        guilds = {guild_id for guild_id in guilds
+                  if owns_guild(self.bot, guild_id) and
+                     not self.bot.get_guild(guild_id)}
+
+        def available(guild_id):
+            guild = self.bot.get_guild(guild_id)
+            return guild if guild and not guild.unavailable else None
+
+        channels = {(guild_id, channel_id)
+                    for guild_id, channel_id in channels
+                    if (guild := available(guild_id)) and
+                       not guild.get_channel(channel_id)}
+        users = {(guild_id, user_id)
+                 for guild_id, user_id in users
+                 if (entry := self.queues.users.get((guild_id, user_id))) and
+                    (guild_id, entry.channel_id) not in channels and
+                    (guild := available(guild_id)) and
+                    not guild.get_member(user_id)}
+        return guilds, channels, users
+
+    async def sweep(self,
+                    dry_run: bool=False,
+                    full: bool=False,
+                    guild_id: int=None):
+        '''Deletes the stale rows, or only counts them with `dry_run`, and
+        returns a SweepReport. A full sweep of every guild also runs the
+        store's maintenance.'''
+        report = SweepReport()
+        everywhere = guild_id is None
+        candidates = (set(self.pending_guilds),
+                      set(self.pending_channels),
+                      set(self.pending_users))
+        guilds, channels, users = await self.find_stale(full, guild_id)
+        report.guilds = len(guilds)
+        report.channels = len(channels)
+        report.users = len(users) + sum(
+            len(queue) for key, queue in self.queues.channels.items()
+            if key[0] in guilds or key in channels
+        )
+        if dry_run:
+            return report
+
+        with self.queues.batch():
+            for guild_id, user_id in users:
+                channel_id = self.queues.users[guild_id, user_id].channel_id
+                self.queues.delete_user(guild_id, user_id)
+                self.stats.record('remove', guild_id, channel_id, user_id)
+            for key in [key for key in self.queues.channels
+                        if key[0] in guilds]:
+                self.drop_channel(*key)
+        for key in [key for key in self.dashboards.messages
+                    if key[0] in guilds or key in channels]:
+            await self.dashboards.remove(*key)
+        for guild_id, channel_id in channels:
+            await self.channels.delete(guild_id, channel_id)
+            self.drop_channel(guild_id, channel_id)
+        for guild_id in guilds:
+            await self.db.delete_guild(guild_id)
+            self.channels.invalidate(guild_id)
+
+        if everywhere:
+            # candidates that turned out not to be stale are done as well
+            guilds, channels, users = candidates
+        self.pending_guilds -= guilds
+        self.pending_channels -= channels
+        self.pending_users -= users
+        if everywhere and full:
+            report.pages = await self.db.maintain()
+        return report
+
+    async def run(self):
+        await self.bot.wait_until_ready()
+        last_full = None
+        while True:
+            full = (last_full is None or
+                    time.monotonic() - last_full >= self.full_interval)
+            try:
+                if (report := await self.sweep(full=full)):
+                    self.logger.info('Swept stale mentor rows: %s', report)
+            except Exception:
+                self.logger.exception('Failed to sweep stale mentor rows')
+            if full:
+                last_full = time.monotonic()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,63 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+from .database import current_timestamp
+
+
+class TimerHeap:
+    '''Calls `callback(key)` when the deadline of a key passes, for any
+    number of keys, from a single task sleeping until the earliest deadline.
+
+    Deadlines are timestamps in milliseconds, as returned by
+    current_timestamp, so they can be persisted and rescheduled after a
+    restart; deadlines already in the past fire right away. Timers are
+    never cancelled: the callback should check that its key still
+    applies.'''
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.logger = logging.getLogger(__name__)
+        self.heap = []
+        self.counter = itertools.count()
+        self.wakeup = asyncio.Event()
+        self.task = None
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, key, deadline: int):
+        if not self.heap or deadline < self.heap[0][0]:
+            self.wakeup.set()
+        heapq.heappush(self.heap, (deadline, next(self.counter), key))
+
+    def start(self, loop: asyncio.AbstractEventLoop, ready=None):
+        '''Starts firing timers, after awaiting `ready()` if it is given.'''
+        self.task = loop.create_task(self.run(ready))
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    async def run(self, ready=None):
+        if ready:
+            await ready()
+        while True:
+            now = current_timestamp()
+            while self.heap and self.heap[0][0] <= now:
+                _, _, key = heapq.heappop(self.heap)
+                # a slow callback must not delay the other timers
+                asyncio.ensure_future(self.fire(key))
+            timeout = (self.heap[0][0] - now) / 1000 if self.heap else None
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def fire(self, key):
+        try:
+            await self.callback(key)
+        except Exception:
+            self.logger.exception('Timer callback failed for %r', key)